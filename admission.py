@@ -0,0 +1,215 @@
+"""
+Admission control: per-class concurrency limits, bounded priority queues,
+request deadlines and a fast 503 when saturated.
+
+Every route belongs to a class (ROUTE_CLASSES, default "interactive"):
+
+    auth         credential checks; highest priority
+    interactive  everything else
+    bulk         exports, bulk upserts, full-text search, PDF reports; lowest priority
+
+A request runs when its class is under its limit and the worker is under
+ADMISSION_MAX_CONCURRENCY overall. Otherwise it waits in a queue ordered by
+class priority, then arrival; a full class queue, or a wait longer than the
+class allows, gets 503 with Retry-After rather than one more thread blocked on
+a slow database. The default interactive + bulk limits stay below the global
+limit, so credential checks always find a free slot. /metrics, /debug/*,
+/ready and the audit event streams bypass admission.
+
+Admitted requests carry a deadline (the `deadline` context variable, visible
+in the threadpool that sync handlers and streaming bodies run in); db.py turns
+what is left of it into a transaction-local statement_timeout when a
+connection is handed out, so a slow query is cancelled instead of holding the
+worker past the point where the client has given up.
+
+Env:
+    ADMISSION_ENABLED            0 to disable (default 1)
+    ADMISSION_MAX_CONCURRENCY    requests running at once in this worker (default 40,
+                                 the size of the threadpool sync handlers run in)
+    ADMISSION_<CLASS>_LIMIT      running requests of the class, e.g. ADMISSION_BULK_LIMIT
+    ADMISSION_<CLASS>_QUEUE      waiting requests of the class
+    ADMISSION_<CLASS>_WAIT       seconds a request may wait before it gets 503
+    ADMISSION_<CLASS>_DEADLINE   seconds of budget once admitted (statement_timeout)
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextvars import ContextVar
+
+import metrics
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "40"))
+
+# Absolute time.monotonic() by which the current request should be done
+deadline = ContextVar("deadline", default=None)
+
+
+class AdmissionClass:
+    def __init__(self, name, priority, limit, queue, wait, deadline):
+        env = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        self.priority = priority
+        self.limit = int(os.getenv(env + "LIMIT", limit))
+        self.queue = int(os.getenv(env + "QUEUE", queue))
+        self.wait = float(os.getenv(env + "WAIT", wait))
+        self.deadline = float(os.getenv(env + "DEADLINE", deadline))
+        self.running = 0
+        self.waiting = 0
+
+
+CLASSES = {c.name: c for c in (
+    AdmissionClass("auth", 0, limit=MAX_CONCURRENCY, queue=200, wait=1.0, deadline=2.0),
+    AdmissionClass("interactive", 1, limit=30, queue=60, wait=2.0, deadline=10.0),
+    AdmissionClass("bulk", 2, limit=4, queue=8, wait=5.0, deadline=60.0),
+)}
+
+ROUTE_CLASSES = {
+    "/auth/check": "auth",
+    "/auditees/precheck": "auth",
+    "/auditees/check": "auth",
+    "/auditees/bulk": "bulk",
+    "/questions/bulk": "bulk",
+    "/conversations/export": "bulk",
+    "/conversations/search": "bulk",
+    "/audits/{audit_id}/report.pdf": "bulk",
+}
+
+EXEMPT_PREFIXES = ("/metrics", "/debug/", "/ready")
+# Long-lived streams that do no database work: a slot would be held for hours
+EXEMPT_ROUTES = {"/audits/{audit_id}/events"}
+
+decisions = metrics.Counter(
+    "http_admission_total", "Admission decisions: admitted, queue_full, timeout", ("class", "result"))
+queue_wait = metrics.Histogram(
+    "http_admission_wait_seconds", "Time spent queued before admission or rejection", ("class",))
+running_requests = metrics.Gauge("http_admission_running", "Requests running, by class", ("class",))
+
+
+def remaining_ms():
+    """Milliseconds left before the current request's deadline, None outside a request."""
+    end = deadline.get()
+    if end is None:
+        return None
+    return max(1, int((end - time.monotonic()) * 1000))
+
+
+class Admission:
+    """Slot accounting for one worker; only touched from its event loop, so no locks."""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.running = 0
+        self._waiters = []          # heap of (priority, seq, class, future)
+        self._seq = itertools.count()
+
+    def _can_run(self, cls):
+        return self.running < self.max_concurrency and cls.running < cls.limit
+
+    def _start(self, cls):
+        self.running += 1
+        cls.running += 1
+        running_requests.set(cls.running, cls.name)
+
+    async def acquire(self, cls):
+        """None once admitted, else the reason for rejecting the request."""
+        # Waiters are woken as soon as a slot frees, so nobody eligible is
+        # queued at this point and a free slot can be taken directly.
+        if self._can_run(cls):
+            self._start(cls)
+            return None
+        if cls.waiting >= cls.queue:
+            return "queue_full"
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (cls.priority, next(self._seq), cls, future))
+        cls.waiting += 1
+        try:
+            await asyncio.wait_for(future, cls.wait)
+            return None
+        except asyncio.TimeoutError:
+            # _wake() may have granted the slot in the same loop iteration the
+            # timeout fired (3.12's wait_for still raises then): the slot is
+            # ours and counted, so run the request rather than leak it
+            if future.done() and not future.cancelled():
+                return None
+            return "timeout"
+        except asyncio.CancelledError:
+            # Client went away; give back a slot granted in the meantime
+            if future.done() and not future.cancelled():
+                self.release(cls)
+            raise
+        finally:
+            cls.waiting -= 1
+
+    def release(self, cls):
+        self.running -= 1
+        cls.running -= 1
+        running_requests.set(cls.running, cls.name)
+        self._wake()
+
+    def _wake(self):
+        skipped = []
+        while self._waiters and self.running < self.max_concurrency:
+            entry = heapq.heappop(self._waiters)
+            cls, future = entry[2], entry[3]
+            if future.done():           # timed out or cancelled
+                continue
+            if cls.running >= cls.limit:
+                skipped.append(entry)
+                continue
+            self._start(cls)
+            future.set_result(None)
+        for entry in skipped:
+            heapq.heappush(self._waiters, entry)
+
+
+def classify(scope):
+    """Admission class of the request, None if it bypasses admission."""
+    if scope["path"].startswith(EXEMPT_PREFIXES):
+        return None
+    route = metrics.route_template(scope)
+    if route in EXEMPT_ROUTES:
+        return None
+    return CLASSES[ROUTE_CLASSES.get(route, "interactive")]
+
+
+async def _busy(send, cls):
+    body = b'{"detail":"Server busy, retry later"}'
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(cls.wait))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.admission = Admission()
+
+    async def __call__(self, scope, receive, send):
+        cls = classify(scope) if scope["type"] == "http" else None
+        if cls is None:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        rejected = await self.admission.acquire(cls)
+        queue_wait.observe(time.perf_counter() - start, cls.name)
+        decisions.inc(1, cls.name, rejected or "admitted")
+        if rejected:
+            return await _busy(send, cls)
+
+        token = deadline.set(time.monotonic() + cls.deadline)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            deadline.reset(token)
+            self.admission.release(cls)
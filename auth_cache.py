@@ -0,0 +1,80 @@
+"""
+Cached credential lookups for /auth/check, /auditees/precheck and /auditees/check.
+
+access_codes rows are cached by name and auditee profiles by lower(email),
+including "not found" results (shorter TTL) so bursts of guesses do not reach
+Postgres. Writes in other workers evict entries through invalidation.py.
+Codes are never kept in clear: only an HMAC-SHA256 digest under a
+per-process random key, compared with hmac.compare_digest.
+
+Env:
+    AUTH_CACHE_TTL           seconds a found row is trusted (default 60)
+    AUTH_CACHE_NEGATIVE_TTL  seconds a "not found" is trusted (default 10)
+    AUTH_CACHE_SIZE          max entries per cache (default 10000)
+"""
+import hashlib
+import hmac
+import os
+import secrets
+
+import invalidation
+from cache import TTLCache
+
+TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+NEGATIVE_TTL = float(os.getenv("AUTH_CACHE_NEGATIVE_TTL", "10"))
+SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+_KEY = secrets.token_bytes(32)
+
+# name -> {"code_digest", "is_active", "expires_at"} | None
+access_codes = invalidation.register("access_codes", TTLCache(maxsize=SIZE, ttl=TTL))
+# lower(email) -> {"profile", "code_digest"} | None
+auditees = invalidation.register("auditees", TTLCache(maxsize=SIZE, ttl=TTL))
+
+
+def code_digest(code):
+    if code is None:
+        return None
+    return hmac.new(_KEY, code.encode("utf-8"), hashlib.sha256).digest()
+
+
+def code_matches(digest, code):
+    """Constant-time comparison of a stored digest with a submitted code."""
+    candidate = code_digest(code or "")
+    if digest is None:
+        hmac.compare_digest(candidate, candidate)  # same work on both paths
+        return False
+    return hmac.compare_digest(digest, candidate)
+
+
+def email_key(email):
+    return (email or "").strip().lower()
+
+
+def remember_access_code(name, row, generation=None):
+    """Cache an access_codes row (code, is_active, expires_at) or a miss (row=None)."""
+    if row is None:
+        access_codes.set(name, None, NEGATIVE_TTL, generation)
+        return None
+    code, is_active, expires_at = row
+    entry = {"code_digest": code_digest(code), "is_active": is_active, "expires_at": expires_at}
+    access_codes.set(name, entry, generation=generation)
+    return entry
+
+
+def remember_auditee(email, profile, code, generation=None):
+    """Cache an auditee profile dict (without its code) or a miss (profile=None)."""
+    if profile is None:
+        auditees.set(email_key(email), None, NEGATIVE_TTL, generation)
+        return None
+    entry = {"profile": profile, "code_digest": code_digest(code)}
+    auditees.set(email_key(email), entry, generation=generation)
+    return entry
+
+
+def invalidate_access_code(name):
+    access_codes.invalidate(name)
+
+
+def invalidate_auditee(email):
+    auditees.invalidate(email_key(email))
@@ -0,0 +1,160 @@
+"""
+Throwaway local Postgres for the benchmark suite.
+
+    python -m bench.pg start [--docker] [--port 55432]
+    python -m bench.pg reset      # (re)create ChatGPT_DB + Sales: schema*.sql, then migrations/
+    python -m bench.pg stop
+
+start runs either a postgres:16 container (--docker) or a temporary cluster
+made with initdb/pg_ctl (found on PATH or in PG_BIN), and prints the DB_*
+variables db.py reads. reset/stop use the state left in STATE_FILE.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parent.parent
+STATE_FILE = Path(tempfile.gettempdir()) / "db_ia_bench_pg.json"
+CONTAINER = "db_ia_bench"
+IMAGE = os.getenv("BENCH_PG_IMAGE", "postgres:16")
+DATABASES = {
+    "ChatGPT_DB": [ROOT / "bench" / "schema.sql", *sorted((ROOT / "migrations").glob("*.sql"))],
+    "Sales": [ROOT / "bench" / "schema_sales.sql"],
+}
+PSQL_OPTIONS = "-c client_min_messages=warning"
+SERVER_SETTINGS = ["-c", "max_connections=300", "-c", "listen_addresses=127.0.0.1"]
+
+
+def _bin(name):
+    pg_bin = os.getenv("PG_BIN")
+    path = os.path.join(pg_bin, name) if pg_bin else shutil.which(name)
+    if not path or not os.path.exists(path):
+        sys.exit(f"{name} not found: put the Postgres binaries on PATH, set PG_BIN, or use --docker")
+    return path
+
+
+def env(state):
+    return {
+        "DB_HOST": "127.0.0.1",
+        "DB_PORT": str(state["port"]),
+        "DB_USER": "postgres",
+        "DB_PASSWORD": "",
+        "DB_SSLMODE": "disable",
+        "DB_NAME": "ChatGPT_DB",
+        "DB_SALES_NAME": "Sales",
+    }
+
+
+def load_state():
+    if not STATE_FILE.exists():
+        sys.exit("no benchmark Postgres running (python -m bench.pg start)")
+    return json.loads(STATE_FILE.read_text())
+
+
+def connect(state, database="postgres"):
+    return psycopg2.connect(host="127.0.0.1", port=state["port"], user="postgres",
+                            password="", dbname=database, sslmode="disable")
+
+
+def _wait_ready(state, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            connect(state).close()
+            return
+        except psycopg2.OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+
+
+def start(port, docker):
+    if STATE_FILE.exists():
+        sys.exit(f"already running ({STATE_FILE}); stop it first")
+    if docker:
+        subprocess.run(["docker", "run", "-d", "--rm", "--name", CONTAINER,
+                        "-e", "POSTGRES_HOST_AUTH_METHOD=trust", "-p", f"127.0.0.1:{port}:5432",
+                        IMAGE, "-c", "max_connections=300"], check=True, stdout=subprocess.DEVNULL)
+        state = {"mode": "docker", "port": port}
+    else:
+        datadir = tempfile.mkdtemp(prefix="db_ia_bench_")
+        subprocess.run([_bin("initdb"), "-D", datadir, "-U", "postgres", "-A", "trust",
+                        "-E", "UTF8", "--no-locale"], check=True, stdout=subprocess.DEVNULL)
+        options = " ".join(SERVER_SETTINGS + ["-p", str(port), "-k", datadir])
+        subprocess.run([_bin("pg_ctl"), "-D", datadir, "-o", options, "-l", os.path.join(datadir, "log"),
+                        "-w", "start"], check=True, stdout=subprocess.DEVNULL)
+        state = {"mode": "initdb", "port": port, "datadir": datadir}
+    STATE_FILE.write_text(json.dumps(state))
+    _wait_ready(state)
+    return state
+
+
+def stop():
+    state = load_state()
+    if state["mode"] == "docker":
+        subprocess.run(["docker", "stop", CONTAINER], check=False, stdout=subprocess.DEVNULL)
+    else:
+        subprocess.run([_bin("pg_ctl"), "-D", state["datadir"], "-m", "fast", "stop"],
+                       check=False, stdout=subprocess.DEVNULL)
+        shutil.rmtree(state["datadir"], ignore_errors=True)
+    STATE_FILE.unlink()
+
+
+def _psql(state, database, sql_file):
+    # psql rather than psycopg2: migrations use CONCURRENTLY and $$ bodies
+    if state["mode"] == "docker":
+        cmd = ["docker", "exec", "-i", "-e", f"PGOPTIONS={PSQL_OPTIONS}", CONTAINER, "psql", "-U", "postgres"]
+    else:
+        cmd = [_bin("psql"), "-h", "127.0.0.1", "-p", str(state["port"]), "-U", "postgres"]
+    with open(sql_file, "rb") as f:
+        subprocess.run(cmd + ["-d", database, "-q", "-v", "ON_ERROR_STOP=1"], stdin=f, check=True,
+                       stdout=subprocess.DEVNULL, env=dict(os.environ, PGOPTIONS=PSQL_OPTIONS))
+
+
+def reset(state):
+    conn = connect(state)
+    conn.autocommit = True
+    cur = conn.cursor()
+    for database in DATABASES:
+        cur.execute(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)')
+        cur.execute(f"""CREATE DATABASE "{database}" ENCODING 'UTF8' TEMPLATE template0""")
+    conn.close()
+    for database, files in DATABASES.items():
+        for sql_file in files:
+            _psql(state, database, sql_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_start = sub.add_parser("start")
+    p_start.add_argument("--port", type=int, default=55432)
+    p_start.add_argument("--docker", action="store_true")
+    sub.add_parser("reset")
+    sub.add_parser("stop")
+    sub.add_parser("env")
+    args = parser.parse_args()
+
+    if args.cmd == "start":
+        state = start(args.port, args.docker)
+        reset(state)
+    elif args.cmd == "reset":
+        state = load_state()
+        reset(state)
+    elif args.cmd == "stop":
+        stop()
+        return
+    state = load_state()
+    print("\n".join(f"export {k}={v!r}" if v else f"export {k}=" for k, v in env(state).items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,491 @@
+"""
+Load benchmark: drives every route of main.py with concurrent clients.
+
+    python -m bench.pg start [--docker] && eval "$(python -m bench.pg env)"
+    python -m bench.seed --scale 1
+    python -m bench.run --concurrency 8 --duration 10 --out bench-$(git rev-parse --short HEAD).json
+    python -m bench.run ... --baseline bench-<older>.json   # compare, exit 1 on regression
+
+The API is started with uvicorn (one worker, so /metrics sees every request)
+in a scratch working directory, against the DB_* database; --url targets an
+already running server instead. Each route runs alone for --duration seconds
+after --warmup seconds, so per-route numbers do not interfere. Per route the
+JSON output has request/error counts, throughput, client-side latency
+percentiles and, from /metrics deltas, SQL statements and rows per request
+and the share of server time spent in the database. "startup" has the time to
+import main, from spawn to a 200 on /ready, and of the first API request.
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import requests
+
+import db
+from bench.seed import EVIDENCE_FILE, QUESTIONNAIRE
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 1x1 PNG
+PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+ATTACHMENT_B64 = base64.b64encode(random.Random(0).randbytes(48 * 1024)).decode("ascii")
+
+
+# ----------------------
+# Scenarios
+# ----------------------
+class Scenario:
+    def __init__(self, name, method, route, build, expect=(200,)):
+        self.name = name
+        self.method = method
+        self.route = route  # path template, as labelled in /metrics
+        self.build = build  # (rng, ctx) -> (path, requests kwargs)
+        self.expect = expect
+
+
+def _auditee(rng, ctx):
+    return rng.choice(ctx["auditees"])
+
+
+def _profile(a, **extra):
+    return {"first_name": a["first_name"], "email": a["email"], "plant_name": a["plant_name"], **extra}
+
+
+def _transcript(rng, ctx, words=600):
+    return "\n".join(
+        f"{rng.choice(('user', 'assistant'))}: " + " ".join(rng.choice(ctx["words"]) for _ in range(30))
+        for _ in range(words // 30)
+    )
+
+
+SCENARIOS = [
+    Scenario("auth_check", "POST", "/auth/check", lambda rng, ctx: (
+        "/auth/check", {"json": {"name": f"bench-{rng.randrange(10)}", "code": f"code-{rng.randrange(12)}"}})),
+    Scenario("auditee_precheck", "POST", "/auditees/precheck", lambda rng, ctx: (
+        "/auditees/precheck", {"json": {k: v for k, v in _auditee(rng, ctx).items() if k in ("first_name", "email")}})),
+    Scenario("auditee_check", "GET", "/auditees/check", lambda rng, ctx: (
+        "/auditees/check", {"params": {k: v for k, v in _auditee(rng, ctx).items()
+                                       if k in ("first_name", "email", "code")}})),
+    Scenario("auditee_upsert", "POST", "/auditees", lambda rng, ctx: (
+        "/auditees", {"json": _profile(_auditee(rng, ctx), dept_name=f"Dept {rng.randrange(5)}")})),
+    Scenario("auditees_bulk", "POST", "/auditees/bulk", lambda rng, ctx: (
+        "/auditees/bulk", {"json": {"auditees": [
+            _profile(a) for a in rng.sample(ctx["auditees"], min(50, len(ctx["auditees"])))]}})),
+    Scenario("questions_bulk", "POST", "/questions/bulk", lambda rng, ctx: (
+        "/questions/bulk", {"json": {"version_tag": f"bench-load-{rng.randrange(100)}", "questions": [
+            {"text": f"Question {i}: " + " ".join(rng.sample(ctx["words"], 8)), "category": "Bench"}
+            for i in range(30)]}})),
+    Scenario("audit_start", "POST", "/audits/start", lambda rng, ctx: (
+        "/audits/start", {"json": {"auditee_id": _auditee(rng, ctx)["id"], "type": "internal",
+                                   "questionnaire_version": QUESTIONNAIRE, "external_id": str(uuid.uuid4())}})),
+    Scenario("answer_save", "POST", "/audits/{audit_id}/answers", lambda rng, ctx: (
+        f"/audits/{rng.choice(ctx['open_audits'])}/answers", {
+            "data": {"question_id": rng.choice(ctx["questions"]), "response_text": "ok",
+                     "is_compliant": str(rng.random() < 0.8).lower(), "attempt_number": "1"},
+            "files": {"evidence_image": ("e.png", PNG, "image/png")} if rng.random() < 0.1 else None})),
+    # answer_save may have replaced some seeded evidence: 404 is not an error here
+    Scenario("evidence", "GET", "/audits/answers/{answer_id}/evidence", lambda rng, ctx: (
+        f"/audits/answers/{rng.choice(ctx['evidence_answers'])}/evidence", {}), expect=(200, 404)),
+    Scenario("answers_list", "GET", "/audits/{audit_id}/answers", lambda rng, ctx: (
+        f"/audits/{rng.choice(ctx['audits'])}/answers", {})),
+    Scenario("nc_save", "POST", "/audits/{audit_id}/nonconformities", lambda rng, ctx: (
+        f"/audits/{rng.choice(ctx['open_audits'])}/nonconformities", {"json": {
+            "question_id": rng.choice(ctx["questions"]), "description": "bench finding", "severity": "minor"}})),
+    Scenario("audit_complete", "POST", "/audits/{audit_id}/complete", lambda rng, ctx: (
+        f"/audits/{rng.choice(ctx['audits'])}/complete", {"json": {"score_global": round(rng.uniform(50, 100), 2)}})),
+    Scenario("action_plan", "POST", "/action-plan", lambda rng, ctx: (
+        "/action-plan", {"json": {"title": "Bench plan", "owner": "bench", "deadline": "2030-01-01",
+                                  "nc_id": rng.choice(ctx["ncs"]),
+                                  "steps": [{"description": f"step {i}", "due_date": "2030-01-01"}
+                                            for i in range(3)]}})),
+    Scenario("action_plan_link", "PUT", "/action-plan/{action_plan_id}/nonconformity", lambda rng, ctx: (
+        f"/action-plan/{rng.choice(ctx['action_plans'])}/nonconformity", {"json": {"nc_id": rng.choice(ctx["ncs"])}})),
+    Scenario("action_plan_file", "POST", "/action-plan/files", lambda rng, ctx: (
+        "/action-plan/files", {"json": {"action_plan_id": rng.choice(ctx["action_plans"]), "filename": "b.bin",
+                                        "filetype": "application/octet-stream", "content": ATTACHMENT_B64}})),
+    Scenario("objections", "GET", "/objections", lambda rng, ctx: (
+        "/objections", {"params": {"category": rng.choice(("Price", "Lead Time", "MOQ"))}
+                        if rng.random() < 0.5 else {}})),
+    # Not implemented server-side: measured for completeness, 500 is expected
+    Scenario("matrix", "GET", "/matrix", lambda rng, ctx: ("/matrix", {}), expect=(500,)),
+    Scenario("audits_by_name", "GET", "/auditees/audits-by-name", lambda rng, ctx: (
+        "/auditees/audits-by-name", {"params": {"name": _auditee(rng, ctx)["first_name"]}}), expect=(200, 404)),
+    Scenario("report_request", "POST", "/audits/{audit_id}/report", lambda rng, ctx: (
+        f"/audits/{rng.choice(ctx['report_audits'])}/report", {}), expect=(200, 202)),
+    # 404 once other scenarios changed the audit: a newer version replaced that PDF
+    Scenario("report_status", "GET", "/reports/{report_id}", lambda rng, ctx: (
+        f"/reports/{rng.choice(ctx['reports'])}", {}), expect=(200, 404)),
+    Scenario("report_pdf", "GET", "/audits/{audit_id}/report.pdf", lambda rng, ctx: (
+        f"/audits/{rng.choice(ctx['report_audits'])}/report.pdf", {}), expect=(200, 202)),
+    Scenario("sync_changes", "GET", "/sync/changes", lambda rng, ctx: (
+        "/sync/changes", {"params": {"since": rng.choice(ctx["sync_cursors"]), "limit": 500}})),
+    Scenario("jobs_stats", "GET", "/jobs/stats", lambda rng, ctx: ("/jobs/stats", {})),
+    Scenario("conversation_save", "POST", "/save-conversation", lambda rng, ctx: (
+        "/save-conversation", {"json": {"user_name": rng.choice(ctx["pairs"])[0], "assistant_name": "bench",
+                                        "conversation": _transcript(rng, ctx, rng.choice((60, 600, 3000)))}})),
+    Scenario("conversation_ticket", "GET", "/save-conversation/{ticket}", lambda rng, ctx: (
+        f"/save-conversation/{uuid.uuid4()}", {}), expect=(200, 404)),
+    Scenario("conversations_list", "GET", "/conversations", lambda rng, ctx: (
+        "/conversations", {"params": {"limit": 50, "offset": rng.choice((0, 0, 50, 500))}})),
+    Scenario("conversations_search", "GET", "/conversations/search", lambda rng, ctx: (
+        "/conversations/search", {"params": {"q": rng.choice(ctx["words"])}})),
+    Scenario("conversations_export", "GET", "/conversations/export", lambda rng, ctx: (
+        "/conversations/export", {"params": _day_range(rng, ctx, 2)})),
+    Scenario("conversations_stats", "GET", "/conversations/stats", lambda rng, ctx: (
+        "/conversations/stats", {"params": dict(_day_range(rng, ctx, rng.choice((7, 30, 90))),
+                                                **rng.choice(({}, {"assistant_name": rng.choice(ctx["pairs"])[1]})))})),
+    Scenario("conversation_get", "GET", "/conversations/{id}", lambda rng, ctx: (
+        f"/conversations/{rng.choice(ctx['conversations'])}", {"headers": {"Accept-Encoding": "gzip"}})),
+    Scenario("conversations_user", "GET", "/conversations/user/{user_name}", lambda rng, ctx: (
+        f"/conversations/user/{rng.choice(ctx['pairs'])[0]}", {})),
+    Scenario("conversations_user_assistant", "GET", "/conversations/user/{user_name}/assistant/{assistant_name}",
+             lambda rng, ctx: ("/conversations/user/{}/assistant/{}".format(*rng.choice(ctx["pairs"])), {})),
+    Scenario("metrics", "GET", "/metrics", lambda rng, ctx: ("/metrics", {})),
+]
+
+
+def _day_range(rng, ctx, days):
+    start = ctx["first_day"] + timedelta(days=rng.randrange(max(1, (ctx["last_day"] - ctx["first_day"]).days)))
+    return {"date_from": start.isoformat(), "date_to": (start + timedelta(days=days - 1)).isoformat()}
+
+
+# ----------------------
+# Fixtures
+# ----------------------
+def load_context(base_url):
+    conn = db.get_connection()
+    cur = conn.cursor()
+
+    def column(sql):
+        cur.execute(sql)
+        return [r[0] for r in cur.fetchall()]
+
+    cur.execute("""SELECT id, first_name, email, code, plant_name FROM auditees
+                   WHERE email LIKE 'bench%%' ORDER BY id LIMIT 2000""")
+    ctx = {
+        "auditees": [dict(zip(("id", "first_name", "email", "code", "plant_name"), r)) for r in cur.fetchall()],
+        "questions": column(f"SELECT question_id FROM questions WHERE version_tag = '{QUESTIONNAIRE}'"),
+        "audits": column("SELECT id FROM audits ORDER BY random() LIMIT 2000"),
+        "open_audits": column("SELECT id FROM audits WHERE status = 'in_progress' ORDER BY random() LIMIT 2000"),
+        "evidence_answers": column(f"""SELECT answer_id FROM answers
+                                       WHERE evidence_filename = '{EVIDENCE_FILE}' LIMIT 2000"""),
+        "ncs": column("SELECT nc_id FROM non_conformities ORDER BY random() LIMIT 2000"),
+        "conversations": column("SELECT id FROM conversations ORDER BY random() LIMIT 5000"),
+        "words": column("""SELECT DISTINCT w FROM (
+                               SELECT unnest(tsvector_to_array(search_vector)) AS w
+                               FROM conversations WHERE search_vector IS NOT NULL LIMIT 200) s
+                           WHERE length(w) > 4 LIMIT 1000"""),
+    }
+    # Cursors at recent answers' transactions, like clients that synced a little while ago
+    ctx["sync_cursors"] = column("""SELECT change_xid::text FROM answers
+                                    ORDER BY change_xid DESC, answer_id DESC LIMIT 100 OFFSET 300""")
+    cur.execute("SELECT DISTINCT user_name, assistant_name FROM conversations LIMIT 2000")
+    ctx["pairs"] = cur.fetchall()
+    cur.execute("SELECT min(date_conversation)::date, max(date_conversation)::date FROM conversations")
+    ctx["first_day"], ctx["last_day"] = cur.fetchone()
+    cur.close()
+    conn.close()
+    if not ctx["auditees"] or not ctx["conversations"]:
+        sys.exit("database is not seeded (python -m bench.seed)")
+
+    # Objects the read scenarios need that only exist through the API
+    session = requests.Session()
+    ctx["action_plans"] = []
+    for nc_id in ctx["ncs"][:20]:
+        r = session.post(f"{base_url}/action-plan", json={
+            "title": "Bench plan", "owner": "bench", "deadline": "2030-01-01", "nc_id": nc_id,
+            "steps": [{"description": "step", "due_date": "2030-01-01"}]})
+        r.raise_for_status()
+        ctx["action_plans"].append(r.json()["action_plan_id"])
+    ctx["report_audits"] = ctx["audits"][:10]
+    ctx["reports"] = []
+    for audit_id in ctx["report_audits"]:
+        r = session.post(f"{base_url}/audits/{audit_id}/report")
+        r.raise_for_status()
+        ctx["reports"].append(r.json()["report_id"])
+    return ctx
+
+
+# ----------------------
+# Server
+# ----------------------
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _server_env(workdir):
+    return dict(os.environ, METRICS_ENABLED="1", REPORT_DIR=str(workdir / "reports"),
+                CONVERSATION_JOURNAL_DIR=str(workdir / "journal"))
+
+
+def measure_import(workdir, repeat=3):
+    """Median seconds for a fresh interpreter to import main (module load + app construction)."""
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=dict(_server_env(workdir), PYTHONPATH=str(ROOT)),
+                             capture_output=True, text=True, check=True).stdout
+        times.append(float(out.split()[-1]))
+    return sorted(times)[len(times) // 2]
+
+
+def start_server(workdir):
+    """(process, base_url, seconds from spawn until the server answers its readiness probe)."""
+    (workdir / "uploads").mkdir(parents=True, exist_ok=True)
+    (workdir / "uploads" / EVIDENCE_FILE).write_bytes(PNG)
+    port = _free_port()
+    spawned = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(ROOT),
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=_server_env(workdir),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    probe = "/ready"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            status = requests.get(f"{base_url}{probe}", timeout=1).status_code
+            if status == 404 and probe == "/ready":
+                probe = "/metrics"   # tree without a readiness probe
+                continue
+            if status == 200:
+                return proc, base_url, time.perf_counter() - spawned
+        except requests.ConnectionError:
+            pass
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            sys.exit("API server did not start")
+        time.sleep(0.02)
+
+
+def first_response(base_url):
+    """Milliseconds for the first API request of a fresh worker (credential check: pool + lookup)."""
+    start = time.perf_counter()
+    requests.post(f"{base_url}/auth/check", json={"name": "bench-0", "code": "code-0"}, timeout=30)
+    return (time.perf_counter() - start) * 1000
+
+
+# ----------------------
+# Measurement
+# ----------------------
+_SAMPLE_RE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def scrape(base_url):
+    """/metrics as {(name, route): value}, summed over the other labels."""
+    out = defaultdict(float)
+    for line in requests.get(f"{base_url}/metrics", timeout=10).text.splitlines():
+        m = _SAMPLE_RE.match(line)
+        if not m:
+            continue
+        name, labels, value = m.groups()
+        labels = dict(_LABEL_RE.findall(labels or ""))
+        route = labels.get("route") or labels.get("handler")
+        if route and "le" not in labels:
+            out[(name, route)] += float(value)
+    return out
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def drive(scenario, base_url, ctx, concurrency, duration, seed):
+    latencies, statuses = [], Counter()
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(worker):
+        rng = random.Random(seed * 1000 + worker)
+        session = requests.Session()
+        local_lat, local_status = [], Counter()
+        while time.monotonic() < deadline:
+            path, kwargs = scenario.build(rng, ctx)
+            start = time.perf_counter()
+            try:
+                r = session.request(scenario.method, base_url + path, timeout=120, **kwargs)
+                _ = r.content
+                status = r.status_code
+            except requests.RequestException:
+                status = "error"
+            local_lat.append(time.perf_counter() - start)
+            local_status[status] += 1
+        with lock:
+            latencies.extend(local_lat)
+            statuses.update(local_status)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sorted(latencies), statuses, time.perf_counter() - started
+
+
+def run_scenario(scenario, base_url, ctx, args):
+    if args.warmup > 0:
+        drive(scenario, base_url, ctx, args.concurrency, args.warmup, args.seed + 1)
+    before = scrape(base_url)
+    latencies, statuses, elapsed = drive(scenario, base_url, ctx, args.concurrency, args.duration, args.seed)
+    after = scrape(base_url)
+
+    def delta(name):
+        return after.get((name, scenario.route), 0.0) - before.get((name, scenario.route), 0.0)
+
+    served = delta("http_request_duration_seconds_count")
+    server_seconds = delta("http_request_duration_seconds_sum")
+    errors = sum(n for s, n in statuses.items() if s not in scenario.expect)
+    ms = [v * 1000.0 for v in latencies]
+    return {
+        "route": f"{scenario.method} {scenario.route}",
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": _round(percentile(ms, 50)),
+            "p95": _round(percentile(ms, 95)),
+            "p99": _round(percentile(ms, 99)),
+            "mean": _round(sum(ms) / len(ms)) if ms else None,
+            "max": _round(ms[-1]) if ms else None,
+        },
+        "server": {
+            "requests": int(served),
+            "queries_per_request": _round(delta("db_query_duration_seconds_count") / served) if served else None,
+            "rows_per_request": _round(delta("db_rows_total") / served) if served else None,
+            "db_time_share": _round(delta("http_request_db_seconds_sum") / server_seconds, 3)
+            if server_seconds else None,
+        },
+    }
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ----------------------
+# Baseline comparison
+# ----------------------
+def compare(result, baseline, threshold):
+    """Print p95/throughput changes per route; returns the routes that regressed."""
+    regressed = []
+    old_startup, cur_startup = baseline.get("startup") or {}, result.get("startup") or {}
+    for key in ("import_s", "ready_s", "first_response_ms"):
+        if old_startup.get(key) is not None and cur_startup.get(key) is not None:
+            print(f"{'startup ' + key:32} {old_startup[key]:>7} -> {cur_startup[key]}")
+    print(f"{'route':32} {'p95 ms':>18} {'rps':>18}")
+    for name, cur in result["routes"].items():
+        old = baseline.get("routes", {}).get(name)
+        if not old or not cur["latency_ms"]["p95"] or not old["latency_ms"]["p95"]:
+            continue
+        p95 = cur["latency_ms"]["p95"] / old["latency_ms"]["p95"] - 1.0
+        rps = cur["throughput_rps"] / old["throughput_rps"] - 1.0 if old["throughput_rps"] else 0.0
+        flag = ""
+        if p95 > threshold or rps < -threshold:
+            regressed.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:32} {old['latency_ms']['p95']:>7} -> {cur['latency_ms']['p95']:<7} "
+              f"{old['throughput_rps']:>7} -> {cur['throughput_rps']:<7}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per route")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of unmeasured load per route")
+    parser.add_argument("--routes", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--url", help="use a running server instead of starting one")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON result here (default: stdout)")
+    parser.add_argument("--baseline", help="earlier JSON result to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as regression")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.routes:
+        wanted = set(args.routes.split(","))
+        unknown = wanted - {s.name for s in SCENARIOS}
+        if unknown:
+            sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        scenarios = [s for s in SCENARIOS if s.name in wanted]
+
+    proc, workdir = None, None
+    startup = {}
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        workdir = Path(tempfile.mkdtemp(prefix="db_ia_bench_api_"))
+        startup["import_s"] = _round(measure_import(workdir), 3)
+        proc, base_url, ready = start_server(workdir)
+        startup["ready_s"] = _round(ready, 3)
+        startup["first_response_ms"] = _round(first_response(base_url))
+        print(f"{'startup':32} import {startup['import_s']} s  ready {startup['ready_s']} s  "
+              f"first response {startup['first_response_ms']} ms", file=sys.stderr)
+    try:
+        ctx = load_context(base_url)
+        result = {
+            "commit": _git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "config": {"concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+                       "seed": args.seed, "python": sys.version.split()[0]},
+            "startup": startup,
+            "routes": {},
+        }
+        for scenario in scenarios:
+            result["routes"][scenario.name] = run_scenario(scenario, base_url, ctx, args)
+            r = result["routes"][scenario.name]
+            print(f"{scenario.name:32} {r['throughput_rps']:>9} rps  p50 {r['latency_ms']['p50']} ms  "
+                  f"p99 {r['latency_ms']['p99']} ms  errors {r['errors']}", file=sys.stderr)
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(10)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+    else:
+        print(text)
+    if args.baseline:
+        regressed = compare(result, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+-- ---------------------------------------------------------------
+-- Base schema of ChatGPT_DB as the API expects it, before migrations/.
+-- Used by the benchmark suite (bench/pg.py reset) to build a local copy;
+-- production tables predate the repo and are not created from this file.
+-- ---------------------------------------------------------------
+
+CREATE TABLE access_codes (
+    name        text PRIMARY KEY,
+    code        text NOT NULL,
+    is_active   boolean NOT NULL DEFAULT true,
+    expires_at  timestamptz
+);
+
+CREATE TABLE auditees (
+    id             serial PRIMARY KEY,
+    first_name     text NOT NULL,
+    email          text NOT NULL,
+    "function"     text,
+    plant_name     text,
+    dept_name      text,
+    manager_email  text,
+    code           text
+);
+
+CREATE TABLE audits (
+    id                     serial PRIMARY KEY,
+    auditee_id             int REFERENCES auditees(id),
+    type                   text NOT NULL,
+    status                 text NOT NULL DEFAULT 'in_progress',
+    started_at             timestamptz DEFAULT now(),
+    ended_at               timestamptz,
+    score_global           numeric(5,2),
+    questionnaire_version  text,
+    external_id            text
+);
+
+CREATE TABLE questions (
+    question_id  serial PRIMARY KEY,
+    text         text NOT NULL,
+    category     text,
+    mandatory    boolean DEFAULT true,
+    source_doc   text,
+    version_tag  text,
+    created_at   timestamptz DEFAULT now()
+);
+
+CREATE TABLE answers (
+    answer_id          serial PRIMARY KEY,
+    audit_id           int REFERENCES audits(id),
+    question_id        int REFERENCES questions(question_id),
+    response_text      text,
+    is_compliant       boolean,
+    attempt_number     int NOT NULL DEFAULT 1,
+    evidence_filename  text,
+    created_at         timestamptz DEFAULT now(),
+    UNIQUE (audit_id, question_id, attempt_number)
+);
+
+CREATE TABLE non_conformities (
+    nc_id            serial PRIMARY KEY,
+    audit_id         int REFERENCES audits(id),
+    question_id      int REFERENCES questions(question_id),
+    description      text,
+    severity         text,
+    status           text,
+    responsible_id   int,
+    due_date         date,
+    evidence_url     text,
+    closed_at        timestamptz,
+    closure_comment  text,
+    detected_at      timestamptz DEFAULT now()
+);
+
+CREATE TABLE conversations (
+    id                 serial PRIMARY KEY,
+    user_name          text NOT NULL,
+    conversation       text NOT NULL,
+    date_conversation  timestamptz NOT NULL DEFAULT now(),
+    assistant_name     text
+);
@@ -0,0 +1,11 @@
+-- ---------------------------------------------------------------
+-- Base schema of the Sales database (GET /objections), for bench/pg.py reset.
+-- ---------------------------------------------------------------
+
+CREATE TABLE customer_objection_handling (
+    id                         serial PRIMARY KEY,
+    customer_concern           text NOT NULL,
+    example_customer_argument  text NOT NULL,
+    recommended_response       text NOT NULL,
+    category                   text
+);
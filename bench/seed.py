@@ -0,0 +1,197 @@
+"""
+Synthetic data for the benchmark suite, deterministic for a given --scale/--seed.
+
+    python -m bench.seed --scale 1
+
+Scale 1 is 200 auditees (3 audits each, 20 answers per audit), 60 questions,
+50 objections and 5000 conversations over the last 180 days. Connects with the
+DB_* variables db.py reads (see python -m bench.pg env).
+"""
+import argparse
+import random
+import string
+from datetime import date, datetime, timedelta, timezone
+
+import psycopg2.extras
+
+import db
+import rollups
+from compression import encode_conversation
+
+QUESTIONNAIRE = "bench-v1"
+ACCESS_CODES = 10
+QUESTIONS = 60
+OBJECTIONS = 50
+AUDITEES_PER_SCALE = 200
+AUDITS_PER_AUDITEE = 3
+ANSWERS_PER_AUDIT = 20
+CONVERSATIONS_PER_SCALE = 5000
+USERS_PER_SCALE = 100
+ASSISTANTS = ["sales-coach", "quality-bot", "hr-helper", "supply-planner",
+              "audit-assistant", "it-support", "pricing", "onboarding"]
+FIRST_NAMES = ["Amina", "Bruno", "Chen", "Dalia", "Emre", "Fatou", "Gianni", "Hana",
+               "Ivan", "Jules", "Karim", "Lea", "Marta", "Nabil", "Olga", "Pedro"]
+CATEGORIES = ["Safety", "Quality", "5S", "Maintenance", "Logistics", "Environment"]
+OBJECTION_CATEGORIES = ["Price", "Lead Time", "MOQ", "Quality", "Payment terms"]
+EVIDENCE_FILE = "bench-evidence.png"
+
+
+def _words(rng, vocabulary, n):
+    return " ".join(rng.choice(vocabulary) for _ in range(n))
+
+
+def _vocabulary(rng, size=3000):
+    return ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+            for _ in range(size)]
+
+
+def _transcript(rng, vocabulary):
+    # Mostly short chats, a long tail of long ones (log-normal word count)
+    turns = []
+    words = int(min(rng.lognormvariate(5.5, 1.0), 8000))
+    while words > 0:
+        n = min(words, rng.randint(10, 80))
+        turns.append(f"{rng.choice(('user', 'assistant'))}: {_words(rng, vocabulary, n)}")
+        words -= n
+    return "\n".join(turns)
+
+
+def seed(scale=1.0, seed_value=42):
+    rng = random.Random(seed_value)
+    vocabulary = _vocabulary(rng)
+    now = datetime.now(timezone.utc)
+    counts = {}
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+
+    psycopg2.extras.execute_values(cur, "INSERT INTO access_codes (name, code, is_active) VALUES %s", [
+        (f"bench-{i}", f"code-{i}", True) for i in range(ACCESS_CODES)
+    ])
+    counts["access_codes"] = ACCESS_CODES
+
+    question_ids = [r[0] for r in psycopg2.extras.execute_values(cur, """
+        INSERT INTO questions (text, category, mandatory, source_doc, version_tag)
+        VALUES %s RETURNING question_id
+    """, [
+        (f"Q{i}: {_words(rng, vocabulary, 12)}?", rng.choice(CATEGORIES), rng.random() < 0.8,
+         "bench", QUESTIONNAIRE)
+        for i in range(QUESTIONS)
+    ], fetch=True)]
+    counts["questions"] = len(question_ids)
+
+    n_auditees = max(1, int(AUDITEES_PER_SCALE * scale))
+    auditee_ids = [r[0] for r in psycopg2.extras.execute_values(cur, """
+        INSERT INTO auditees (first_name, email, "function", plant_name, dept_name, manager_email, code)
+        VALUES %s RETURNING id
+    """, [
+        (f"{rng.choice(FIRST_NAMES)} {i}", f"bench{i}@example.com", "Operator",
+         f"Plant {i % 7}", f"Dept {i % 5}", f"manager{i % 20}@example.com", f"c{i}")
+        for i in range(n_auditees)
+    ], page_size=1000, fetch=True)]
+    counts["auditees"] = len(auditee_ids)
+
+    audit_rows = []
+    for auditee_id in auditee_ids:
+        for _ in range(AUDITS_PER_AUDITEE):
+            started = now - timedelta(days=rng.randint(1, 365), minutes=rng.randint(0, 1440))
+            completed = rng.random() < 0.7
+            audit_rows.append((
+                auditee_id, rng.choice(("internal", "external", "follow-up")),
+                "completed" if completed else "in_progress", started,
+                started + timedelta(hours=2) if completed else None,
+                round(rng.uniform(40, 100), 2) if completed else None, QUESTIONNAIRE,
+            ))
+    audit_ids = [r[0] for r in psycopg2.extras.execute_values(cur, """
+        INSERT INTO audits (auditee_id, type, status, started_at, ended_at, score_global, questionnaire_version)
+        VALUES %s RETURNING id
+    """, audit_rows, page_size=1000, fetch=True)]
+    counts["audits"] = len(audit_ids)
+
+    answer_rows, nc_rows = [], []
+    for audit_id in audit_ids:
+        for question_id in rng.sample(question_ids, min(ANSWERS_PER_AUDIT, len(question_ids))):
+            compliant = rng.random() < 0.85
+            answer_rows.append((
+                audit_id, question_id, _words(rng, vocabulary, rng.randint(3, 40)), compliant, 1,
+                EVIDENCE_FILE if rng.random() < 0.05 else None,
+            ))
+            if not compliant:
+                nc_rows.append((
+                    audit_id, question_id, _words(rng, vocabulary, 15), rng.choice(("minor", "major", "critical")),
+                    rng.choice(("open", "in_progress", "closed")), date.today() + timedelta(days=rng.randint(1, 90)),
+                ))
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO answers (audit_id, question_id, response_text, is_compliant, attempt_number, evidence_filename)
+        VALUES %s
+    """, answer_rows, page_size=2000)
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO non_conformities (audit_id, question_id, description, severity, status, due_date)
+        VALUES %s
+    """, nc_rows, page_size=2000)
+    counts["answers"] = len(answer_rows)
+    counts["non_conformities"] = len(nc_rows)
+
+    # Partitions first: rows must not land in the default partition
+    cur.execute("""
+        SELECT conversations_ensure_partition(m::date)
+        FROM generate_series(date_trunc('month', now() - interval '190 days'),
+                             date_trunc('month', now()), interval '1 month') AS m
+    """)
+    users = [f"bench.user{i}" for i in range(max(1, int(USERS_PER_SCALE * scale)))]
+    n_conversations = max(1, int(CONVERSATIONS_PER_SCALE * scale))
+    batch = []
+    for i in range(n_conversations):
+        text = _transcript(rng, vocabulary)
+        conv_text, conv_zstd = encode_conversation(text)
+        batch.append((
+            rng.choice(users), conv_text, conv_zstd, text if conv_zstd is not None else None,
+            now - timedelta(seconds=rng.randint(0, 180 * 86400)), rng.choice(ASSISTANTS),
+        ))
+        if len(batch) == 500 or i == n_conversations - 1:
+            psycopg2.extras.execute_values(cur, """
+                INSERT INTO conversations (user_name, conversation, conversation_zstd, search_vector,
+                                           date_conversation, assistant_name)
+                VALUES %s
+            """, batch, template="(%s, %s, %s, to_tsvector('simple', %s), %s, %s)", page_size=500)
+            batch = []
+    counts["conversations"] = n_conversations
+    counts["users"] = len(users)
+
+    cur.execute("ANALYZE")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    sales = db.get_connection_sales()
+    cur = sales.cursor()
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO customer_objection_handling
+            (customer_concern, example_customer_argument, recommended_response, category)
+        VALUES %s
+    """, [
+        (_words(rng, vocabulary, 4), _words(rng, vocabulary, 20), _words(rng, vocabulary, 40),
+         rng.choice(OBJECTION_CATEGORIES))
+        for _ in range(OBJECTIONS)
+    ])
+    sales.commit()
+    cur.close()
+    sales.close()
+    counts["objections"] = OBJECTIONS
+
+    # Conversations were inserted directly: build their daily rollups
+    counts["rollup_days"] = sum(1 for _ in rollups.backfill())
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    for table, n in seed(args.scale, args.seed).items():
+        print(f"{table}: {n}")
+
+
+if __name__ == "__main__":
+    main()
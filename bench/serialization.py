@@ -0,0 +1,93 @@
+"""
+Serialization micro-benchmark: FastAPI's default response path vs FastJSONResponse.
+
+    python -m bench.serialization [--rows 10000] [--repeat 5]
+
+No database needed: rows are synthetic but shaped like the handlers' output.
+The "before" paths are what FastAPI does with the handler's return value:
+jsonable_encoder + json.dumps when there is no response_model, validation +
+serialization through the response_model when there is one.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+from models import ConversationSearchOut, ConversationSummary
+from serialization import FastJSONResponse
+
+
+def _answers(n):
+    now = datetime.now(timezone.utc)
+    return {"ok": True, "audit_id": 1, "count": n, "answers": [{
+        "answer_id": i, "audit_id": 1, "question_text": f"Question {i % 60}: is the area clean and safe?",
+        "response_text": "Yes, checked during the walk-through." * 2, "is_compliant": i % 7 != 0,
+        "attempt_number": 1, "evidence_filename": None, "created_at": now - timedelta(minutes=i),
+        "auditee_id": 3, "auditee_name": "Amina bench3@example.com",
+    } for i in range(n)]}
+
+
+def _summaries(n):
+    now = datetime.now(timezone.utc)
+    return [{"id": i, "user_name": f"user{i % 100}", "date_conversation": now - timedelta(minutes=i),
+             "preview": "user: hello, I need help with the quarterly forecast for plant 4 " * 2,
+             "assistant_name": "sales-coach"} for i in range(n)]
+
+
+def _hits(n):
+    items = []
+    for i, row in enumerate(_summaries(n)):
+        del row["preview"]
+        items.append(dict(row, rank=0.1 + (i % 10) / 10, snippet="... the <b>forecast</b> for plant ..."))
+    return {"items": items, "total": n}
+
+
+def _best(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+
+def cases(rows):
+    answers, summaries, hits = _answers(rows), _summaries(rows), _hits(rows)
+    summary_models = [ConversationSummary(**r) for r in summaries]
+    search_adapter = TypeAdapter(ConversationSearchOut)
+    return {
+        "answers (no response_model)": (
+            lambda: JSONResponse(jsonable_encoder(answers)).body,
+            lambda: FastJSONResponse(answers).body,
+        ),
+        "conversation summaries (Pydantic objects)": (
+            lambda: JSONResponse(jsonable_encoder({"items": summary_models, "total": rows})).body,
+            lambda: FastJSONResponse({"items": summaries, "total": rows}).body,
+        ),
+        "search hits (response_model)": (
+            lambda: search_adapter.dump_json(search_adapter.validate_python(hits)),
+            lambda: FastJSONResponse(hits).body,
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    result = {}
+    for name, (before, after) in cases(args.rows).items():
+        b, a = _best(before, args.repeat), _best(after, args.repeat)
+        result[name] = {"before_ms": round(b, 2), "after_ms": round(a, 2), "speedup": round(b / a, 1),
+                        "bytes": len(after())}
+    print(json.dumps({"rows": args.rows, "cases": result}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
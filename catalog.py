@@ -0,0 +1,44 @@
+"""
+Cached reference data: questionnaire questions and objection handling.
+
+    questions    version_tag -> questions of that version (POST /audits/start)
+    objections   (category, q, limit, offset) -> rows (GET /objections)
+
+Questions only change through POST /questions/bulk, which evicts the version
+it wrote to in every worker (invalidation.py); objections are maintained
+outside this API, so their entries simply expire. Empty questionnaires are not
+cached: the version may be filled right after. The app lifespan preloads the
+latest questionnaire and the first page of objections, overall and per
+category, so the first audits and objection lookups of a new worker do not
+wait on the database.
+
+Env:
+    CATALOG_CACHE_TTL   seconds an entry is trusted (default 300)
+    CATALOG_CACHE_SIZE  max entries per cache (default 1000)
+"""
+import os
+
+import invalidation
+from cache import TTLCache
+
+TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+SIZE = int(os.getenv("CATALOG_CACHE_SIZE", "1000"))
+
+# version_tag -> [{"question_id", "text", "category", "mandatory"}]
+questions = invalidation.register("questions", TTLCache(maxsize=SIZE, ttl=TTL))
+# (category, q, limit, offset) -> [row dict]
+objections = invalidation.register("objections", TTLCache(maxsize=SIZE, ttl=TTL))
+
+OBJECTIONS_PAGE = 100   # GET /objections default limit
+
+
+def objections_key(category, q, limit, offset):
+    return (category or None, q or None, limit, offset)
+
+
+def stats():
+    """Entry counts and hit/miss totals for the readiness probe."""
+    return {
+        name: {"entries": len(c), "hits": c.hits, "misses": c.misses}
+        for name, c in (("questions", questions), ("objections", objections))
+    }
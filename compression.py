@@ -0,0 +1,125 @@
+"""
+Transcript compression for conversations.conversation.
+
+Large transcripts are stored zstd-compressed in conversations.conversation_zstd
+(conversation is then NULL); small ones stay as plain text. An optional shared
+dictionary trained on our own transcripts improves the ratio on medium-sized
+chats. The dictionary id is written in every frame, so old frames keep decoding
+as long as their dictionary file stays listed in CONVERSATION_ZSTD_DICT.
+
+Env:
+    CONVERSATION_COMPRESS_MIN_BYTES  transcripts below this stay plain text (default 2048)
+    CONVERSATION_ZSTD_LEVEL          compression level (default 9)
+    CONVERSATION_ZSTD_DICT           comma-separated dictionary paths, first one is used for writing
+
+Train a dictionary:
+    python compression.py train dict-v1.zstd [--samples 5000] [--size 112640]
+"""
+import os
+import threading
+from functools import lru_cache
+
+import zstandard
+
+COMPRESS_MIN_BYTES = int(os.getenv("CONVERSATION_COMPRESS_MIN_BYTES", "2048"))
+ZSTD_LEVEL = int(os.getenv("CONVERSATION_ZSTD_LEVEL", "9"))
+DICT_PATHS = [p.strip() for p in os.getenv("CONVERSATION_ZSTD_DICT", "").split(",") if p.strip()]
+
+# zstd (de)compressor objects must not be shared between threads
+_local = threading.local()
+
+
+@lru_cache(maxsize=1)
+def _dictionaries():
+    dicts = {}
+    for path in DICT_PATHS:
+        with open(path, "rb") as f:
+            d = zstandard.ZstdCompressionDict(f.read())
+        dicts[d.dict_id()] = d
+    return dicts
+
+
+def _write_dict():
+    if not DICT_PATHS:
+        return None
+    dicts = _dictionaries()
+    return next(iter(dicts.values())) if dicts else None
+
+
+def _compressor():
+    c = getattr(_local, "compressor", None)
+    if c is None:
+        c = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=_write_dict(), write_content_size=True)
+        _local.compressor = c
+    return c
+
+
+def _decompressor(dict_id):
+    cache = getattr(_local, "decompressors", None)
+    if cache is None:
+        cache = _local.decompressors = {}
+    d = cache.get(dict_id)
+    if d is None:
+        dict_data = _dictionaries().get(dict_id) if dict_id else None
+        if dict_id and dict_data is None:
+            raise ValueError(f"zstd dictionary {dict_id} is not configured (CONVERSATION_ZSTD_DICT)")
+        d = cache[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return d
+
+
+def should_compress(text):
+    return text is not None and len(text) >= COMPRESS_MIN_BYTES
+
+
+def encode_conversation(text):
+    """Return (plain_text, zstd_bytes); exactly one of them is not None."""
+    if not should_compress(text):
+        return text, None
+    return None, _compressor().compress(text.encode("utf-8"))
+
+
+def decode_conversation(text, blob):
+    """Inverse of encode_conversation; accepts the two DB columns as fetched."""
+    if blob is None:
+        return text
+    blob = bytes(blob)
+    dict_id = zstandard.get_frame_parameters(blob).dict_id
+    return _decompressor(dict_id).decompress(blob).decode("utf-8")
+
+
+def train_dictionary(samples, size=112640):
+    return zstandard.train_dictionary(size, [s.encode("utf-8") for s in samples])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from db import get_connection
+
+    parser = argparse.ArgumentParser(description="Train a zstd dictionary on stored transcripts")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    train = sub.add_parser("train")
+    train.add_argument("out")
+    train.add_argument("--samples", type=int, default=5000)
+    train.add_argument("--size", type=int, default=112640)
+    args = parser.parse_args()
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT conversation, conversation_zstd
+        FROM conversations
+        ORDER BY id DESC
+        LIMIT %s
+        """,
+        (args.samples,),
+    )
+    texts = [decode_conversation(t, b) for (t, b) in cur.fetchall()]
+    cur.close()
+    conn.close()
+
+    d = train_dictionary(texts, args.size)
+    with open(args.out, "wb") as f:
+        f.write(d.as_bytes())
+    print(f"wrote {args.out}: dict_id={d.dict_id()} from {len(texts)} transcripts")
@@ -1,21 +1,445 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import psycopg2
 
-def get_connection():
-    return psycopg2.connect(
-        host="avo-adb-001.postgres.database.azure.com",
-        port=5432,
-        database="ChatGPT_DB",   
-        user="adminavo",     
-        password="$#fKcdXPg4@ue8AW",
-        sslmode="require"
+import admission
+import metrics
+
+# Defaults are the production server; override (e.g. for bench/) with DB_* env vars
+DB_HOST = os.getenv("DB_HOST", "avo-adb-001.postgres.database.azure.com")
+DB_PORT = int(os.getenv("DB_PORT", "5432"))
+DB_USER = os.getenv("DB_USER", "adminavo")
+DB_PASSWORD = os.getenv("DB_PASSWORD", "$#fKcdXPg4@ue8AW")
+DB_SSLMODE = os.getenv("DB_SSLMODE", "require")
+DB_NAME = os.getenv("DB_NAME", "ChatGPT_DB")
+DB_SALES_NAME = os.getenv("DB_SALES_NAME", "Sales")
+
+# Read replicas: "host[:port],host[:port]" (same user/password/sslmode as the primary)
+DB_REPLICA_HOSTS = [h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))            # seconds
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+DB_REPLICA_CONNECT_TIMEOUT = int(os.getenv("DB_REPLICA_CONNECT_TIMEOUT", "2"))
+
+# Pooling: idle connections kept per server/database (0 = close on every close()).
+# Not a cap on open connections: a checkout never waits, it opens a new one when
+# none is idle. Concurrency (and so connections) per worker is bounded by
+# ADMISSION_MAX_CONCURRENCY plus background threads.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "60"))      # seconds unused before it is dropped
+DB_POOL_MAX_AGE = float(os.getenv("DB_POOL_MAX_AGE", "1800"))      # seconds since connect
+DB_POOL_WARM = int(os.getenv("DB_POOL_WARM", "4"))                 # connections opened at startup
+
+read_connections = metrics.Counter(
+    "db_read_connections_total", "Read-only connections by target (replica host or primary)", ("target",))
+pool_checkouts = metrics.Counter(
+    "db_pool_checkouts_total", "Connections handed out, reused from the pool or newly opened", ("pool", "result"))
+pool_idle = metrics.Gauge("db_pool_idle_connections", "Idle connections kept in the pool", ("pool",))
+
+
+def _connect(connection_factory=None, **kwargs):
+    start = time.perf_counter()
+    conn = psycopg2.connect(connection_factory=connection_factory, **kwargs)
+    elapsed = time.perf_counter() - start
+    metrics.db_connect_duration.observe(elapsed, kwargs["database"])
+    metrics.add_db_time(elapsed)
+    return conn
+
+
+# ----------------------
+# Connection pool
+# ----------------------
+class PooledConnection(metrics.InstrumentedConnection):
+    """
+    close() hands the connection back to its pool instead of closing it. A
+    replica connection also gives its slot back to the ReplicaSet. Callers get
+    it wrapped in a ConnectionLease, never directly.
+    """
+
+    pool = None
+    replica = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = self.released_at = time.monotonic()
+        self.idle = False
+        self.prepared = set()   # statements.py names PREPAREd in this session
+
+    def close(self):
+        if self.idle:
+            return
+        replica, self.replica = self.replica, None
+        if replica is not None:
+            replicas.release(replica)
+        if self.pool is None or not self.pool.put(self):
+            self.discard()
+
+    def discard(self):
+        self.pool = None
+        super().close()
+
+
+class ConnectionLease:
+    """
+    One checkout of a PooledConnection; everything but close() is passed
+    through. Handlers keep their get_connection() ... conn.close() shape, and
+    a second close() (an early close, then the one in `except`) does nothing,
+    even when the connection has meanwhile been checked out again: it must not
+    roll back or re-pool a session another request is using. Any other use
+    after close() raises InterfaceError, like a closed psycopg2 connection.
+    """
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn):
+        object.__setattr__(self, "_conn", conn)
+
+    def _checked_out(self):
+        conn = self._conn
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        return conn
+
+    def __getattr__(self, name):
+        return getattr(self._checked_out(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._checked_out(), name, value)
+
+    @property
+    def closed(self):
+        return 1 if self._conn is None else self._conn.closed
+
+    def close(self):
+        conn = self._conn
+        if conn is not None:
+            object.__setattr__(self, "_conn", None)
+            conn.close()
+
+
+class ConnectionPool:
+    """
+    LIFO stack of idle connections to one server/database.
+
+    A returned connection is rolled back (read handlers never commit) and its
+    read-only flag cleared. Broken connections, ones a maintenance job put in
+    autocommit (it may have SET session options), and ones over
+    DB_POOL_MAX_IDLE / DB_POOL_MAX_AGE are closed instead of reused.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, **params):
+        self.size = size
+        self.params = params
+        self.name = f"{params['host']}:{params['port']}/{params['database']}"
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                pool_idle.set(len(self._idle), self.name)
+            if conn is None:
+                break
+            conn.idle = False
+            now = time.monotonic()
+            if conn.closed or now - conn.released_at > DB_POOL_MAX_IDLE or now - conn.created_at > DB_POOL_MAX_AGE:
+                conn.discard()
+                continue
+            pool_checkouts.inc(1, self.name, "reused")
+            return conn
+        conn = _connect(connection_factory=PooledConnection, **self.params)
+        conn.pool = self
+        pool_checkouts.inc(1, self.name, "new")
+        return conn
+
+    def put(self, conn):
+        if conn.closed or conn.autocommit:
+            return False
+        try:
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            conn.readonly = None
+        except psycopg2.Error:
+            return False
+        conn.released_at = time.monotonic()
+        with self._lock:
+            if len(self._idle) >= self.size:
+                return False
+            conn.idle = True
+            self._idle.append(conn)
+            pool_idle.set(len(self._idle), self.name)
+        return True
+
+    def warm(self, count, prepare=None):
+        """Open connections until count are idle (capped at size); prepare(conn) runs on each new one."""
+        with self._lock:
+            missing = min(count, self.size) - len(self._idle)
+        if missing <= 0:
+            return 0
+        with ThreadPoolExecutor(missing, thread_name_prefix="db-warm") as executor:
+            futures = [executor.submit(self._open, prepare) for _ in range(missing)]
+        # Pool the ones that opened even if others failed, then report the failure
+        opened, error = 0, None
+        for future in futures:
+            try:
+                conn = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            conn.close()
+            opened += 1
+        if error is not None:
+            raise error
+        return opened
+
+    def _open(self, prepare):
+        conn = _connect(connection_factory=PooledConnection, **self.params)
+        conn.pool = self
+        pool_checkouts.inc(1, self.name, "warm")
+        try:
+            if prepare is not None:
+                prepare(conn)
+            conn.commit()
+        except BaseException:
+            conn.discard()
+            raise
+        return conn
+
+    def stats(self):
+        with self._lock:
+            return {"idle": len(self._idle), "size": self.size}
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            pool_idle.set(0, self.name)
+        for conn in idle:
+            conn.idle = False
+            conn.discard()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(**params):
+    key = tuple(sorted(params.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(**params))
+    return pool
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        pool.clear()
+
+
+def pool_stats():
+    """{pool name: {"idle", "size"}} for the readiness probe."""
+    return {pool.name: pool.stats() for pool in list(_pools.values())}
+
+
+def _apply_deadline(conn):
+    # Transaction-local, so it never leaks into the connection's next user
+    ms = admission.remaining_ms()
+    if ms is not None:
+        cur = conn.cursor()
+        cur.execute("SELECT set_config('statement_timeout', %s, true)", (str(ms),))
+        cur.close()
+    return conn
+
+
+def _primary_pool(database):
+    return _pool(
+        host=DB_HOST,
+        port=DB_PORT,
+        database=database,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        sslmode=DB_SSLMODE
     )
+
+
+def get_connection():
+    return _apply_deadline(ConnectionLease(_primary_pool(DB_NAME).get()))
 def get_connection_sales():
-    return psycopg2.connect(
-        host="avo-adb-001.postgres.database.azure.com",
-        port=5432,
-        database="Sales",   
-        user="adminavo",     
-        password="$#fKcdXPg4@ue8AW",
-        sslmode="require"
+    return _apply_deadline(ConnectionLease(_primary_pool(DB_SALES_NAME).get()))
+
+
+def get_listen_connection():
+    """
+    Dedicated autocommit session for LISTEN (invalidation.py), never pooled.
+    TCP keepalives notice a dead server even when no notification is due.
+    """
+    conn = _connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        sslmode=DB_SSLMODE,
+        connect_timeout=10,
+        keepalives=1,
+        keepalives_idle=30,
+        keepalives_interval=10,
+        keepalives_count=3,
     )
+    conn.autocommit = True
+    return conn
+
+
+def warm_pools(count=DB_POOL_WARM, prepare=None):
+    """
+    Open count idle connections per primary database before the first request
+    (app lifespan), so it does not pay for connect + TLS + auth. prepare(conn)
+    runs on each new connection of the main database. Replica pools fill on
+    first use: which replicas are healthy is not known yet at startup.
+    """
+    return {
+        DB_NAME: _primary_pool(DB_NAME).warm(count, prepare),
+        DB_SALES_NAME: _primary_pool(DB_SALES_NAME).warm(count),
+    }
+
+
+# ----------------------
+# Read replicas
+# ----------------------
+class Replica:
+    def __init__(self, address):
+        host, _, port = address.partition(":")
+        self.host = host
+        self.port = int(port or DB_PORT)
+        self.in_flight = 0      # connections handed out and not closed yet
+        self.active = 0         # active backends on the server at the last check
+        self.lag = 0.0
+        self.healthy = True     # optimistic until the first check
+
+    @property
+    def name(self):
+        return f"{self.host}:{self.port}"
+
+
+class ReplicaSet:
+    """
+    Picks the least-loaded healthy replica for each read connection.
+
+    Load is our own open connections on it plus the active backends seen by
+    the last health check. A background check every DB_REPLICA_CHECK_INTERVAL
+    seconds measures replay lag; a replica more than DB_REPLICA_MAX_LAG behind,
+    or that failed to connect, gets no reads until a later check passes.
+    """
+
+    LAG_SQL = """
+        SELECT CASE
+                 WHEN NOT pg_is_in_recovery() THEN 0
+                 WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                 ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+               END,
+               (SELECT count(*) FROM pg_stat_activity WHERE state = 'active')
+    """
+
+    def __init__(self, hosts, max_lag=DB_REPLICA_MAX_LAG, interval=DB_REPLICA_CHECK_INTERVAL):
+        self.replicas = [Replica(h) for h in hosts]
+        self.max_lag = max_lag
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire(self):
+        with self._lock:
+            candidates = [r for r in self.replicas if r.healthy]
+            if not candidates:
+                return None
+            replica = min(candidates, key=lambda r: r.in_flight + r.active)
+            replica.in_flight += 1
+            return replica
+
+    def release(self, replica):
+        with self._lock:
+            replica.in_flight -= 1
+
+    def mark_down(self, replica):
+        with self._lock:
+            replica.healthy = False
+
+    def check(self):
+        for replica in self.replicas:
+            try:
+                conn = psycopg2.connect(host=replica.host, port=replica.port, database=DB_NAME,
+                                        user=DB_USER, password=DB_PASSWORD, sslmode=DB_SSLMODE,
+                                        connect_timeout=DB_REPLICA_CONNECT_TIMEOUT)
+                try:
+                    cur = conn.cursor()
+                    cur.execute(self.LAG_SQL)
+                    lag, active = cur.fetchone()
+                finally:
+                    conn.close()
+                with self._lock:
+                    replica.lag = float(lag)
+                    replica.active = max(0, active - 1)  # minus this check
+                    replica.healthy = replica.lag <= self.max_lag
+            except psycopg2.Error:
+                self.mark_down(replica)
+
+    def start(self):
+        if self.replicas and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="replica-check", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval + DB_REPLICA_CONNECT_TIMEOUT * len(self.replicas))
+
+    def _run(self):
+        metrics.current_handler.set("bg:replica-check")
+        while True:
+            self.check()
+            if self._stop.wait(self.interval):
+                return
+
+
+replicas = ReplicaSet(DB_REPLICA_HOSTS)
+
+
+def _read_connection(database):
+    replica = replicas.acquire()
+    while replica is not None:
+        try:
+            conn = _pool(
+                host=replica.host,
+                port=replica.port,
+                database=database,
+                user=DB_USER,
+                password=DB_PASSWORD,
+                sslmode=DB_SSLMODE,
+                connect_timeout=DB_REPLICA_CONNECT_TIMEOUT,
+            ).get()
+        except psycopg2.OperationalError:
+            replicas.release(replica)
+            replicas.mark_down(replica)
+            replica = replicas.acquire()
+            continue
+        conn.replica = replica
+        read_connections.inc(1, replica.name)
+        break
+    else:
+        conn = _primary_pool(database).get()
+        read_connections.inc(1, "primary")
+    conn.set_session(readonly=True)
+    return _apply_deadline(ConnectionLease(conn))
+
+
+def get_read_connection():
+    """Connection for read-only handlers: a replica when one is usable, else the primary."""
+    return _read_connection(DB_NAME)
+
 
+def get_read_connection_sales():
+    return _read_connection(DB_SALES_NAME)
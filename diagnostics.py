@@ -0,0 +1,316 @@
+"""
+Opt-in diagnostics: slow-query log and per-request sampling profiler.
+
+Slow queries (SLOW_QUERY_MS set): any statement slower than the threshold is
+logged on the "db_ia.slow_query" logger with its handler, the shape of its
+parameters (types and lengths, never values) and, for read-only statements,
+an EXPLAIN (ANALYZE, BUFFERS) of the same query. EXPLAIN re-runs the query, so
+it is done at most once per statement text every SLOW_QUERY_EXPLAIN_INTERVAL
+seconds. The last entries are also kept for GET /debug/slow-queries.
+
+Profiling (DEBUG_TOKEN set):
+- a request sent with "X-Profile: <DEBUG_TOKEN>" is sampled while its endpoint
+  runs; the response carries X-Profile-Id, fetch the result from
+  GET /debug/profiles/{id};
+- POST /debug/profile?seconds=N samples every thread of the process for N seconds.
+Profiles are folded stacks ("frame;frame;frame count" per line), the input of
+flamegraph.pl, speedscope and inferno. /debug/* needs "X-Debug-Token: <DEBUG_TOKEN>".
+
+Env:
+    SLOW_QUERY_MS                  threshold in ms (unset = slow-query log off)
+    SLOW_QUERY_EXPLAIN             0 to log without EXPLAIN (default 1)
+    SLOW_QUERY_EXPLAIN_INTERVAL    seconds between EXPLAINs of one statement (default 60)
+    DEBUG_TOKEN                    enables profiling and /debug/* (unset = off)
+    PROFILE_INTERVAL_MS            sampling interval (default 5)
+"""
+import functools
+import hmac
+import inspect
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextvars import ContextVar
+
+import psycopg2.extensions
+from fastapi.routing import APIRoute
+
+import metrics
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0") or 0)
+EXPLAIN_ENABLED = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN") or None
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000.0
+
+PROFILING_ENABLED = DEBUG_TOKEN is not None
+MAX_PROFILES = 50
+MAX_PROFILE_SECONDS = 60
+
+log = logging.getLogger("db_ia.slow_query")
+
+
+def token_matches(value):
+    if DEBUG_TOKEN is None or not value:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), DEBUG_TOKEN.encode("utf-8"))
+
+
+# ----------------------
+# Slow-query log
+# ----------------------
+recent_slow_queries = deque(maxlen=100)
+
+_explaining = threading.local()
+_last_explain = {}  # statement text -> monotonic time
+_explain_lock = threading.Lock()
+_WRITE_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE|NEXTVAL|SETVAL|PG_NOTIFY)\b", re.I)
+
+
+def _shape(value):
+    if value is None:
+        return "None"
+    if isinstance(value, (str, bytes, list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def param_shape(params):
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {_shape(v)}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(_shape(v) for v in params) + ")"
+
+
+def _is_read_only(sql):
+    head = sql.lstrip()[:6].upper()
+    return head.startswith(("SELECT", "WITH")) and not _WRITE_RE.search(sql)
+
+
+def _should_explain(cursor, sql):
+    if not EXPLAIN_ENABLED or cursor.name is not None or not _is_read_only(sql):
+        return False
+    status = cursor.connection.get_transaction_status()
+    if status not in (psycopg2.extensions.TRANSACTION_STATUS_IDLE,
+                      psycopg2.extensions.TRANSACTION_STATUS_INTRANS):
+        return False
+    now = time.monotonic()
+    key = sql[:1000]
+    with _explain_lock:
+        if now - _last_explain.get(key, float("-inf")) < EXPLAIN_INTERVAL:
+            return False
+        if len(_last_explain) >= 1000:
+            _last_explain.clear()
+        _last_explain[key] = now
+    return True
+
+
+def _explain(cursor, sql):
+    conn = cursor.connection
+    in_tx = conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    cur = conn.cursor(cursor_factory=psycopg2.extensions.cursor)
+    try:
+        # A savepoint keeps a failing EXPLAIN from aborting the caller's transaction
+        if in_tx:
+            cur.execute("SAVEPOINT diagnostics_explain")
+        try:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql)
+            plan = "\n".join(r[0] for r in cur.fetchall())
+        except Exception as e:
+            plan = f"EXPLAIN failed: {e}"
+            if in_tx:
+                cur.execute("ROLLBACK TO SAVEPOINT diagnostics_explain")
+        if in_tx:
+            cur.execute("RELEASE SAVEPOINT diagnostics_explain")
+        return plan
+    finally:
+        cur.close()
+
+
+def _on_query(cursor, query, params, seconds):
+    if seconds * 1000.0 < SLOW_QUERY_MS or getattr(_explaining, "active", False):
+        return
+    _explaining.active = True
+    try:
+        sql = query.decode("utf-8", "replace") if isinstance(query, bytes) else query
+        label = metrics.statement_label(query)
+        plan = None
+        if _should_explain(cursor, sql):
+            try:
+                plan = _explain(cursor, cursor.mogrify(query, params).decode("utf-8", "replace"))
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+        entry = {
+            "at": time.time(),
+            "handler": metrics.current_handler.get(),
+            "statement": label,
+            "ms": round(seconds * 1000.0, 1),
+            "params": param_shape(params),
+            "sql": sql[:2000],
+            "plan": plan,
+        }
+        recent_slow_queries.append(entry)
+        log.warning("slow query %.1f ms [%s] %s params=%s\n%s%s",
+                    entry["ms"], entry["handler"], label, entry["params"], entry["sql"],
+                    f"\n{plan}" if plan else "")
+    finally:
+        _explaining.active = False
+
+
+if SLOW_QUERY_MS > 0:
+    metrics.query_hooks.append(_on_query)
+
+
+# ----------------------
+# Sampling profiler
+# ----------------------
+_current_profile = ContextVar("diagnostics_profile", default=None)
+_profiles = OrderedDict()  # id -> folded text
+_profiles_lock = threading.Lock()
+
+
+def _frame_name(code):
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}:{code.co_firstlineno}"
+
+
+def _folded(frame):
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler:
+    """Samples the stacks of a set of threads (or all threads) from a helper thread."""
+
+    def __init__(self, interval=PROFILE_INTERVAL, all_threads=False):
+        self.interval = interval
+        self.all_threads = all_threads
+        self.threads = set()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            tids = frames.keys() if self.all_threads else list(self.threads)
+            for tid in tids:
+                frame = frames.get(tid)
+                if frame is None or tid == me:
+                    continue
+                stack = _folded(frame)
+                if self.all_threads:
+                    if tid not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    stack = f"{names.get(tid, tid)};{stack}"
+                self.samples[stack] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def store_profile(text, pid=None):
+    pid = pid or uuid.uuid4().hex
+    with _profiles_lock:
+        _profiles[pid] = text
+        while len(_profiles) > MAX_PROFILES:
+            _profiles.popitem(last=False)
+    return pid
+
+
+def get_profile(pid):
+    with _profiles_lock:
+        return _profiles.get(pid)
+
+
+def profile_process(seconds):
+    sampler = Sampler(all_threads=True).start()
+    time.sleep(seconds)
+    sampler.stop()
+    return sampler.folded()
+
+
+def _profiled(endpoint):
+    """Wrap an endpoint so the thread running it is sampled while a profile is active."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            sampler = _current_profile.get()
+            if sampler is None:
+                return await endpoint(*args, **kwargs)
+            tid = threading.get_ident()
+            sampler.threads.add(tid)
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                sampler.threads.discard(tid)
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            sampler = _current_profile.get()
+            if sampler is None:
+                return endpoint(*args, **kwargs)
+            tid = threading.get_ident()
+            sampler.threads.add(tid)
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                sampler.threads.discard(tid)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Route class whose endpoint can be sampled (set as app.router.route_class)."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+
+class ProfilingMiddleware:
+    """Starts a sampler for requests carrying a valid X-Profile header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        header = dict(scope["headers"]).get(b"x-profile")
+        if not header or not token_matches(header.decode("latin-1")):
+            return await self.app(scope, receive, send)
+
+        pid = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", pid.encode())]
+            await send(message)
+
+        sampler = Sampler().start()
+        token = _current_profile.set(sampler)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_profile.reset(token)
+            sampler.stop()
+            store_profile(sampler.folded(), pid)
@@ -0,0 +1,323 @@
+"""
+Live audit progress as Server-Sent Events (GET /audits/{audit_id}/events).
+
+Writers (save_answer, save_nc, complete_audit and the audit.score job) call
+notify() in their transaction: a NOTIFY on the "audit_events" channel, sent
+when it commits and handed to publish() by the LISTEN session of every worker
+(invalidation.listener), so a supervisor sees the writes served by any worker
+or job process. Each subscriber has a bounded asyncio queue on the event loop;
+a publish encodes the event once and hands the same bytes to every subscriber
+of the audit.
+
+Which audits are watched, on any worker, is kept in audit_watchers
+(migrations/012): a worker adds its row before a new stream starts and
+refreshes its rows every SSE_WATCH_TTL / 3 seconds (watchers thread, started
+by the lifespan); rows of closed streams and dead workers expire. Writers
+check watched() first and skip the events and the running score query when
+nobody watches, which is the usual case.
+
+Event ids are "<stream>-<seq>" and each audit keeps its last REPLAY_SIZE
+events while it has subscribers, so an EventSource that reconnects with
+Last-Event-ID gets exactly what it missed. When that is not possible (gap too
+large, other stream, worker restarted) or a subscriber stops reading and its
+queue fills up, it gets a "reset" event: reload /audits/{audit_id}/answers
+once and keep listening.
+
+Events: answer, nonconformity, score, completed, reset. If the LISTEN session
+drops, every subscriber gets a reset, since events may have been missed. An
+event too large for a NOTIFY has its long text fields cut to
+NOTIFY_TEXT_LIMIT characters (and "truncated": true); if it is still too
+large, subscribers get a reset instead.
+
+Env:
+    SSE_QUEUE_SIZE     events buffered per subscriber before it is reset (default 256)
+    SSE_REPLAY_SIZE    recent events kept per audit for Last-Event-ID (default 100)
+    SSE_HEARTBEAT      seconds between keep-alive comments (default 15)
+    SSE_WATCH_TTL      seconds an audit_watchers row outlives its last refresh (default 30)
+"""
+import asyncio
+import os
+import socket
+import threading
+import uuid
+from collections import deque
+
+import orjson
+import psycopg2
+
+import invalidation
+import metrics
+import statements
+from db import get_connection
+from serialization import dumps
+
+QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "256"))
+REPLAY_SIZE = int(os.getenv("SSE_REPLAY_SIZE", "100"))
+HEARTBEAT = float(os.getenv("SSE_HEARTBEAT", "15"))
+WATCH_TTL = float(os.getenv("SSE_WATCH_TTL", "30"))
+
+CHANNEL = "audit_events"
+NOTIFY_TEXT_LIMIT = 500   # characters kept of a long text field in an oversized event
+
+subscribers_gauge = metrics.Gauge("sse_subscribers", "Open event streams")
+published = metrics.Counter("sse_events_published_total", "Events published to at least one subscriber", ("event",))
+resets = metrics.Counter("sse_resets_total", "Subscribers told to reload: replay gap or full queue", ("reason",))
+
+_KEEPALIVE = b": keep-alive\n\n"
+
+
+def _message(event_id, event, data):
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (event_id.encode(), event.encode(), dumps(data))
+
+
+class _Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+        self.closed = False
+
+    def offer(self, message, event_id):
+        # Runs on the subscriber's event loop
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            # The reset carries the latest id, so a reconnect resumes from there
+            self.queue.put_nowait(_message(event_id, "reset", {"reason": "slow_consumer"}))
+            self.closed = True
+            resets.inc(1, "slow_consumer")
+
+
+class _Stream:
+    def __init__(self):
+        self.stream_id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.recent = deque(maxlen=REPLAY_SIZE)    # (seq, message)
+        self.subscribers = set()
+
+    @property
+    def last_id(self):
+        return f"{self.stream_id}-{self.seq}"
+
+    def replay_after(self, last_event_id):
+        """Messages after last_event_id, or None if they are not all still here."""
+        stream_id, _, seq = (last_event_id or "").partition("-")
+        if stream_id != self.stream_id or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq == self.seq:
+            return []
+        if not self.recent or seq < self.recent[0][0] - 1 or seq > self.seq:
+            return None
+        return [message for s, message in self.recent if s > seq]
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._streams = {}     # audit_id -> _Stream
+        self._count = 0
+
+    def has_subscribers(self, audit_id):
+        return audit_id in self._streams
+
+    def audit_ids(self):
+        with self._lock:
+            return list(self._streams)
+
+    def publish(self, audit_id, event, data):
+        """Thread-safe; called from the sync handlers' worker threads."""
+        with self._lock:
+            stream = self._streams.get(audit_id)
+            if stream is None:
+                return
+            stream.seq += 1
+            event_id = stream.last_id
+            message = _message(event_id, event, data)
+            stream.recent.append((stream.seq, message))
+            subscribers = list(stream.subscribers)
+        published.inc(1, event)
+        for sub in subscribers:
+            sub.loop.call_soon_threadsafe(sub.offer, message, event_id)
+
+    def reset_all(self, reason):
+        """Tell every subscriber to reload once (events may have been lost)."""
+        with self._lock:
+            audit_ids = list(self._streams)
+        for audit_id in audit_ids:
+            self.publish(audit_id, "reset", {"reason": reason})
+            resets.inc(1, reason)
+
+    def _subscribe(self, audit_id, last_event_id):
+        sub = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            stream = self._streams.get(audit_id)
+            if stream is None:
+                stream = self._streams[audit_id] = _Stream()
+            stream.subscribers.add(sub)
+            self._count += 1
+            subscribers_gauge.set(self._count)
+            backlog = stream.replay_after(last_event_id) if last_event_id else []
+            if backlog is None:
+                backlog = [_message(stream.last_id, "reset", {"reason": "replay_gap"})]
+                resets.inc(1, "replay_gap")
+        for message in backlog:
+            sub.queue.put_nowait(message)
+        return sub
+
+    def _unsubscribe(self, audit_id, sub):
+        with self._lock:
+            stream = self._streams.get(audit_id)
+            if stream is not None:
+                stream.subscribers.discard(sub)
+                if not stream.subscribers:
+                    del self._streams[audit_id]
+            self._count -= 1
+            subscribers_gauge.set(self._count)
+
+    async def stream(self, audit_id, last_event_id=None):
+        """Body iterator for a text/event-stream response."""
+        sub = self._subscribe(audit_id, last_event_id)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield _KEEPALIVE
+                    continue
+                yield message
+                if sub.closed and sub.queue.empty():
+                    return
+        finally:
+            self._unsubscribe(audit_id, sub)
+
+
+broker = Broker()
+
+
+# ----------------------
+# Watched audits across workers (audit_watchers)
+# ----------------------
+class Watchers:
+    def __init__(self, ttl=WATCH_TTL):
+        self.ttl = ttl
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, audit_id):
+        """Register audit_id before its first stream here; on failure the next refresh does it."""
+        if broker.has_subscribers(audit_id):
+            return
+        conn = None
+        try:
+            conn = get_connection()
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO audit_watchers (audit_id, worker, expires_at)
+                VALUES (%s, %s, now() + make_interval(secs => %s))
+                ON CONFLICT (audit_id, worker) DO UPDATE SET expires_at = EXCLUDED.expires_at
+            """, (audit_id, self.worker, self.ttl))
+            conn.commit()
+            cur.close()
+        except psycopg2.Error:
+            self.wake()
+        finally:
+            if conn:
+                conn.close()
+
+    def wake(self):
+        self._wake.set()
+
+    def refresh(self):
+        """
+        Extend the rows of this worker's open streams and drop expired rows.
+        Rows of closed streams are left to expire: deleting them here could
+        race with add() for a stream about to open.
+        """
+        audit_ids = broker.audit_ids()
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM audit_watchers WHERE expires_at < now()")
+            cur.execute("""
+                INSERT INTO audit_watchers (audit_id, worker, expires_at)
+                SELECT a, %s, now() + make_interval(secs => %s) FROM unnest(%s::int[]) AS a
+                ORDER BY a
+                ON CONFLICT (audit_id, worker) DO UPDATE SET expires_at = EXCLUDED.expires_at
+            """, (self.worker, self.ttl, audit_ids))
+            conn.commit()
+            cur.close()
+        finally:
+            conn.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="audit-watchers", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(10)
+        try:
+            conn = get_connection()
+            try:
+                cur = conn.cursor()
+                cur.execute("DELETE FROM audit_watchers WHERE worker = %s", (self.worker,))
+                conn.commit()
+                cur.close()
+            finally:
+                conn.close()
+        except psycopg2.Error:
+            pass   # the rows expire
+
+    def _run(self):
+        metrics.current_handler.set("bg:audit-watchers")
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except psycopg2.Error:
+                pass   # retried at the next tick; rows stay valid for ttl
+            self._wake.wait(self.ttl / 3)
+            self._wake.clear()
+
+
+watchers = Watchers()
+
+
+def watched(cur, audit_id):
+    """True if a stream of audit_id is open on any worker."""
+    if broker.has_subscribers(audit_id):
+        return True
+    statements.execute(cur, "audit_watched", (audit_id,))
+    return cur.fetchone()[0]
+
+
+def _notify_payload(audit_id, event, data):
+    message = dumps({"audit_id": audit_id, "event": event, "data": data})
+    if len(message) <= invalidation.MAX_PAYLOAD:
+        return message.decode()
+    data = {k: v[:NOTIFY_TEXT_LIMIT] if isinstance(v, str) else v for k, v in data.items()}
+    data["truncated"] = True
+    message = dumps({"audit_id": audit_id, "event": event, "data": data})
+    if len(message) <= invalidation.MAX_PAYLOAD:
+        return message.decode()
+    return dumps({"audit_id": audit_id, "event": "reset", "data": {"reason": "event_too_large"}}).decode()
+
+
+def notify(cur, audit_id, event, data):
+    """publish() in every worker once cur's transaction commits; nothing if it rolls back."""
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, _notify_payload(audit_id, event, data)))
+
+
+def _apply(payload):
+    message = orjson.loads(payload)
+    broker.publish(message["audit_id"], message["event"], message["data"])
+
+
+invalidation.listener.on(CHANNEL, _apply, lambda: broker.reset_all("listener_reconnect"))
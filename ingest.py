@@ -0,0 +1,346 @@
+"""
+Write-behind ingestion for /save-conversation.
+
+Enabled with CONVERSATION_BUFFERED=1. Conversations are appended to a local
+journal, queued in memory and flushed by a background thread as one multi-row
+INSERT, either when CONVERSATION_BATCH_SIZE entries are pending or every
+CONVERSATION_FLUSH_MS. Each entry carries a ticket (uuid) stored in
+conversations.ingest_ticket, unique together with date_conversation (the
+partition key, which a replay reuses). That makes replaying the journal after
+a crash idempotent and lets any worker answer ticket polls from the database.
+
+A batch that fails on its data (e.g. a NUL character, which Postgres text
+cannot hold) is retried one entry at a time: the bad entries are marked
+"failed" and dropped from the queue and the journal, the others are saved.
+Connection and SQL errors keep the whole batch queued and retry with backoff.
+Failed tickets are only known to the worker that took them, until it restarts
+or forgets them (MAX_TICKETS).
+
+Each worker owns journal-<pid>.ndjson in CONVERSATION_JOURNAL_DIR and holds a
+flock on it; on start, journals whose lock is free belonged to a dead worker
+and are replayed.
+
+Env:
+    CONVERSATION_BUFFERED        1 to enable (default off: direct INSERT per request)
+    CONVERSATION_BATCH_SIZE      flush when this many are pending (default 100)
+    CONVERSATION_FLUSH_MS        max time an entry waits before a flush (default 200)
+    CONVERSATION_JOURNAL_DIR     journal directory (default ./journal)
+    CONVERSATION_JOURNAL_FSYNC   1 to fsync every append (default 0: flush to OS only)
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import psycopg2.extras
+
+import metrics
+import rollups
+from db import get_connection
+from compression import encode_conversation
+
+ENABLED = os.getenv("CONVERSATION_BUFFERED", "0") == "1"
+BATCH_SIZE = int(os.getenv("CONVERSATION_BATCH_SIZE", "100"))
+FLUSH_INTERVAL = int(os.getenv("CONVERSATION_FLUSH_MS", "200")) / 1000.0
+JOURNAL_DIR = Path(os.getenv("CONVERSATION_JOURNAL_DIR", "journal"))
+JOURNAL_FSYNC = os.getenv("CONVERSATION_JOURNAL_FSYNC", "0") == "1"
+
+# Rewrite the journal with only pending entries once it grows past this
+JOURNAL_COMPACT_BYTES = 8 * 1024 * 1024
+# Tickets remembered in memory for polling (older ones fall back to the DB)
+MAX_TICKETS = 10000
+
+INSERT_SQL = """
+    INSERT INTO conversations (
+        user_name, conversation, conversation_zstd, search_vector,
+        date_conversation, assistant_name, ingest_ticket
+    )
+    VALUES %s
+    ON CONFLICT (ingest_ticket, date_conversation) DO NOTHING
+    RETURNING id, ingest_ticket::text
+"""
+INSERT_TEMPLATE = "(%s, %s, %s, to_tsvector('simple', %s), %s, %s, %s::uuid)"
+
+# Not caused by the entries themselves: keep them queued and retry
+RETRYABLE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, psycopg2.ProgrammingError)
+
+
+class _Ticket:
+    __slots__ = ("status", "id", "error", "event")
+
+    def __init__(self):
+        self.status = "queued"
+        self.id = None
+        self.error = None
+        self.event = threading.Event()
+
+
+class ConversationBuffer:
+    def __init__(self, journal_dir=JOURNAL_DIR, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.journal_dir = Path(journal_dir)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._tickets = OrderedDict()
+        self._cond = threading.Condition()
+        self._journal = None
+        self._journal_path = None
+        self._thread = None
+        self._stopping = False
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+    def start(self):
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self._journal_path = self.journal_dir / f"journal-{os.getpid()}.ndjson"
+        self._journal = open(self._journal_path, "a+", encoding="utf-8")
+        fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="conversation-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._journal:
+            with self._cond:
+                if not self._pending:
+                    self._journal_path.unlink()
+            self._journal.close()
+            self._journal = None
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+    def submit(self, user_name, conversation, date_conversation=None, assistant_name=None):
+        date_conv = date_conversation or datetime.now(timezone.utc)
+        entry = {
+            "ticket": str(uuid.uuid4()),
+            "user_name": user_name,
+            "conversation": conversation,
+            "date_conversation": date_conv.isoformat(),
+            "assistant_name": assistant_name,
+        }
+        with self._cond:
+            self._append_journal(entry)
+            self._pending.append(entry)
+            self._remember(entry["ticket"])
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        return entry["ticket"]
+
+    def wait(self, ticket, timeout):
+        """Block until the ticket is flushed; returns status() or None if unknown."""
+        with self._cond:
+            t = self._tickets.get(ticket)
+        if t is None:
+            return None
+        t.event.wait(timeout)
+        return self.status(ticket)
+
+    def status(self, ticket):
+        with self._cond:
+            t = self._tickets.get(ticket)
+            if t is None:
+                return None
+            return {"status": t.status, "id": t.id, "error": t.error}
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+    def _remember(self, ticket):
+        self._tickets[ticket] = _Ticket()
+        while len(self._tickets) > MAX_TICKETS:
+            self._tickets.popitem(last=False)
+
+    def _append_journal(self, record):
+        self._journal.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        if JOURNAL_FSYNC:
+            os.fsync(self._journal.fileno())
+
+    def _recover(self):
+        """Re-queue entries from our own journal and from journals of dead workers."""
+        orphans = []
+        for path in sorted(self.journal_dir.glob("journal-*.ndjson")):
+            if path == self._journal_path:
+                continue
+            f = open(path, "r", encoding="utf-8")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()  # owned by a live worker
+                continue
+            orphans.append((path, f))
+
+        files = [(self._journal_path, self._journal)] + orphans
+        entries = OrderedDict()
+        for _, f in files:
+            f.seek(0)
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash
+                if "done" in rec:
+                    for ticket in rec["done"]:
+                        entries.pop(ticket, None)
+                else:
+                    entries[rec["ticket"]] = rec
+
+        with self._cond:
+            self._pending.extend(entries.values())
+            for ticket in entries:
+                self._remember(ticket)
+            self._compact()
+        for path, f in orphans:
+            path.unlink()
+            f.close()
+
+    def _compact(self):
+        """Rewrite our journal with only the still-pending entries (caller holds the lock)."""
+        self._journal.seek(0)
+        self._journal.truncate()
+        for entry in self._pending:
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _run(self):
+        metrics.current_handler.set("bg:conversation-ingest")
+        backoff = 0.0
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval + backoff
+                while not self._stopping and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                if not batch and self._stopping:
+                    return
+            if not batch:
+                continue
+            try:
+                results, failed = self._flush_batch(batch)
+                backoff = 0.0
+            except Exception as e:
+                # Keep the batch queued (it is still in the journal) and retry
+                backoff = min(max(backoff * 2, 0.5), 10.0)
+                with self._cond:
+                    for entry in batch:
+                        t = self._tickets.get(entry["ticket"])
+                        if t is not None:
+                            t.error = str(e)
+                    if self._stopping:
+                        return
+                continue
+            with self._cond:
+                del self._pending[:len(batch)]
+                for ticket, new_id in results.items():
+                    t = self._tickets.get(ticket)
+                    if t is not None:
+                        t.status, t.id, t.error = "ok", new_id, None
+                        t.event.set()
+                for ticket, error in failed.items():
+                    t = self._tickets.get(ticket)
+                    if t is not None:
+                        t.status, t.error = "failed", error
+                        t.event.set()
+                if not self._pending or self._journal.tell() > JOURNAL_COMPACT_BYTES:
+                    self._compact()
+                else:
+                    # Failed entries are done too: a replay would only fail them again
+                    self._append_journal({"done": list(results) + list(failed)})
+
+    def _flush_batch(self, batch):
+        """
+        Returns (results, {ticket: error}). A batch that fails on its data is
+        flushed again one entry at a time, so only the bad entries fail.
+        """
+        try:
+            return self._flush(batch), {}
+        except RETRYABLE_ERRORS:
+            raise
+        except Exception:
+            pass
+        results, failed = {}, {}
+        for entry in batch:
+            try:
+                results.update(self._flush([entry]))
+            except RETRYABLE_ERRORS:
+                raise
+            except Exception as e:
+                failed[entry["ticket"]] = f"{type(e).__name__}: {e}"
+        return results, failed
+
+    def _flush(self, batch):
+        rows = []
+        for e in batch:
+            conv_text, conv_zstd = encode_conversation(e["conversation"])
+            rows.append((
+                e["user_name"],
+                conv_text,
+                conv_zstd,
+                e["conversation"] if conv_zstd is not None else None,
+                e["date_conversation"],
+                e["assistant_name"],
+                e["ticket"],
+            ))
+        conn = None
+        try:
+            conn = get_connection()
+            cur = conn.cursor()
+            inserted = psycopg2.extras.execute_values(
+                cur, INSERT_SQL, rows, template=INSERT_TEMPLATE, page_size=len(rows), fetch=True
+            )
+            results = {ticket: new_id for (new_id, ticket) in inserted}
+            # Only rows inserted now: a replayed entry was counted when it was first inserted
+            rollups.record(cur, [
+                (e["date_conversation"], e["assistant_name"], e["user_name"], len(e["conversation"]))
+                for e in batch if e["ticket"] in results
+            ])
+            # Already inserted before a crash (journal replay): look the ids up
+            missing = [e["ticket"] for e in batch if e["ticket"] not in results]
+            if missing:
+                cur.execute(
+                    "SELECT id, ingest_ticket::text FROM conversations WHERE ingest_ticket = ANY(%s::uuid[])",
+                    (missing,),
+                )
+                results.update({ticket: new_id for (new_id, ticket) in cur.fetchall()})
+            conn.commit()
+            cur.close()
+            conn.close()
+            conn = None
+            return results
+        except Exception:
+            if conn:
+                conn.rollback()
+                conn.close()
+            raise
+
+
+def lookup_ticket(ticket):
+    """DB fallback for tickets issued by another worker (or forgotten locally)."""
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM conversations WHERE ingest_ticket = %s::uuid", (ticket,))
+        row = cur.fetchone()
+        cur.close()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+buffer = ConversationBuffer() if ENABLED else None
@@ -0,0 +1,225 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Every worker caches auth codes, auditee profiles and questionnaires in
+process (auth_cache.py, catalog.py). A write served by one worker used to
+leave the other workers, on this host and others, serving the old value until
+it expired. Now:
+
+    writers   call notify(cur, cache, keys) in their transaction; Postgres
+              delivers the NOTIFY to every listener when it commits and drops
+              it on rollback, so nobody evicts for a write that did not happen
+    workers   keep one LISTEN session (a thread started by the app lifespan)
+              and evict the named keys from the registered cache
+
+The same session serves the other channels registered with listener.on()
+(audit events published by jobs, job wake-ups), so a worker holds one LISTEN
+connection in total.
+
+Writers also evict locally right after commit, so their own next read does not
+wait for the round trip. A connection lost means notifications may have been
+missed: every registered cache is cleared when the listener notices, and again
+when it is back. Loads that raced with an eviction are not cached (see
+TTLCache.generation), so entries can be kept for long TTLs.
+
+access_codes has no writer in this API; the trigger in
+migrations/009_cache_invalidation.sql notifies for changes made by hand or by
+admin tools. Objections live in the Sales database (a different NOTIFY
+namespace) and are not written here; they still rely on their TTL.
+
+Payload (one text NOTIFY, at most 8000 bytes, larger key lists are split):
+    {"cache": "auditees", "keys": ["a@x.com", ...]}   "keys": null clears the cache
+
+Env:
+    INVALIDATION_ENABLED   0 to rely on TTLs only (default 1)
+    INVALIDATION_PING      seconds between liveness checks of the LISTEN session (default 30)
+"""
+import json
+import os
+import select
+import threading
+import time
+
+import psycopg2
+
+import db
+import metrics
+
+ENABLED = os.getenv("INVALIDATION_ENABLED", "1") == "1"
+PING = float(os.getenv("INVALIDATION_PING", "30"))
+
+CHANNEL = "cache_invalidation"   # also in migrations/009_cache_invalidation.sql
+MAX_PAYLOAD = 7900               # NOTIFY payloads must stay under 8000 bytes
+
+received = metrics.Counter(
+    "cache_invalidations_total", "Invalidation messages applied, by cache", ("cache",))
+reconnects = metrics.Counter(
+    "cache_invalidation_reconnects_total", "LISTEN sessions re-established (all caches cleared)")
+listening = metrics.Gauge("cache_invalidation_listening", "1 while the LISTEN session is up")
+
+_caches = {}   # name -> TTLCache
+
+
+def register(name, cache):
+    _caches[name] = cache
+    return cache
+
+
+def clear_all():
+    for cache in _caches.values():
+        cache.clear()
+
+
+# ----------------------
+# Writers
+# ----------------------
+def _payloads(name, keys):
+    clear = json.dumps({"cache": name, "keys": None})
+    if keys is None:
+        yield clear
+        return
+    batch = []
+    for key in keys:
+        if len(json.dumps({"cache": name, "keys": batch + [key]})) <= MAX_PAYLOAD:
+            batch.append(key)
+            continue
+        if not batch or len(json.dumps({"cache": name, "keys": [key]})) > MAX_PAYLOAD:
+            # A key too large for NOTIFY: clear the whole cache instead
+            yield clear
+            return
+        yield json.dumps({"cache": name, "keys": batch})
+        batch = [key]
+    if batch:
+        yield json.dumps({"cache": name, "keys": batch})
+
+
+def notify(cur, name, keys=None):
+    """Evict keys (None: everything) of cache name in every worker once cur's transaction commits."""
+    if not ENABLED:
+        return
+    payloads = list(_payloads(name, keys))
+    cur.execute("SELECT pg_notify(%s, p) FROM unnest(%s::text[]) AS p", (CHANNEL, payloads))
+
+
+# ----------------------
+# Listener
+# ----------------------
+def _key(value):
+    # JSON turns tuple keys (catalog.objections_key) into lists
+    return tuple(value) if isinstance(value, list) else value
+
+
+def apply(payload):
+    try:
+        message = json.loads(payload)
+        cache = _caches.get(message["cache"])
+        keys = message["keys"]
+    except (ValueError, KeyError, TypeError):
+        return
+    if cache is None:
+        return
+    if keys is None:
+        cache.clear()
+    else:
+        for key in keys:
+            cache.invalidate(_key(key))
+    received.inc(1, message["cache"])
+
+
+class Listener:
+    def __init__(self, ping=PING):
+        self.ping = ping
+        self.connected = threading.Event()
+        self._channels = {}    # channel -> (callback(payload), reset() or None)
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = None
+
+    def on(self, channel, callback, reset=None):
+        """
+        Call callback(payload) for every NOTIFY on channel, and reset() whenever
+        notifications may have been missed (session lost or re-established).
+        Register before start().
+        """
+        self._channels[channel] = (callback, reset)
+
+    def start(self, timeout=5.0):
+        """Start listening; waits up to timeout for the first LISTEN so warm-up loads are covered."""
+        if not self._channels:
+            return
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+        self.connected.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.ping + 5)
+
+    def _listen(self):
+        conn = db.get_listen_connection()
+        cur = conn.cursor()
+        for channel in self._channels:
+            cur.execute(f"LISTEN {channel}")
+        cur.close()
+        return conn
+
+    def _reset(self):
+        for _, reset in self._channels.values():
+            if reset is not None:
+                reset()
+
+    def _run(self):
+        backoff = 1.0
+        first = True
+        while not self._stop.is_set():
+            try:
+                self._conn = self._listen()
+            except psycopg2.Error:
+                if self._stop.wait(backoff):
+                    return
+                backoff = min(backoff * 2, 30.0)
+                continue
+            # Anything written while nobody listened is unknown
+            self._reset()
+            if not first:
+                reconnects.inc()
+            first, backoff = False, 1.0
+            self.connected.set()
+            listening.set(1)
+            try:
+                self._serve(self._conn)
+            except (psycopg2.Error, OSError, ValueError):
+                pass
+            finally:
+                self.connected.clear()
+                listening.set(0)
+                self._reset()
+                try:
+                    self._conn.close()
+                except psycopg2.Error:
+                    pass
+                self._conn = None
+
+    def _serve(self, conn):
+        last_ping = time.monotonic()
+        while not self._stop.is_set():
+            ready, _, _ = select.select([conn], [], [], 1.0)
+            if ready:
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    try:
+                        self._channels[notification.channel][0](notification.payload)
+                    except Exception:
+                        pass   # one bad message must not take the session down
+            elif time.monotonic() - last_ping > self.ping:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                last_ping = time.monotonic()
+
+
+listener = Listener()
+if ENABLED:
+    listener.on(CHANNEL, apply, clear_all)
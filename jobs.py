@@ -0,0 +1,371 @@
+"""
+Background jobs on a Postgres table (migrations/010_jobs.sql).
+
+    jobs.enqueue(cur, "audit.score", {"audit_id": 7}, priority=10, dedupe_key="audit.score:7")
+
+enqueue() inserts in the caller's transaction, so a job exists if and only if
+the write that asked for it committed, and returns at once. Handlers are
+registered per type with @handler("type") and called as fn(cur, payload) in
+a transaction that also marks the job done: their database effects and the
+completion commit together, or neither does.
+
+Workers claim the runnable job with the lowest priority number, oldest first,
+with FOR UPDATE SKIP LOCKED, so any number of threads and processes claim
+concurrently without waiting on each other or taking the same job. A claimed
+job is leased for JOBS_LEASE seconds; if its worker dies, the next worker to
+see the lease expired puts it back in the queue. A failing handler is retried
+after JOBS_BACKOFF * 2^(attempt-1) seconds (capped at JOBS_BACKOFF_MAX, with
+jitter) until max_attempts, then the job stays "failed" with its last error.
+A dedupe_key keeps at most one queued job per key: a burst of requests for the
+same work collapses to one run. A job with a key that fails (or loses its
+lease) while another job with that key is queued is not retried: it is closed
+as "done", superseded, and the queued one does the work.
+
+enqueue() also NOTIFYs the "jobs" channel on commit, so idle workers start
+right away (through invalidation.listener); otherwise they poll every
+JOBS_POLL seconds. Finished and failed jobs are deleted after
+JOBS_RETENTION_DAYS.
+
+Workers run
+    in the API       JOBS_WORKERS threads per app worker, started by the lifespan
+    on their own     python -m jobs --processes 4 --threads 4   (set JOBS_WORKERS=0 on the API)
+
+GET /jobs/stats reads queue depth, oldest wait and recent throughput per type
+from the table, so it covers every worker process. Processes that run workers
+also export jobs_total{type,result}, job_duration_seconds{type},
+job_queue_wait_seconds{type} and jobs_queue_depth{type}.
+
+Env:
+    JOBS_WORKERS          worker threads inside each API worker (default 2, 0 = none)
+    JOBS_POLL             seconds between polls when idle (default 1)
+    JOBS_LEASE            seconds a claimed job may run before it is presumed lost (default 300)
+    JOBS_BACKOFF          first retry delay in seconds (default 2)
+    JOBS_BACKOFF_MAX      longest retry delay in seconds (default 600)
+    JOBS_RETENTION_DAYS   days finished/failed jobs are kept (default 7)
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+
+import psycopg2.errors
+import psycopg2.extras
+
+import invalidation
+import metrics
+from db import get_connection
+
+WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+POLL = float(os.getenv("JOBS_POLL", "1"))
+LEASE = float(os.getenv("JOBS_LEASE", "300"))
+BACKOFF = float(os.getenv("JOBS_BACKOFF", "2"))
+BACKOFF_MAX = float(os.getenv("JOBS_BACKOFF_MAX", "600"))
+RETENTION_DAYS = int(os.getenv("JOBS_RETENTION_DAYS", "7"))
+
+CHANNEL = "jobs"
+MAINTENANCE_INTERVAL = 15.0   # seconds between lease checks / cleanup / depth gauge per process
+
+jobs_total = metrics.Counter(
+    "jobs_total", "Job attempts by outcome: done, retry, failed, superseded", ("type", "result"))
+job_duration = metrics.Histogram("job_duration_seconds", "Handler run time", ("type",))
+job_queue_wait = metrics.Histogram(
+    "job_queue_wait_seconds", "Time from runnable to claimed", ("type",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60, 300, 1800))
+queue_depth = metrics.Gauge("jobs_queue_depth", "Runnable queued jobs", ("type",))
+
+_handlers = {}
+_wake = threading.Event()
+
+
+def handler(job_type):
+    """Register fn(cur, payload) as the handler of job_type."""
+    def register(fn):
+        _handlers[job_type] = fn
+        return fn
+    return register
+
+
+# ----------------------
+# Producers
+# ----------------------
+def enqueue(cur, job_type, payload=None, priority=100, dedupe_key=None, delay=0, max_attempts=5):
+    """
+    Queue a job in cur's transaction; returns its id. With a dedupe_key that
+    already has a queued job, returns that job's id instead.
+    """
+    cur.execute("""
+        INSERT INTO jobs (type, payload, priority, dedupe_key, run_after, max_attempts)
+        VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s), %s)
+        ON CONFLICT (dedupe_key) WHERE status = 'queued' DO NOTHING
+        RETURNING id
+    """, (job_type, psycopg2.extras.Json(payload or {}), priority, dedupe_key, delay, max_attempts))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute("SELECT id FROM jobs WHERE dedupe_key = %s AND status = 'queued'", (dedupe_key,))
+        row = cur.fetchone()
+        if row is None:
+            # Claimed between the two statements: queue a fresh one
+            return enqueue(cur, job_type, payload, priority, dedupe_key, delay, max_attempts)
+        return row[0]
+    cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, job_type))
+    return row[0]
+
+
+# ----------------------
+# Workers
+# ----------------------
+CLAIM_SQL = """
+    WITH next AS (
+        SELECT id FROM jobs
+         WHERE status = 'queued' AND run_after <= now()
+         ORDER BY priority, run_after, id
+         LIMIT 1
+         FOR UPDATE SKIP LOCKED
+    )
+    UPDATE jobs j
+       SET status = 'running',
+           attempts = j.attempts + 1,
+           started_at = now(),
+           locked_by = %s,
+           locked_until = now() + make_interval(secs => %s)
+      FROM next
+     WHERE j.id = next.id
+ RETURNING j.id, j.type, j.payload, j.attempts, j.max_attempts,
+           EXTRACT(epoch FROM now() - GREATEST(j.created_at, j.run_after))
+"""
+
+
+# A failed attempt: retry, unless it was the last one or a job with the same
+# dedupe_key is already queued (jobs_dedupe_idx allows only one)
+RETRY_SQL = """
+    WITH o AS (
+        SELECT j.id,
+               CASE WHEN %s THEN 'failed'
+                    WHEN EXISTS (SELECT 1 FROM jobs q WHERE q.dedupe_key = j.dedupe_key AND q.status = 'queued')
+                    THEN 'done'
+                    ELSE 'queued' END AS status
+          FROM jobs j
+         WHERE j.id = %s
+    )
+    UPDATE jobs
+       SET status = o.status,
+           run_after = now() + make_interval(secs => %s),
+           finished_at = CASE WHEN o.status <> 'queued' THEN now() END,
+           locked_by = NULL, locked_until = NULL,
+           last_error = %s || CASE WHEN o.status = 'done' THEN ' (superseded by a queued job)' ELSE '' END
+      FROM o
+     WHERE jobs.id = o.id
+ RETURNING jobs.status
+"""
+
+# Running jobs whose worker is gone: requeue, fail when out of attempts, or
+# close as superseded when their dedupe_key is queued already (or by another
+# expired job of the same key, which is requeued instead: the newest one)
+LEASE_SQL = """
+    WITH expired AS (
+        SELECT id, dedupe_key, attempts >= max_attempts AS exhausted,
+               row_number() OVER (PARTITION BY dedupe_key, attempts >= max_attempts ORDER BY id DESC) AS nth
+          FROM jobs
+         WHERE status = 'running' AND locked_until < now()
+    ), o AS (
+        SELECT e.id,
+               CASE WHEN e.exhausted THEN 'failed'
+                    WHEN e.dedupe_key IS NULL THEN 'queued'
+                    WHEN e.nth > 1
+                      OR EXISTS (SELECT 1 FROM jobs q WHERE q.dedupe_key = e.dedupe_key AND q.status = 'queued')
+                    THEN 'done'
+                    ELSE 'queued' END AS status
+          FROM expired e
+    )
+    UPDATE jobs
+       SET status = o.status,
+           finished_at = CASE WHEN o.status <> 'queued' THEN now() END,
+           run_after = now(),
+           last_error = 'lease expired (worker ' || coalesce(jobs.locked_by, '?') || ' lost)'
+                        || CASE WHEN o.status = 'done' THEN ', superseded by a queued job' ELSE '' END,
+           locked_by = NULL, locked_until = NULL
+      FROM o
+     WHERE jobs.id = o.id
+"""
+
+
+def backoff(attempt):
+    delay = min(BACKOFF_MAX, BACKOFF * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class Worker:
+    """Threads claiming and running jobs in this process."""
+
+    def __init__(self, threads=WORKERS):
+        self.threads = threads
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads = []
+        self._last_maintenance = 0.0
+        self._maintenance_lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.threads):
+            t = threading.Thread(target=self._run, name=f"jobs-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        _wake.set()
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def _run(self):
+        metrics.current_handler.set("bg:jobs")
+        while not self._stop.is_set():
+            try:
+                self._maintain()
+                ran = self.run_one()
+            except Exception:
+                ran = False   # database unreachable: retry after the poll interval
+            if not ran:
+                _wake.wait(POLL)
+                _wake.clear()
+
+    def run_one(self):
+        """Claim and run one job; False if none was runnable."""
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(CLAIM_SQL, (self.name, LEASE))
+            job = cur.fetchone()
+            conn.commit()
+            if job is None:
+                cur.close()
+                return False
+            job_id, job_type, payload, attempt, max_attempts, waited = job
+            job_queue_wait.observe(float(waited), job_type)
+
+            start = time.perf_counter()
+            try:
+                fn = _handlers.get(job_type)
+                if fn is None:
+                    raise LookupError(f"No handler for job type {job_type}")
+                fn(cur, payload)
+                cur.execute("""
+                    UPDATE jobs SET status = 'done', finished_at = now(), locked_by = NULL, locked_until = NULL
+                     WHERE id = %s
+                """, (job_id,))
+                conn.commit()
+                jobs_total.inc(1, job_type, "done")
+            except Exception as e:
+                conn.rollback()
+                final = attempt >= max_attempts
+                params = (final, job_id, 0 if final else backoff(attempt), f"{type(e).__name__}: {e}"[:2000])
+                try:
+                    cur.execute(RETRY_SQL, params)
+                except psycopg2.errors.UniqueViolation:
+                    # A job with the same key was queued concurrently: now it is visible
+                    conn.rollback()
+                    cur.execute(RETRY_SQL, params)
+                status = cur.fetchone()[0]
+                conn.commit()
+                jobs_total.inc(1, job_type, {"queued": "retry", "done": "superseded"}.get(status, status))
+            finally:
+                job_duration.observe(time.perf_counter() - start, job_type)
+            cur.close()
+            return True
+        finally:
+            conn.close()
+
+    def _maintain(self):
+        """Once per MAINTENANCE_INTERVAL per process: requeue lost jobs, drop old ones, refresh the depth gauge."""
+        now = time.monotonic()
+        if now - self._last_maintenance < MAINTENANCE_INTERVAL or not self._maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_maintenance = now
+            conn = get_connection()
+            try:
+                cur = conn.cursor()
+                # A job queued concurrently with the same key fails the requeue:
+                # retried next time, and the cleanup below still runs
+                cur.execute("SAVEPOINT lease")
+                try:
+                    cur.execute(LEASE_SQL)
+                except psycopg2.errors.UniqueViolation:
+                    cur.execute("ROLLBACK TO SAVEPOINT lease")
+                cur.execute("""
+                    DELETE FROM jobs
+                     WHERE status IN ('done', 'failed')
+                       AND finished_at < now() - make_interval(days => %s)
+                """, (RETENTION_DAYS,))
+                cur.execute("""
+                    SELECT type, count(*) FROM jobs
+                     WHERE status = 'queued' AND run_after <= now()
+                     GROUP BY type
+                """)
+                depth = dict(cur.fetchall())
+                conn.commit()
+                cur.close()
+            finally:
+                conn.close()
+            for job_type in set(depth) | set(_handlers):
+                queue_depth.set(depth.get(job_type, 0), job_type)
+        finally:
+            self._maintenance_lock.release()
+
+
+invalidation.listener.on(CHANNEL, lambda payload: _wake.set())
+
+worker = Worker()
+
+
+# ----------------------
+# Dedicated worker processes: python -m jobs --processes N --threads M
+# ----------------------
+def _process_main(threads):
+    import tasks  # noqa: F401  (registers the handlers)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the parent handles Ctrl-C
+    invalidation.listener.start()
+    w = Worker(threads)
+    w.start()
+    stop.wait()
+    w.stop()
+    invalidation.listener.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads", type=int, default=4, help="worker threads per process")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_process_main, args=(args.threads,), name=f"jobs-{i}")
+             for i in range(args.processes)]
+    for p in procs:
+        p.start()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    while not stopping.wait(1.0):
+        if not any(p.is_alive() for p in procs):
+            break
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        p.join(15)
+
+
+if __name__ == "__main__":
+    # Run the importable module, not __main__: spawned workers and tasks.py
+    # must see the same handler registry
+    import jobs
+    jobs.main()
@@ -1,24 +1,31 @@
-from fastapi import FastAPI, HTTPException, File, Form, UploadFile, Query
-from fastapi.responses import FileResponse, StreamingResponse
-from pydantic import BaseModel, EmailStr, Field
-from datetime import datetime, date, timezone
-from pathlib import Path
+from fastapi import APIRouter, FastAPI, HTTPException, File, Form, UploadFile, Query, Request, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse, Response, JSONResponse, PlainTextResponse, RedirectResponse
+from fastapi.routing import APIRoute
+from pydantic import EmailStr
+from datetime import datetime, date, timezone, timedelta
 import os
+import threading
+import time
 import uuid
 import base64
 import io
-import mimetypes
-import json
-import requests
+import gzip
+import csv
+import zlib
+from contextlib import asynccontextmanager
+import psycopg2.errors
 import psycopg2.extras
 from models import (
     AuditeeCreateIn,
     AuditeeCreateOut,
+    AuditeesBulkIn,
+    AuditeesBulkOut,
     AuthAuditeeOut,
     today_iso,
     AuditStartIn,
+    AuditStartOut,
     QuestionsBulkIn,
-    AnswerIn,
     NonConformityIn,
     CompleteAuditIn,
     ObjectionOut,
@@ -26,77 +33,297 @@ from models import (
     AuditeePrecheckIn,
     AuditeePrecheckOut,
     FileUploadPayload,
+    FileUploadOut,
+    ActionPlan,
+    ActionPlanOut,
+    ActionPlanLinkIn,
+    ReportStatusOut,
     AuthCheckIn,
     AuthCheckOut,
     ConversationIn,
     ConversationOut,
-    ConversationSummary,
     ConversationDetail,
+    ConversationSearchOut,
+    ConversationStatsOut,
+    SyncChangesOut,
+    JobStatsOut,
+    AnswerRow,
+    AuditAnswerRow,
+    AuditWithAnswersRow,
+    ConversationSummaryRow,
+    ConversationSearchHitRow,
 )
-from typing import Optional, List
-from db import get_connection, get_connection_sales
+from typing import Optional, List, Literal
+from db import get_connection, get_read_connection, get_read_connection_sales
+import db
+from compression import encode_conversation, decode_conversation, should_compress
+import ingest
+import auth_cache
+import name_sync
+import reports
+import metrics
+import diagnostics
+import admission
+import events
+import storage
+import statements
+import catalog
+import invalidation
+import jobs
+import rollups
+import tasks  # noqa: F401  (registers the job handlers)
+from serialization import FastJSONResponse, dumps as json_dumps
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if ingest.buffer:
+        ingest.buffer.start()
+    name_sync.syncer.start()
+    db.replicas.start()
+    await run_in_threadpool(invalidation.listener.start)
+    await run_in_threadpool(_warm_up, app)
+    jobs.worker.start()
+    events.watchers.start()
+    yield
+    events.watchers.stop()
+    jobs.worker.stop()
+    invalidation.listener.stop()
+    db.replicas.stop()
+    name_sync.syncer.stop()
+    reports.shutdown()
+    if ingest.buffer:
+        ingest.buffer.stop()
+    db.close_pools()
+
+router = APIRouter(route_class=diagnostics.ProfiledRoute if diagnostics.PROFILING_ENABLED else APIRoute)
+
+def _evidence_media_type(filename: str) -> str:
+    return f"image/{os.path.splitext(filename)[1][1:]}"
 
-app = FastAPI()
-# Create uploads directory for evidence images
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+# ----------------------
+# Cached credential lookups (see auth_cache.py)
+# ----------------------
+def _load_access_code(name: str):
+    generation = auth_cache.access_codes.generation
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        # Lecture stricte par name
+        statements.execute(cur, "access_code_by_name", (name,))
+        row = cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    return auth_cache.remember_access_code(name, row, generation)
+
+def _load_auditee(email: str):
+    generation = auth_cache.auditees.generation
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        statements.execute(cur, "auditee_by_email", (email,))
+        row = cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    if not row:
+        return auth_cache.remember_auditee(email, None, None, generation)
+    (aid, db_first_name, db_email, db_function,
+     plant_name, dept_name, manager_email, db_code) = row
+    profile = {
+        "id": aid,
+        "first_name": db_first_name,
+        "email": db_email,
+        "function": db_function,
+        "plant_name": plant_name,
+        "dept_name": dept_name,
+        "manager_email": manager_email,
+    }
+    return auth_cache.remember_auditee(email, profile, db_code, generation)
+
+def _get_auditee(email: str):
+    hit, entry = auth_cache.auditees.get(auth_cache.email_key(email))
+    return entry if hit else _load_auditee(email)
+
+def _sync_first_name(entry, email: str, incoming_first: str):
+    """
+    Cheap sync of the display first_name (e.g., capitalization/spacing).
+    The UPDATE is deferred to the name_sync background writer so the check
+    endpoints stay read-only; the cached profile is updated right away.
+    """
+    profile = dict(entry["profile"], first_name=incoming_first)
+    name_sync.syncer.submit(profile["id"], incoming_first)
+    auth_cache.auditees.set(auth_cache.email_key(email), {"profile": profile, "code_digest": entry["code_digest"]})
+    return profile
 
 # ----------------------
-# 1. Auth simple: /auth/check (lecture DB name+code)
+# Cached questionnaires and objections (see catalog.py)
 # ----------------------
-@app.post("/auth/check", response_model=AuthCheckOut)
-def auth_check(payload: AuthCheckIn):
+LATEST_VERSION_SQL = """
+    SELECT version_tag FROM questions
+     WHERE version_tag IS NOT NULL
+     ORDER BY created_at DESC, question_id DESC
+     LIMIT 1
+"""
+
+def _questions_for_version(cur, version):
+    hit, questions = catalog.questions.get(version)
+    if hit:
+        return questions
+    generation = catalog.questions.generation
+    cur.execute("""
+        SELECT question_id, text, category, mandatory
+        FROM questions
+        WHERE version_tag = %s
+        ORDER BY question_id
+    """, (version,))
+    questions = [
+        {"question_id": q[0], "text": q[1], "category": q[2], "mandatory": q[3]}
+        for q in cur.fetchall()
+    ]
+    if questions:
+        catalog.questions.set(version, questions, generation=generation)
+    return questions
+
+def _load_objections(cur, category, q, limit, offset):
+    """Rows of GET /objections for these filters; cur is a RealDictCursor on the Sales DB."""
+    generation = catalog.objections.generation
+    sql = """
+        SELECT id, customer_concern, example_customer_argument, recommended_response, category
+        FROM customer_objection_handling
+        WHERE 1=1
+    """
+    params: list = []
+
+    if category:
+        sql += " AND category = %s"
+        params.append(category)
+
+    if q:
+        like = f"%{q}%"
+        sql += """
+            AND (
+                customer_concern ILIKE %s OR
+                example_customer_argument ILIKE %s OR
+                recommended_response ILIKE %s
+            )
+        """
+        params.extend([like, like, like])
+
+    sql += " ORDER BY id LIMIT %s OFFSET %s"
+    params.extend([limit, offset])
+
+    cur.execute(sql, params)
+    rows = [dict(r) for r in cur.fetchall()]
+    catalog.objections.set(catalog.objections_key(category, q, limit, offset), rows, generation=generation)
+    return rows
+
+# ----------------------
+# Startup warm-up (lifespan, retried by /ready until it succeeds)
+# ----------------------
+_warm_up_lock = threading.Lock()
+
+def _warm_up(app: FastAPI):
+    """
+    Pre-open the connection pools (statements PREPAREd on the main ones) and
+    preload the latest questionnaire and the first page of objections, overall
+    and per category. /matrix has no data source yet, so there is nothing to
+    preload for it. Failures are recorded, not raised: the worker still starts
+    and /ready answers 503 until a later attempt succeeds.
+    """
+    if not _warm_up_lock.acquire(blocking=False):
+        return
+    state = app.state.warmup
+    start = time.perf_counter()
     conn = None
     try:
-        conn = get_connection()
+        state["connections"] = db.warm_pools(prepare=statements.prepare_all)
+
+        conn = get_read_connection()
         cur = conn.cursor()
-        # On ne révèle pas si le name existe : réponse générique
-        GENERIC_FAIL = {"ok": False, "reason": "Invalid name or code"}
-        # Lecture stricte par name
-        cur.execute(
-            """
-            SELECT code, is_active, expires_at
-            FROM access_codes
-            WHERE name = %s
-            LIMIT 1
-            """,
-            (payload.name,)
-        )
+        cur.execute(LATEST_VERSION_SQL)
         row = cur.fetchone()
+        if row:
+            _questions_for_version(cur, row[0])
         cur.close()
         conn.close()
         conn = None
 
-        if not row:
-            return GENERIC_FAIL
+        conn = get_read_connection_sales()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("""
+            SELECT DISTINCT category FROM customer_objection_handling
+             WHERE category IS NOT NULL
+        """)
+        categories = [r["category"] for r in cur.fetchall()]
+        for category in [None] + categories:
+            _load_objections(cur, category, None, catalog.OBJECTIONS_PAGE, 0)
+        cur.close()
+        conn.close()
+        conn = None
+
+        state.update(ready=True, error=None)
+    except Exception as e:
+        if conn:
+            conn.close()
+        state.update(ready=False, error=str(e))
+    finally:
+        state["attempts"] += 1
+        state["seconds"] = round(time.perf_counter() - start, 3)
+        _warm_up_lock.release()
+
+# ----------------------
+# 0) GET /ready (readiness probe: pools and caches warmed)
+# ----------------------
+@router.get("/ready")
+def ready(request: Request):
+    state = request.app.state.warmup
+    if not state["ready"]:
+        _warm_up(request.app)
+    return FastJSONResponse(
+        {**state, "pools": db.pool_stats(), "caches": catalog.stats(),
+         "invalidation": invalidation.listener.connected.is_set() if invalidation.ENABLED else None},
+        status_code=200 if state["ready"] else 503,
+    )
+
+# ----------------------
+# 1. Auth simple: /auth/check (lecture DB name+code)
+# ----------------------
+@router.post("/auth/check", response_model=AuthCheckOut)
+def auth_check(payload: AuthCheckIn):
+    # On ne révèle pas si le name existe : réponse générique
+    GENERIC_FAIL = {"ok": False, "reason": "Invalid name or code"}
+    try:
+        hit, entry = auth_cache.access_codes.get(payload.name)
+        if not hit:
+            entry = _load_access_code(payload.name)
 
-        db_code, is_active, expires_at = row
+        if entry is None:
+            return GENERIC_FAIL
 
         # Vérifs état / expiration
-        if not is_active:
+        if not entry["is_active"]:
             return {"ok": False, "reason": "Access disabled"}
 
-        from datetime import datetime, timezone
         now = datetime.now(timezone.utc)
+        expires_at = entry["expires_at"]
         if expires_at is not None and expires_at <= now:
             return {"ok": False, "reason": "Code expired"}
 
-        # Comparaison en clair (POC)
-        if payload.code != db_code:
+        # Comparaison à temps constant (empreintes HMAC)
+        if not auth_cache.code_matches(entry["code_digest"], payload.code):
             return GENERIC_FAIL
 
         # OK
         return {"ok": True}
 
     except Exception as e:
-        if conn:
-            conn.close()
         # On garde 200 pour simplicité côté GPT, mais on peut aussi lever 500
         return {"ok": False, "reason": f"Server error"}
 # ------------------------------------------------------------------------------------------------
 # 2) POST /auditees/precheck (auth by first_name + email)
 # ------------------------------------------------------------------------------------------------
-@app.post("/auditees/precheck", response_model=AuditeePrecheckOut, status_code=200)
+@router.post("/auditees/precheck", response_model=AuditeePrecheckOut, status_code=200)
 def auditee_precheck(payload: AuditeePrecheckIn):
     """
     Step A: Profile Pre-Check.
@@ -107,23 +334,10 @@ def auditee_precheck(payload: AuditeePrecheckIn):
     - If not exists:
         * exists=false → client should collect full profile and call /auditees.
     """
-    conn = None
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT id, first_name, email, "function",
-                   plant_name, dept_name, manager_email
-            FROM auditees
-            WHERE lower(email) = lower(%s)
-            LIMIT 1
-        """, (payload.email,))
-        row = cur.fetchone()
+        entry = _get_auditee(payload.email)
 
-        if not row:
-            cur.close()
-            conn.close()
+        if entry is None:
             return {
                 "ok": True,
                 "today": today_iso(),
@@ -131,46 +345,23 @@ def auditee_precheck(payload: AuditeePrecheckIn):
                 "reason": "No profile was found for this email."
             }
 
-        (
-            aid, db_first_name, db_email, db_function,
-            plant_name, dept_name, manager_email
-        ) = row
-
+        profile = entry["profile"]
         incoming_first = payload.first_name.strip()
-        if incoming_first and incoming_first != db_first_name:
-            cur.execute("""
-                UPDATE auditees
-                SET first_name = %s
-                WHERE id = %s
-            """, (incoming_first, aid))
-            conn.commit()
-            db_first_name = incoming_first
-
-        cur.close()
-        conn.close()
+        if incoming_first and incoming_first != profile["first_name"]:
+            profile = _sync_first_name(entry, payload.email, incoming_first)
 
         # Profile completeness check
-        profile_incomplete = not (db_first_name and db_email)
+        profile_incomplete = not (profile["first_name"] and profile["email"])
 
         return {
             "ok": True,
             "today": today_iso(),
             "exists": True,
             "profile_incomplete": profile_incomplete,
-            "auditee": {
-                "id": aid,
-                "first_name": db_first_name,
-                "email": db_email,
-                "function": db_function,
-                "plant_name": plant_name,
-                "dept_name": dept_name,
-                "manager_email": manager_email,
-            },
+            "auditee": profile,
         }
 
     except Exception as e:
-        if conn:
-            conn.close()
         return {
             "ok": False,
             "today": today_iso(),
@@ -181,7 +372,7 @@ def auditee_precheck(payload: AuditeePrecheckIn):
 # ------------------------------------------------------------------------------------------------
 # 3) GET /auditees/check (auth by first_name + email)
 # ------------------------------------------------------------------------------------------------
-@app.get("/auditees/check", response_model=AuthAuditeeOut)
+@router.get("/auditees/check", response_model=AuthAuditeeOut)
 def auditee_check(first_name: str, email: EmailStr, code: str):
     """
     Auth: first_name (case-insensitive) + email (case-insensitive) + code (exact)
@@ -189,39 +380,22 @@ def auditee_check(first_name: str, email: EmailStr, code: str):
     - If not found or first_name mismatch: ok=false with reason
     - Always returns 'today' (UTC) for assistant to use as audit date
     """
-    conn = None
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-        # 1) Find by email + code
-        cur.execute("""
-            SELECT id, first_name, email, "function",
-                   plant_name, dept_name, manager_email, code
-            FROM auditees
-            WHERE lower(email) = lower(%s)
-              AND code = %s
-            LIMIT 1
-        """, (email, code))
-        row = cur.fetchone()
+        # 1) Find by email, then compare code in constant time
+        entry = _get_auditee(email)
 
-        if not row:
-            cur.close()
-            conn.close()
+        if entry is None or not auth_cache.code_matches(entry["code_digest"], code):
             return {
                 "ok": False,
                 "today": today_iso(),
                 "reason": "Not found for provided email+code"
             }
 
-        (aid, db_first_name, db_email, db_function,
-         plant_name, dept_name, manager_email, db_code) = row
+        profile = entry["profile"]
 
         # 2) Verify first_name (case-insensitive)
         incoming_first = (first_name or "").strip()
-        if not incoming_first or incoming_first.casefold() != (db_first_name or "").strip().casefold():
-            cur.close()
-            conn.close()
+        if not incoming_first or incoming_first.casefold() != (profile["first_name"] or "").strip().casefold():
             return {
                 "ok": False,
                 "today": today_iso(),
@@ -229,43 +403,65 @@ def auditee_check(first_name: str, email: EmailStr, code: str):
             }
 
         # 3) Optional: cheap sync display of first_name (e.g., capitalization/spacing)
-        if incoming_first != db_first_name:
-            cur.execute("""
-                UPDATE auditees
-                SET first_name = %s
-                WHERE id = %s
-            """, (incoming_first, aid))
-            conn.commit()
-            db_first_name = incoming_first
-
-        cur.close()
-        conn.close()
+        if incoming_first != profile["first_name"]:
+            profile = _sync_first_name(entry, email, incoming_first)
 
         return {
             "ok": True,
             "today": today_iso(),
-            "auditee": {
-                "id": aid,
-                "first_name": db_first_name,
-                "email": db_email,
-                "function": db_function,
-                "plant_name": plant_name,
-                "dept_name": dept_name,
-                "manager_email": manager_email,
-                "code": db_code,
-            }
+            "auditee": profile,
         }
 
     except Exception as e:
-        if conn:
-            conn.close()
         # Keep 200 so the assistant handles uniformly
         return {"ok": False, "today": today_iso(), "reason": f"Server error: {e}"}
 
 # ----------------------
 # 4) POST /auditees (create or update full profile)
 # ----------------------
-@app.post("/auditees", response_model=AuditeeCreateOut, status_code=200)
+# Single round trip: relies on the unique index on lower(email) (migration 005).
+# A NULL field keeps the stored value (COALESCE), the email spelling of the
+# first registration is kept.
+AUDITEE_UPSERT_SQL = """
+    INSERT INTO auditees (
+        first_name, email, "function",
+        plant_name, dept_name, manager_email
+    )
+    VALUES %s
+    ON CONFLICT ((lower(email))) DO UPDATE
+    SET first_name = COALESCE(EXCLUDED.first_name, auditees.first_name),
+        "function" = COALESCE(EXCLUDED."function", auditees."function"),
+        plant_name = COALESCE(EXCLUDED.plant_name, auditees.plant_name),
+        dept_name = COALESCE(EXCLUDED.dept_name, auditees.dept_name),
+        manager_email = COALESCE(EXCLUDED.manager_email, auditees.manager_email)
+    RETURNING id, first_name, email, "function",
+              plant_name, dept_name, manager_email
+"""
+
+def _auditee_values(payload: AuditeeCreateIn):
+    # Normalize inputs (preserve first_name spelling, just trim spaces)
+    return (
+        payload.first_name.strip(),
+        payload.email.strip(),
+        payload.function.strip() if payload.function else None,
+        payload.plant_name.strip() if payload.plant_name else None,
+        payload.dept_name.strip() if payload.dept_name else None,
+        payload.manager_email.strip() if payload.manager_email else None,
+    )
+
+def _auditee_out(row):
+    (aid, first_name, email, function, plant_name, dept_name, manager_email) = row
+    return {
+        "id": aid,
+        "first_name": first_name,
+        "email": email,
+        "function": function,
+        "plant_name": plant_name,
+        "dept_name": dept_name,
+        "manager_email": manager_email,
+    }
+
+@router.post("/auditees", response_model=AuditeeCreateOut, status_code=200)
 def create_or_update_auditee(payload: AuditeeCreateIn):
     """
     Upsert rule:
@@ -277,98 +473,19 @@ def create_or_update_auditee(payload: AuditeeCreateIn):
     try:
         conn = get_connection()
         cur = conn.cursor()
-
-        # Normalize inputs (preserve first_name spelling, just trim spaces)
-        email_val = payload.email.strip()
-        first_name_val = payload.first_name.strip()
-        function_val = payload.function.strip() if payload.function else None
-        plant_name_val = payload.plant_name.strip() if payload.plant_name else None
-        dept_name_val = payload.dept_name.strip() if payload.dept_name else None
-        manager_email_val = payload.manager_email.strip() if payload.manager_email else None
-
-        # Exists?
-        cur.execute(
-            """
-            SELECT id FROM auditees
-            WHERE lower(email) = lower(%s)
-            LIMIT 1
-            """,
-            (email_val,),
-        )
-        hit = cur.fetchone()
-
-        if hit:
-            aid = hit[0]
-            cur.execute(
-                """
-                UPDATE auditees
-                SET first_name = COALESCE(%s, first_name),
-                    "function" = COALESCE(%s, "function"),
-                    plant_name = COALESCE(%s, plant_name),
-                    dept_name = COALESCE(%s, dept_name),
-                    manager_email = COALESCE(%s, manager_email)
-                WHERE id = %s
-                RETURNING id, first_name, email, "function",
-                          plant_name, dept_name, manager_email
-                """,
-                (
-                    first_name_val,
-                    function_val,
-                    plant_name_val,
-                    dept_name_val,
-                    manager_email_val,
-                    aid,
-                ),
-            )
-            row = cur.fetchone()
-        else:
-            cur.execute(
-                """
-                INSERT INTO auditees (
-                    first_name, email, "function",
-                    plant_name, dept_name, manager_email
-                )
-                VALUES (%s, %s, %s, %s, %s, %s)
-                RETURNING id, first_name, email, "function",
-                          plant_name, dept_name, manager_email
-                """,
-                (
-                    first_name_val,
-                    email_val,
-                    function_val,
-                    plant_name_val,
-                    dept_name_val,
-                    manager_email_val,
-                ),
-            )
-            row = cur.fetchone()
-
+        values = _auditee_values(payload)
+        row = psycopg2.extras.execute_values(cur, AUDITEE_UPSERT_SQL, [values], fetch=True)[0]
+        invalidation.notify(cur, "auditees", [auth_cache.email_key(values[1])])
         conn.commit()
         cur.close()
         conn.close()
-
-        (
-            aid,
-            first_name,
-            email,
-            function,
-            plant_name,
-            dept_name,
-            manager_email,
-        ) = row
+        conn = None
+        auth_cache.invalidate_auditee(values[1])
 
         return {
             "ok": True,
             "today": today_iso(),
-            "auditee": {
-                "id": aid,
-                "first_name": first_name,
-                "email": email,
-                "function": function,
-                "plant_name": plant_name,
-                "dept_name": dept_name,
-                "manager_email": manager_email,
-            },
+            "auditee": _auditee_out(row),
         }
 
     except Exception:
@@ -377,10 +494,56 @@ def create_or_update_auditee(payload: AuditeeCreateIn):
             conn.close()
         raise HTTPException(status_code=500, detail="Failed to upsert auditee.")
 
+# ----------------------
+# 4b) POST /auditees/bulk (roster import: whole plant staff list in one statement)
+# ----------------------
+@router.post("/auditees/bulk", response_model=AuditeesBulkOut, status_code=200)
+def bulk_upsert_auditees(payload: AuditeesBulkIn):
+    """
+    Same upsert rule as POST /auditees for every entry, in one INSERT ... ON CONFLICT.
+    Entries sharing an email (case-insensitive) are merged first, later non-null
+    fields winning, exactly as if they had been posted one after the other.
+    """
+    merged = {}
+    for item in payload.auditees:
+        values = _auditee_values(item)
+        key = values[1].lower()
+        prev = merged.get(key)
+        if prev:
+            values = tuple(new if new is not None else old for new, old in zip(values, prev))
+            values = values[:1] + (prev[1],) + values[2:]
+        merged[key] = values
+
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        # Sorted so concurrent imports lock the rows they share in the same order (no deadlock)
+        rows = psycopg2.extras.execute_values(
+            cur, AUDITEE_UPSERT_SQL, [merged[key] for key in sorted(merged)], page_size=len(merged), fetch=True
+        )
+        invalidation.notify(cur, "auditees", list(merged))
+        conn.commit()
+        cur.close()
+        conn.close()
+        conn = None
+        for key in merged:
+            auth_cache.invalidate_auditee(key)
+
+        by_email = {r[2].lower(): r for r in rows}
+        out = [_auditee_out(by_email[key]) for key in merged if key in by_email]
+        return {"ok": True, "today": today_iso(), "count": len(out), "auditees": out}
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to import auditees: {e}")
+
 # ----------------------
 # 5) POST /questions/bulk
 # ----------------------
-@app.post("/questions/bulk")
+@router.post("/questions/bulk")
 def questions_bulk_upsert(payload: QuestionsBulkIn):
     """
     For each question in order, if (version_tag, text) exists => return existing question_id,
@@ -414,10 +577,12 @@ def questions_bulk_upsert(payload: QuestionsBulkIn):
 
             out_items.append({"index": idx, "question_id": qid})
 
+        invalidation.notify(cur, "questions", [payload.version_tag])
         conn.commit()
         cur.close()
         conn.close()
         conn = None
+        catalog.questions.invalidate(payload.version_tag)
         return {"ok": True, "version_tag": payload.version_tag, "items": out_items}
 
     except Exception as e:
@@ -426,10 +591,92 @@ def questions_bulk_upsert(payload: QuestionsBulkIn):
             conn.close()
         raise HTTPException(status_code=500, detail=f"Failed to upsert questions: {e}")
 
+# ----------------------
+# 5b) POST /audits/start (idempotent on external_id, returns the questionnaire)
+# ----------------------
+AUDIT_COLUMNS = "id, auditee_id, type, status, started_at, questionnaire_version, external_id"
+
+@router.post("/audits/start", response_model=AuditStartOut)
+def start_audit(payload: AuditStartIn):
+    """
+    Create an audit, or return the existing one when external_id was already used
+    (client retries). Without questionnaire_version the latest version_tag is used.
+    The questions of that version are returned so the client needs no second call.
+    """
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+
+        # Insert, or fall through to the existing row, in one statement
+        cur.execute(f"""
+            WITH ins AS (
+                INSERT INTO audits (auditee_id, type, status, started_at, questionnaire_version, external_id)
+                VALUES (
+                    %s, %s, 'in_progress', now(),
+                    COALESCE(%s, (SELECT version_tag FROM questions
+                                   WHERE version_tag IS NOT NULL
+                                   ORDER BY created_at DESC, question_id DESC
+                                   LIMIT 1)),
+                    %s
+                )
+                ON CONFLICT (external_id) WHERE external_id IS NOT NULL DO NOTHING
+                RETURNING {AUDIT_COLUMNS}, true AS created
+            )
+            SELECT * FROM ins
+            UNION ALL
+            SELECT {AUDIT_COLUMNS}, false FROM audits
+             WHERE external_id = %s AND NOT EXISTS (SELECT 1 FROM ins)
+        """, (
+            payload.auditee_id, payload.type, payload.questionnaire_version,
+            payload.external_id, payload.external_id,
+        ))
+        row = cur.fetchone()
+        if row is None:
+            # Lost a race with a concurrent request carrying the same external_id:
+            # its row was committed after this statement's snapshot.
+            cur.execute(f"SELECT {AUDIT_COLUMNS}, false FROM audits WHERE external_id = %s",
+                        (payload.external_id,))
+            row = cur.fetchone()
+
+        (aid, auditee_id, audit_type, status, started_at, version, external_id, created) = row
+
+        questions = _questions_for_version(cur, version)
+
+        conn.commit()
+        cur.close()
+        conn.close()
+        conn = None
+        return {
+            "ok": True,
+            "created": created,
+            "audit": {
+                "id": aid,
+                "auditee_id": auditee_id,
+                "type": audit_type,
+                "status": status,
+                "started_at": started_at,
+                "questionnaire_version": version,
+                "external_id": external_id,
+            },
+            "questions": questions,
+        }
+
+    except psycopg2.errors.ForeignKeyViolation:
+        if conn:
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=404, detail="Auditee not found")
+    except Exception as e:
+        if conn:
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to start audit: {e}")
+
 # ----------------------
 # 6) POST /audits/{audit_id}/answers (UPDATED - with image upload)
 # ----------------------
-@app.post("/audits/{audit_id}/answers")
+@router.post("/audits/{audit_id}/answers")
 async def save_answer(
     audit_id: int,
     question_id: int = Form(...),
@@ -443,30 +690,36 @@ async def save_answer(
     Now accepts multipart/form-data instead of JSON.
     If evidence_image is provided, it will be saved to uploads folder.
     """
+    content = None
+    file_ext = None
+    if evidence_image and evidence_image.filename:
+        # Validate file type (images only)
+        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+        file_ext = os.path.splitext(evidence_image.filename)[1].lower()
+        
+        if file_ext not in allowed_extensions:
+            raise HTTPException(
+                status_code=400, 
+                detail=f"Invalid file type. Allowed: {', '.join(allowed_extensions)}"
+            )
+        content = await evidence_image.read()
+
+    # Disk and database work block: run them in the threadpool, not on the event loop
+    return await run_in_threadpool(
+        _store_answer, audit_id, question_id, response_text, is_compliant, attempt_number, content, file_ext
+    )
+
+
+def _store_answer(audit_id, question_id, response_text, is_compliant, attempt_number, content, file_ext):
     conn = None
     evidence_filename = None
     
     try:
-        # Handle file upload if provided
-        if evidence_image and evidence_image.filename:
-            # Validate file type (images only)
-            allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-            file_ext = os.path.splitext(evidence_image.filename)[1].lower()
-            
-            if file_ext not in allowed_extensions:
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Invalid file type. Allowed: {', '.join(allowed_extensions)}"
-                )
-            
+        if content is not None:
             # Generate unique filename to avoid conflicts
             unique_filename = f"{uuid.uuid4()}{file_ext}"
-            file_path = UPLOAD_DIR / unique_filename
-            
-            # Save file to disk
-            with open(file_path, "wb") as f:
-                content = await evidence_image.read()
-                f.write(content)
+            storage.backend.put(unique_filename, content, _evidence_media_type(unique_filename))
+            metrics.upload_bytes.inc(len(content), "/audits/{audit_id}/answers")
             
             evidence_filename = unique_filename
         
@@ -475,14 +728,7 @@ async def save_answer(
         cur = conn.cursor()
 
         # Try update first (unique key: audit_id, question_id, attempt_number)
-        cur.execute("""
-            UPDATE answers
-               SET response_text = %s,
-                   is_compliant = %s,
-                   evidence_filename = %s
-             WHERE audit_id = %s AND question_id = %s AND attempt_number = %s
-         RETURNING answer_id
-        """, (
+        statements.execute(cur, "answer_update", (
             response_text, is_compliant, evidence_filename,
             audit_id, question_id, attempt_number
         ))
@@ -490,21 +736,30 @@ async def save_answer(
 
         if not row:
             # Insert new answer if doesn't exist
-            cur.execute("""
-                INSERT INTO answers (
-                    audit_id, question_id, response_text, 
-                    is_compliant, attempt_number, evidence_filename, created_at
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, now())
-                RETURNING answer_id
-            """, (
+            statements.execute(cur, "answer_insert", (
                 audit_id, question_id, response_text,
                 is_compliant, attempt_number, evidence_filename
             ))
             row = cur.fetchone()
 
-        conn.commit()
         answer_id = row[0]
+        if events.watched(cur, audit_id):
+            # Subscribers may be on any worker: the event and the running score
+            # (one job per audit however many answers arrive) go through Postgres
+            events.notify(cur, audit_id, "answer", {
+                "answer_id": answer_id,
+                "audit_id": audit_id,
+                "question_id": question_id,
+                "response_text": response_text,
+                "is_compliant": is_compliant,
+                "attempt_number": attempt_number,
+                "evidence_filename": evidence_filename,
+                "evidence_url": f"/audits/answers/{answer_id}/evidence" if evidence_filename else None,
+            })
+            jobs.enqueue(cur, "audit.score", {"audit_id": audit_id}, priority=10,
+                         dedupe_key=f"audit.score:{audit_id}")
+        conn.commit()
+
         cur.close()
         conn.close()
         conn = None
@@ -515,30 +770,26 @@ async def save_answer(
             "evidence_filename": evidence_filename
         }
 
-    except HTTPException:
-        raise
     except Exception as e:
         if conn:
             conn.rollback()
             conn.close()
         # Clean up uploaded file if database operation failed
         if evidence_filename:
-            file_path = UPLOAD_DIR / evidence_filename
-            if file_path.exists():
-                file_path.unlink()
+            storage.discard(evidence_filename)
         raise HTTPException(status_code=500, detail=f"Failed to save answer: {e}")
 
 # ----------------------
 # 6b) GET /audits/answers/{answer_id}/evidence (NEW - retrieve evidence image)
 # ----------------------
-@app.get("/audits/answers/{answer_id}/evidence")
+@router.get("/audits/answers/{answer_id}/evidence")
 def get_evidence_image(answer_id: int):
     """
     Download the evidence image for a specific answer.
     """
     conn = None
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
         
         cur.execute("""
@@ -550,21 +801,36 @@ def get_evidence_image(answer_id: int):
         row = cur.fetchone()
         cur.close()
         conn.close()
+        conn = None
         
         if not row or not row[0]:
             raise HTTPException(status_code=404, detail="No evidence image found for this answer")
         
         filename = row[0]
-        file_path = UPLOAD_DIR / filename
-        
-        if not file_path.exists():
+        media_type = _evidence_media_type(filename)
+
+        # Object store: the client downloads it directly
+        url = storage.backend.presigned_url(filename, filename, media_type)
+        if url:
+            return RedirectResponse(url, status_code=307)
+
+        file_path = storage.backend.local_path(filename)
+        if file_path:
+            # Return the image file
+            return FileResponse(
+                path=file_path,
+                media_type=media_type,
+                filename=filename
+            )
+
+        try:
+            chunks = storage.backend.open(filename)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="Evidence file not found on server")
-        
-        # Return the image file
-        return FileResponse(
-            path=file_path,
-            media_type=f"image/{os.path.splitext(filename)[1][1:]}",
-            filename=filename
+        return StreamingResponse(
+            chunks,
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
         )
     
     except HTTPException:
@@ -577,7 +843,7 @@ def get_evidence_image(answer_id: int):
 # ----------------------
 # 7) GET /audits/{audit_id}/answers (UPDATED - includes evidence info)
 # ----------------------
-@app.get("/audits/{audit_id}/answers")
+@router.get("/audits/{audit_id}/answers")
 def get_answers(audit_id: int):
     """
     Get all answers for a given audit_id, linked with the auditee.
@@ -585,7 +851,7 @@ def get_answers(audit_id: int):
     """
     conn = None
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
 
         # CORRECTION: au.id au lieu de au.audit_id
@@ -612,9 +878,9 @@ def get_answers(audit_id: int):
         conn.close()
         conn = None
 
-        answers = []
+        answers: List[AnswerRow] = []
         for r in rows:
-            answer_data = {
+            answer_data: AnswerRow = {
                 "answer_id": r[0],
                 "audit_id": r[1],
                 "question_text": r[2],
@@ -622,7 +888,7 @@ def get_answers(audit_id: int):
                 "is_compliant": r[4],
                 "attempt_number": r[5],
                 "evidence_filename": r[6],
-                "created_at": r[7].isoformat() if r[7] else None,
+                "created_at": r[7],
                 "auditee_id": r[8],
                 "auditee_name": r[9],
             }
@@ -631,17 +897,35 @@ def get_answers(audit_id: int):
                 answer_data["evidence_url"] = f"/audits/answers/{r[0]}/evidence"
             answers.append(answer_data)
 
-        return {"ok": True, "audit_id": audit_id, "count": len(answers), "answers": answers}
+        return FastJSONResponse({"ok": True, "audit_id": audit_id, "count": len(answers), "answers": answers})
 
     except Exception as e:
         if conn:
             conn.close()
         raise HTTPException(status_code=500, detail=f"Failed to fetch answers: {e}")
 
+# ----------------------
+# 7b) GET /audits/{audit_id}/events (live progress, see events.py)
+# ----------------------
+@router.get("/audits/{audit_id}/events")
+async def audit_events(audit_id: int, request: Request):
+    """
+    Server-Sent Events stream of answer, nonconformity, score and completed
+    events as they are committed. Load /audits/{audit_id}/answers once, then
+    apply events; on a "reset" event, load it again.
+    """
+    # Writers on every worker check audit_watchers before sending events
+    await run_in_threadpool(events.watchers.add, audit_id)
+    return StreamingResponse(
+        events.broker.stream(audit_id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ----------------------
 # 8) POST /audits/{audit_id}/nonconformities
 # ----------------------
-@app.post("/audits/{audit_id}/nonconformities")
+@router.post("/audits/{audit_id}/nonconformities")
 def save_nc(audit_id: int, payload: NonConformityIn):
     conn = None
     try:
@@ -660,6 +944,8 @@ def save_nc(audit_id: int, payload: NonConformityIn):
             payload.responsible_id, payload.due_date, payload.evidence_url, payload.closed_at, payload.closure_comment
         ))
         nc_id = cur.fetchone()[0]
+        if events.watched(cur, audit_id):
+            events.notify(cur, audit_id, "nonconformity", {"nc_id": nc_id, "audit_id": audit_id, **payload.model_dump()})
         conn.commit()
         cur.close()
         conn.close()
@@ -675,7 +961,7 @@ def save_nc(audit_id: int, payload: NonConformityIn):
 # ----------------------
 # 9) POST /audits/{audit_id}/complete
 # ----------------------
-@app.post("/audits/{audit_id}/complete")
+@router.post("/audits/{audit_id}/complete")
 def complete_audit(audit_id: int, payload: CompleteAuditIn):
     conn = None
     try:
@@ -684,24 +970,6 @@ def complete_audit(audit_id: int, payload: CompleteAuditIn):
 
         score_value = payload.score_global
 
-        if score_value is None:
-            # compute % compliant questions: any attempt true per question
-            cur.execute("""
-                WITH per_q AS (
-                  SELECT question_id, bool_or(is_compliant) AS compliant
-                    FROM answers
-                   WHERE audit_id = %s
-                GROUP BY question_id
-                )
-                SELECT
-                  COALESCE(SUM(CASE WHEN compliant THEN 1 ELSE 0 END),0)::float,
-                  COALESCE(COUNT(*),0)::float
-                FROM per_q
-            """, (audit_id,))
-            srow = cur.fetchone()
-            numer, denom = (srow or (0.0, 0.0))
-            score_value = round((numer / denom) * 100.0, 2) if denom > 0 else 0.0
-
         cur.execute("""
             UPDATE audits
                SET status = 'completed',
@@ -711,24 +979,36 @@ def complete_audit(audit_id: int, payload: CompleteAuditIn):
          RETURNING id, status, ended_at, score_global
         """, (score_value, audit_id))
         row = cur.fetchone()
-        conn.commit()
 
         if not row:
+            conn.rollback()
             cur.close()
             conn.close()
+            conn = None
             raise HTTPException(status_code=404, detail="Audit not found")
 
         (aid, status, ended_at, score_global) = row
-        cur.close()
-        conn.close()
-        conn = None
-        return {
+        result = {
             "id": aid,
             "status": status,
             "ended_at": ended_at,
             "score_global": float(score_global) if score_global is not None else None
         }
+        if score_value is None:
+            # % compliant questions, computed by a job (tasks.score_audit), which then
+            # fills score_global and sends the "completed" event
+            result["score_job_id"] = jobs.enqueue(
+                cur, "audit.score", {"audit_id": audit_id, "complete": True}, priority=10)
+        elif events.watched(cur, audit_id):
+            events.notify(cur, audit_id, "completed", result)
+        conn.commit()
+        cur.close()
+        conn.close()
+        conn = None
+        return result
 
+    except HTTPException:
+        raise
     except Exception as e:
         if conn:
             conn.rollback()
@@ -736,66 +1016,201 @@ def complete_audit(audit_id: int, payload: CompleteAuditIn):
         raise HTTPException(status_code=500, detail=f"Failed to complete audit: {e}")
 
 # ----------------------
-# 10) GET /objections
+# 9b) POST /action-plan (see openapi.yaml)
 # ----------------------
-@app.get("/objections", response_model=list[ObjectionOut])
-def get_objections(
-    category: str | None = Query(None, description="Filter by category (e.g. 'Lead Time', 'MOQ')"),
-    q: str | None = Query(None, description="Full-text search in concern/argument/response"),
-    limit: int = Query(100, ge=1, le=1000),
-    offset: int = Query(0, ge=0),
-):
+@router.post("/action-plan", response_model=ActionPlanOut)
+def store_action_plan(payload: ActionPlan):
+    """Store a GPT-generated action plan; all steps go in one multi-row INSERT."""
     conn = None
     try:
-        conn = get_connection_sales()
-        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-        sql = """
-            SELECT id, customer_concern, example_customer_argument, recommended_response, category
-            FROM customer_objection_handling
-            WHERE 1=1
-        """
-        params: list = []
-
-        if category:
-            sql += " AND category = %s"
-            params.append(category)
-
-        if q:
-            like = f"%{q}%"
-            sql += """
-                AND (
-                    customer_concern ILIKE %s OR
-                    example_customer_argument ILIKE %s OR
-                    recommended_response ILIKE %s
-                )
-            """
-            params.extend([like, like, like])
+        conn = get_connection()
+        cur = conn.cursor()
 
-        sql += " ORDER BY id LIMIT %s OFFSET %s"
-        params.extend([limit, offset])
+        cur.execute("""
+            INSERT INTO action_plans (title, owner, deadline, nc_id, created_at)
+            VALUES (%s, %s, %s, %s, now())
+            RETURNING id
+        """, (payload.title, payload.owner, payload.deadline, payload.nc_id))
+        plan_id = cur.fetchone()[0]
+
+        if payload.steps:
+            psycopg2.extras.execute_values(
+                cur,
+                """
+                INSERT INTO action_plan_steps (action_plan_id, position, description, due_date)
+                VALUES %s
+                """,
+                [(plan_id, pos, step.description, step.due_date) for pos, step in enumerate(payload.steps, 1)],
+                page_size=len(payload.steps),
+            )
 
-        cur.execute(sql, params)
-        rows = cur.fetchall()
+        conn.commit()
         cur.close()
         conn.close()
-        return rows
+        conn = None
+        return {"ok": True, "action_plan_id": plan_id, "step_count": len(payload.steps), "nc_id": payload.nc_id}
 
+    except psycopg2.errors.ForeignKeyViolation:
+        if conn:
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=404, detail="Non-conformity not found")
     except Exception as e:
         if conn:
+            conn.rollback()
             conn.close()
-        raise HTTPException(status_code=500, detail=f"Failed to fetch objections: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to store action plan: {e}")
 
 # ----------------------
-# 11) GET /matrix
+# 9c) PUT /action-plan/{action_plan_id}/nonconformity (link / unlink an NC)
 # ----------------------
-@app.get("/matrix", response_model=list[MatrixOut])
+@router.put("/action-plan/{action_plan_id}/nonconformity")
+def link_action_plan(action_plan_id: int, payload: ActionPlanLinkIn):
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE action_plans
+               SET nc_id = %s
+             WHERE id = %s
+         RETURNING id, nc_id
+        """, (payload.nc_id, action_plan_id))
+        row = cur.fetchone()
+        conn.commit()
+        cur.close()
+        conn.close()
+        conn = None
+
+        if not row:
+            raise HTTPException(status_code=404, detail="Action plan not found")
+        return {"ok": True, "action_plan_id": row[0], "nc_id": row[1]}
+
+    except HTTPException:
+        raise
+    except psycopg2.errors.ForeignKeyViolation:
+        if conn:
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=404, detail="Non-conformity not found")
+    except Exception as e:
+        if conn:
+            conn.rollback()
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to link action plan: {e}")
+
+# ----------------------
+# 9d) POST /action-plan/files (base64 attachment)
+# ----------------------
+ACTION_PLAN_PREFIX = "action_plans/"  # storage key prefix
+ACTION_PLAN_MAX_FILE_BYTES = int(os.getenv("ACTION_PLAN_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+BASE64_CHUNK_CHARS = 64 * 1024  # multiple of 4
+
+def _iter_base64_decoded(content: str):
+    """Decode base64 slice by slice so the whole file never sits in memory as bytes."""
+    start = 0
+    if content.startswith("data:"):
+        start = content.find(",") + 1
+    carry = ""
+    for i in range(start, len(content), BASE64_CHUNK_CHARS):
+        part = content[i:i + BASE64_CHUNK_CHARS]
+        # MIME-style base64 may contain line breaks
+        part = carry + "".join(part.split())
+        usable = len(part) - len(part) % 4
+        carry = part[usable:]
+        if usable:
+            yield base64.b64decode(part[:usable], validate=True)
+    if carry:
+        raise ValueError("Truncated base64 content")
+
+@router.post("/action-plan/files", response_model=FileUploadOut)
+def upload_action_plan_file(payload: FileUploadPayload):
+    if len(payload.content) * 3 // 4 > ACTION_PLAN_MAX_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    conn = None
+    key = None
+    try:
+        file_ext = os.path.splitext(payload.filename)[1].lower()[:16]
+        stored_name = f"{uuid.uuid4()}{file_ext}"
+
+        # Nothing is stored if decoding fails part-way
+        size = storage.backend.put(ACTION_PLAN_PREFIX + stored_name, _iter_base64_decoded(payload.content))
+        key = ACTION_PLAN_PREFIX + stored_name
+        metrics.upload_bytes.inc(size, "/action-plan/files")
+
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO action_plan_files (action_plan_id, filename, filetype, stored_name, size_bytes, created_at)
+            VALUES (%s, %s, %s, %s, %s, now())
+            RETURNING id
+        """, (payload.action_plan_id, payload.filename, payload.filetype, stored_name, size))
+        file_id = cur.fetchone()[0]
+        conn.commit()
+        cur.close()
+        conn.close()
+        conn = None
+        return {
+            "ok": True,
+            "file_id": file_id,
+            "action_plan_id": payload.action_plan_id,
+            "filename": payload.filename,
+            "size_bytes": size,
+        }
+
+    except Exception as e:
+        if conn:
+            conn.rollback()
+            conn.close()
+        # Clean up the stored file if the database operation failed
+        if key:
+            storage.discard(key)
+        if isinstance(e, ValueError):
+            raise HTTPException(status_code=400, detail=f"Invalid base64 content: {e}")
+        if isinstance(e, psycopg2.errors.ForeignKeyViolation):
+            raise HTTPException(status_code=404, detail="Action plan not found")
+        raise HTTPException(status_code=500, detail=f"Failed to store file: {e}")
+
+# ----------------------
+# 10) GET /objections
+# ----------------------
+@router.get("/objections", response_model=list[ObjectionOut])
+def get_objections(
+    category: str | None = Query(None, description="Filter by category (e.g. 'Lead Time', 'MOQ')"),
+    q: str | None = Query(None, description="Full-text search in concern/argument/response"),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+):
+    hit, rows = catalog.objections.get(catalog.objections_key(category, q, limit, offset))
+    if hit:
+        return FastJSONResponse(rows)
+
+    conn = None
+    try:
+        conn = get_read_connection_sales()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        rows = _load_objections(cur, category, q, limit, offset)
+        cur.close()
+        conn.close()
+        conn = None
+        return FastJSONResponse(rows)
+
+    except Exception as e:
+        if conn:
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to fetch objections: {e}")
+
+# ----------------------
+# 11) GET /matrix
+# ----------------------
+@router.get("/matrix", response_model=list[MatrixOut])
 def get_matrix():
     raise HTTPException(status_code=500, detail="Failed to fetch matrix: not implemented")
 # ----------------------
 # 12) GET /auditees/audits-by-name (NEW - Get all audits and answers by auditee name)
 # ----------------------
-@app.get("/auditees/audits-by-name")
+@router.get("/auditees/audits-by-name")
 def get_audits_by_auditee_name(
     name: str = Query(..., description="Auditee first name (case-insensitive, partial match)")
 ):
@@ -806,7 +1221,7 @@ def get_audits_by_auditee_name(
     """
     conn = None
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
 
         # Step 1: Find auditees matching the name (case-insensitive, partial match)
@@ -822,6 +1237,7 @@ def get_audits_by_auditee_name(
         if not auditees:
             cur.close()
             conn.close()
+            conn = None
             return {
                 "ok": False,
                 "auditee_name": name,
@@ -873,9 +1289,9 @@ def get_audits_by_auditee_name(
                 
                 answer_rows = cur.fetchall()
                 
-                answers_list = []
+                answers_list: List[AuditAnswerRow] = []
                 for ans in answer_rows:
-                    answer_data = {
+                    answer_data: AuditAnswerRow = {
                         "answer_id": ans[0],
                         "audit_id": ans[1],
                         "question_id": ans[2],
@@ -886,7 +1302,7 @@ def get_audits_by_auditee_name(
                         "is_compliant": ans[7],
                         "attempt_number": ans[8],
                         "evidence_filename": ans[9],
-                        "created_at": ans[10].isoformat() if ans[10] else None,
+                        "created_at": ans[10],
                     }
                     # Add evidence URL if file exists
                     if ans[9]:
@@ -894,12 +1310,12 @@ def get_audits_by_auditee_name(
                     answers_list.append(answer_data)
                 
                 # Build audit object with answers
-                audit_data = {
+                audit_data: AuditWithAnswersRow = {
                     "audit_id": audit_id,
                     "audit_type": audit_type,
                     "status": status,
-                    "started_at": started_at.isoformat() if started_at else None,
-                    "ended_at": ended_at.isoformat() if ended_at else None,
+                    "started_at": started_at,
+                    "ended_at": ended_at,
                     "score_global": float(score_global) if score_global is not None else None,
                     "questionnaire_version": questionnaire_version,
                     "external_id": external_id,
@@ -918,37 +1334,265 @@ def get_audits_by_auditee_name(
         conn.close()
         conn = None
         
-        return {
+        return FastJSONResponse({
             "ok": True,
             "auditee_name": name,
             "total_audits": len(all_audits),
             "audits": all_audits
-        }
+        })
 
     except Exception as e:
         if conn:
             conn.close()
         raise HTTPException(status_code=500, detail=f"Failed to fetch audits by name: {e}")
     
-    # ---------------------------
+# ----------------------
+# 13) Audit PDF reports (rendered in a worker pool, cached per audit version)
+# ----------------------
+def _report_status(audit_id: int, jid: str, state: str, error: Optional[str] = None):
+    return {
+        "audit_id": audit_id,
+        "report_id": jid,
+        "status": state,
+        "status_url": f"/reports/{jid}",
+        "download_url": f"/audits/{audit_id}/report.pdf" if state == "ready" else None,
+        "error": error,
+    }
+
+def _ensure_report(audit_id: int):
+    """Return (job id, state); starts a render when the current version is not cached."""
+    conn = None
+    try:
+        conn = get_connection()
+        cur = conn.cursor()
+        version = reports.report_version(cur, audit_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Audit not found")
+
+        jid = reports.job_id(audit_id, version)
+        state, _ = reports.status(jid)
+        if state not in ("ready", "pending"):
+            data = reports.fetch_report_data(cur, audit_id)
+            reports.submit(audit_id, version, data)
+            state = "pending"
+        cur.close()
+        conn.close()
+        conn = None
+        return jid, state
+    except HTTPException:
+        if conn:
+            conn.close()
+        raise
+    except Exception as e:
+        if conn:
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to prepare report: {e}")
+
+@router.post("/audits/{audit_id}/report", response_model=ReportStatusOut)
+def request_audit_report(audit_id: int):
+    """
+    Start (or reuse) the PDF rendering of an audit.
+    200 when the current version is already rendered, 202 while it renders:
+    poll status_url, then GET download_url.
+    """
+    jid, state = _ensure_report(audit_id)
+    return JSONResponse(status_code=200 if state == "ready" else 202, content=_report_status(audit_id, jid, state))
+
+@router.get("/reports/{report_id}", response_model=ReportStatusOut)
+def get_report_status(report_id: str):
+    try:
+        audit_id, _ = reports.parse_job_id(report_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Report not found")
+    state, error = reports.status(report_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return _report_status(audit_id, report_id, state, error)
+
+@router.get("/audits/{audit_id}/report.pdf")
+def download_audit_report(audit_id: int):
+    """The PDF when the current version is rendered, else 202 + status (render started)."""
+    jid, state = _ensure_report(audit_id)
+    if state == "ready":
+        _, version = reports.parse_job_id(jid)
+        return FileResponse(
+            path=reports.report_path(audit_id, version),
+            media_type="application/pdf",
+            filename=f"audit-{audit_id}.pdf",
+        )
+    return JSONResponse(
+        status_code=202,
+        content=_report_status(audit_id, jid, state),
+        headers={"Location": f"/reports/{jid}", "Retry-After": "2"},
+    )
+
+# ----------------------
+# 14) GET /sync/changes (delta feed, see migrations/008_change_tracking.sql)
+# ----------------------
+# (kind, response key / table, primary key, columns); kind orders tables within one transaction
+_SYNC_TABLES = (
+    (1, "audits", "id",
+     ("id", "auditee_id", "type", "status", "started_at", "ended_at", "score_global",
+      "questionnaire_version", "external_id")),
+    (2, "answers", "answer_id",
+     ("answer_id", "audit_id", "question_id", "response_text", "is_compliant",
+      "attempt_number", "evidence_filename", "created_at")),
+    (3, "non_conformities", "nc_id",
+     ("nc_id", "audit_id", "question_id", "description", "severity", "status", "responsible_id",
+      "due_date", "evidence_url", "closed_at", "closure_comment", "detected_at")),
+)
+
+def _parse_sync_cursor(value: str):
+    """'<xid>' (everything from that transaction on) or '<xid>-<kind>-<id>' (after that row)."""
+    parts = value.split("-")
+    if len(parts) not in (1, 3) or not all(p.isdigit() for p in parts):
+        raise ValueError(value)
+    if len(parts) == 1:
+        return int(parts[0]), 0, 0
+    return tuple(int(p) for p in parts)
+
+@router.get("/sync/changes", response_model=SyncChangesOut)
+def sync_changes(
+    since: str = Query("0", description="cursor from the previous response; 0 for a full sync"),
+    limit: int = Query(1000, ge=1, le=10000),
+    audit_id: Optional[int] = Query(None, description="only this audit, its answers and NCs"),
+):
+    """
+    Audits, answers and non-conformities inserted or updated after `since`,
+    oldest change first. Call again with the returned cursor while has_more
+    is true; keep the last cursor for the next sync. A row changed several
+    times is returned once, in its current state.
+    """
+    try:
+        cx, ck, cid = _parse_sync_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    conn = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor()
+        # Transactions below xmin have all finished: nothing can still appear under it
+        cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text")
+        until = int(cur.fetchone()[0])
+
+        changes = []
+        for kind, table, pk, columns in _SYNC_TABLES:
+            if kind > ck:
+                where, params = "change_xid >= %s::xid8", [str(cx)]
+            elif kind == ck:
+                where, params = f"(change_xid, {pk}) > (%s::xid8, %s)", [str(cx), cid]
+            else:
+                where, params = "change_xid > %s::xid8", [str(cx)]
+            if audit_id is not None:
+                where += f" AND {'id' if table == 'audits' else 'audit_id'} = %s"
+                params.append(audit_id)
+            cur.execute(f"""
+                SELECT change_xid::text AS xid, {", ".join(columns)}
+                FROM {table}
+                WHERE {where} AND change_xid < %s::xid8
+                ORDER BY change_xid, {pk}
+                LIMIT %s
+            """, (*params, str(until), limit + 1))
+            for r in cur.fetchall():
+                changes.append((int(r[0]), kind, r[1], table, dict(zip(columns, r[1:]))))
+        cur.close()
+        conn.close()
+        conn = None
+
+        changes.sort(key=lambda c: c[:3])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if has_more:
+            xid, kind, key = changes[-1][:3]
+            cursor = f"{xid}-{kind}-{key}"
+        else:
+            # Caught up to the bound (never move back, e.g. on a lagging replica)
+            cursor = str(until) if until > cx else since
+
+        result = {"cursor": cursor, "has_more": has_more, "audits": [], "answers": [], "non_conformities": []}
+        for _, _, _, table, row in changes:
+            result[table].append(row)
+        return FastJSONResponse(result)
+
+    except Exception as e:
+        if conn:
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to fetch changes: {e}")
+
+# ----------------------
+# 15) GET /jobs/stats (background job queue, see jobs.py)
+# ----------------------
+@router.get("/jobs/stats", response_model=JobStatsOut)
+def job_stats():
+    conn = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("""
+            SELECT type,
+                   count(*) FILTER (WHERE status = 'queued' AND run_after <= now()) AS queued,
+                   count(*) FILTER (WHERE status = 'queued' AND run_after > now()) AS delayed,
+                   count(*) FILTER (WHERE status = 'running') AS running,
+                   count(*) FILTER (WHERE status = 'failed') AS failed,
+                   count(*) FILTER (WHERE status = 'done'
+                                      AND finished_at > now() - interval '5 minutes') AS done_last_5m,
+                   count(*) FILTER (WHERE status = 'failed'
+                                      AND finished_at > now() - interval '5 minutes') AS failed_last_5m,
+                   EXTRACT(epoch FROM now() - min(run_after) FILTER (
+                       WHERE status = 'queued' AND run_after <= now()))::float AS oldest_queued_seconds
+              FROM jobs
+             WHERE status IN ('queued', 'running', 'failed')
+                OR finished_at > now() - interval '5 minutes'
+             GROUP BY type
+             ORDER BY type
+        """)
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+        conn = None
+        return FastJSONResponse({"types": rows})
+
+    except Exception as e:
+        if conn:
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to fetch job stats: {e}")
+
+# ---------------------------
 # Save conversation
 # ---------------------------
-@app.post("/save-conversation", response_model=ConversationOut)
-def save_conversation(payload: ConversationIn):
+@router.post("/save-conversation", response_model=ConversationOut)
+def save_conversation(
+    payload: ConversationIn,
+    wait: bool = Query(True, description="Buffered mode: wait for the batch flush (false = return a ticket immediately)"),
+):
+    if ingest.buffer:
+        ticket = ingest.buffer.submit(
+            payload.user_name.strip(), payload.conversation,
+            payload.date_conversation, payload.assistant_name,
+        )
+        result = ingest.buffer.wait(ticket, timeout=10.0) if wait else None
+        if result and result["status"] == "ok":
+            return ConversationOut(id=result["id"], status="ok", ticket=ticket)
+        if result and result["status"] == "failed":
+            return ConversationOut(status="failed", ticket=ticket, error=result["error"])
+        return ConversationOut(status="queued", ticket=ticket)
+
     conn = None
     try:
         conn = get_connection()
         cur = conn.cursor()
         date_conv = payload.date_conversation or datetime.now(timezone.utc)
-        cur.execute(
-            """
-            INSERT INTO conversations (user_name, conversation, date_conversation, assistant_name)
-            VALUES (%s, %s, %s, %s)
-            RETURNING id;
-            """,
-            (payload.user_name.strip(), payload.conversation, date_conv, payload.assistant_name),
+        # Large transcripts are stored zstd-compressed; their search_vector is
+        # built from the plain text here since the trigger cannot read it.
+        conv_text, conv_zstd = encode_conversation(payload.conversation)
+        search_text = payload.conversation if conv_zstd is not None else None
+        statements.execute(
+            cur, "conversation_insert",
+            (payload.user_name.strip(), conv_text, conv_zstd, search_text, date_conv, payload.assistant_name),
         )
         new_id = cur.fetchone()[0]
+        rollups.record(cur, [(date_conv, payload.assistant_name, payload.user_name.strip(), len(payload.conversation))])
         conn.commit()
         cur.close()
         conn.close()
@@ -960,9 +1604,67 @@ def save_conversation(payload: ConversationIn):
             conn.close()
         raise HTTPException(status_code=500, detail=f"Insertion failed: {e}")
 # ---------------------------
+# Poll a buffered save-conversation ticket
+# ---------------------------
+@router.get("/save-conversation/{ticket}", response_model=ConversationOut)
+def get_save_conversation_ticket(ticket: str):
+    try:
+        ticket = str(uuid.UUID(ticket))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ticket")
+
+    result = ingest.buffer.status(ticket) if ingest.buffer else None
+    if result and result["status"] == "ok":
+        return ConversationOut(id=result["id"], status="ok", ticket=ticket)
+    if result and result["status"] == "failed":
+        return ConversationOut(status="failed", ticket=ticket, error=result["error"])
+    try:
+        new_id = ingest.lookup_ticket(ticket)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+    if new_id is not None:
+        return ConversationOut(id=new_id, status="ok", ticket=ticket)
+    if result:
+        return ConversationOut(status="queued", ticket=ticket)
+    raise HTTPException(status_code=404, detail="Unknown ticket")
+# ---------------------------
+# Shared conversation filters (date / user_name / assistant_name)
+# ---------------------------
+def _parse_day(value: Optional[str], field: str) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{field} must be YYYY-MM-DD")
+
+def _conversation_filters(date=None, user_name=None, assistant_name=None, date_from=None, date_to=None):
+    """
+    Dates are date objects (UTC days). They are always turned into a half-open
+    range on the raw date_conversation column so the index and monthly
+    partition pruning apply.
+    """
+    where = []
+    params = []
+    if date:
+        date_from = date_to = date
+    if date_from:
+        where.append("date_conversation >= %s")
+        params.append(datetime.combine(date_from, datetime.min.time(), timezone.utc))
+    if date_to:
+        where.append("date_conversation < %s")
+        params.append(datetime.combine(date_to + timedelta(days=1), datetime.min.time(), timezone.utc))
+    if user_name:
+        where.append("LOWER(user_name) LIKE %s")
+        params.append(f"%{user_name.lower()}%")
+    if assistant_name:
+        where.append("LOWER(assistant_name) LIKE %s")
+        params.append(f"%{assistant_name.lower()}%")
+    return where, params
+# ---------------------------
 # List conversations with filters
 # ---------------------------
-@app.get("/conversations")
+@router.get("/conversations")
 def list_conversations(
     date: Optional[str] = Query(None, description="YYYY-MM-DD (UTC)"),
     user_name: Optional[str] = None,
@@ -970,28 +1672,16 @@ def list_conversations(
     limit: int = Query(50, ge=1, le=200),
     offset: int = Query(0, ge=0),
 ):
+    where, params = _conversation_filters(_parse_day(date, "date"), user_name, assistant_name)
     conn = None
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
-        where = []
-        params = []
-        
-        if date:
-            where.append("DATE(date_conversation AT TIME ZONE 'UTC') = %s")
-            params.append(date)
-        if user_name:
-            where.append("LOWER(user_name) LIKE %s")
-            params.append(f"%{user_name.lower()}%")
-        if assistant_name:
-            where.append("LOWER(assistant_name) LIKE %s")
-            params.append(f"%{assistant_name.lower()}%")
-        
         where_sql = ("WHERE " + " AND ".join(where)) if where else ""
         
         cur.execute(
             f"""
-            SELECT id, user_name, date_conversation, conversation, assistant_name
+            SELECT id, user_name, date_conversation, conversation, conversation_zstd, assistant_name
             FROM conversations
             {where_sql}
             ORDER BY date_conversation DESC, id DESC
@@ -1004,37 +1694,323 @@ def list_conversations(
         cur.execute(f"SELECT COUNT(*) FROM conversations {where_sql};", tuple(params))
         total = cur.fetchone()[0]
         
-        items = []
-        for (cid, uname, dconv, conv, aname) in rows:
+        items: List[ConversationSummaryRow] = []
+        for (cid, uname, dconv, conv, conv_zstd, aname) in rows:
+            conv = decode_conversation(conv, conv_zstd)
             preview = (conv[:140] + "...") if len(conv) > 140 else conv
-            items.append(ConversationSummary(
-                id=cid,
-                user_name=uname,
-                date_conversation=dconv,
-                preview=preview,
-                assistant_name=aname
-            ))
+            items.append({
+                "id": cid,
+                "user_name": uname,
+                "date_conversation": dconv,
+                "preview": preview,
+                "assistant_name": aname,
+            })
         
         cur.close()
         conn.close()
         conn = None
-        return {"items": items, "total": total}
+        return FastJSONResponse({"items": items, "total": total})
     except Exception as e:
         if conn:
             conn.close()
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
 # ---------------------------
+# Full-text search in conversations (ranked, with highlighted snippets)
+# ---------------------------
+_HEADLINE_OPTIONS = (
+    'StartSel=<b>, StopSel=</b>, MaxWords=35, MinWords=15, '
+    'MaxFragments=2, FragmentDelimiter=" ... "'
+)
+
+@router.get("/conversations/search", response_model=ConversationSearchOut)
+def search_conversations(
+    q: str = Query(..., min_length=1, description="Search terms (web-search syntax: \"phrase\", or, -exclude)"),
+    date: Optional[str] = Query(None, description="YYYY-MM-DD (UTC)"),
+    user_name: Optional[str] = None,
+    assistant_name: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    where, params = _conversation_filters(_parse_day(date, "date"), user_name, assistant_name)
+    where.insert(0, "search_vector @@ query")
+    conn = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor()
+        where_sql = "WHERE " + " AND ".join(where)
+
+        # Rank + page first, then build headlines only for the returned rows
+        cur.execute(
+            f"""
+            SELECT hit.id, hit.user_name, hit.date_conversation, hit.assistant_name, hit.rank,
+                   ts_headline('simple', c.conversation, hit.query, %s) AS snippet,
+                   c.conversation_zstd,
+                   hit.total_count
+            FROM (
+                SELECT id, user_name, date_conversation, assistant_name, query,
+                       ts_rank_cd(search_vector, query) AS rank,
+                       COUNT(*) OVER() AS total_count
+                FROM conversations, websearch_to_tsquery('simple', %s) AS query
+                {where_sql}
+                ORDER BY rank DESC, date_conversation DESC, id DESC
+                LIMIT %s OFFSET %s
+            ) AS hit
+            JOIN conversations c ON c.id = hit.id
+            ORDER BY hit.rank DESC, hit.date_conversation DESC, hit.id DESC;
+            """,
+            (_HEADLINE_OPTIONS, q, *params, limit, offset),
+        )
+        rows = cur.fetchall()
+
+        # Compressed transcripts: decompress here and headline them in one extra query
+        compressed = [decode_conversation(None, r[6]) for r in rows if r[6] is not None]
+        if compressed:
+            cur.execute(
+                """
+                SELECT ts_headline('simple', t.body, websearch_to_tsquery('simple', %s), %s)
+                FROM unnest(%s::text[]) WITH ORDINALITY AS t(body, n)
+                ORDER BY t.n;
+                """,
+                (q, _HEADLINE_OPTIONS, compressed),
+            )
+            compressed_snippets = iter([r[0] for r in cur.fetchall()])
+
+        items: List[ConversationSearchHitRow] = []
+        total = 0
+        for (cid, uname, dconv, aname, rank, snippet, conv_zstd, tot) in rows:
+            total = tot
+            if conv_zstd is not None:
+                snippet = next(compressed_snippets)
+            items.append({
+                "id": cid,
+                "user_name": uname,
+                "date_conversation": dconv,
+                "assistant_name": aname,
+                "rank": float(rank),
+                "snippet": snippet or "",
+            })
+
+        cur.close()
+        conn.close()
+        conn = None
+        return FastJSONResponse({"items": items, "total": total if rows else 0})
+    except Exception as e:
+        if conn:
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Search failed: {e}")
+# ---------------------------
+# Streaming bulk export (NDJSON / CSV, gzip on the fly)
+# ---------------------------
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE", "500"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_COLUMNS = ["id", "user_name", "assistant_name", "date_conversation", "conversation"]
+
+def _export_chunks(conn, cur, fmt: str, gzip_output: bool):
+    """Yield the export body from a server-side cursor; owns (and closes) conn."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_output else None
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+
+    def take():
+        data = buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+        return compressor.compress(data) if compressor else data
+
+    try:
+        if writer:
+            writer.writerow(EXPORT_COLUMNS)
+        for (cid, uname, aname, dconv, conv, conv_zstd) in cur:
+            conv = decode_conversation(conv, conv_zstd)
+            if writer:
+                writer.writerow([cid, uname, aname or "", dconv.isoformat(), conv])
+            else:
+                buf.write(json_dumps({
+                    "id": cid,
+                    "user_name": uname,
+                    "assistant_name": aname,
+                    "date_conversation": dconv,
+                    "conversation": conv,
+                }).decode("utf-8"))
+                buf.write("\n")
+            if buf.tell() >= EXPORT_CHUNK_BYTES:
+                chunk = take()
+                if chunk:
+                    yield chunk
+        chunk = take()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        cur.close()
+        conn.rollback()
+        conn.close()
+
+@router.get("/conversations/export")
+def export_conversations(
+    request: Request,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (UTC, inclusive)"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD (UTC, inclusive)"),
+    user_name: Optional[str] = None,
+    assistant_name: Optional[str] = None,
+):
+    """
+    Stream every matching conversation, oldest first, with full transcripts.
+    Rows come from a named (server-side) cursor EXPORT_FETCH_SIZE at a time,
+    so memory stays flat regardless of the row count.
+    """
+    where, params = _conversation_filters(
+        user_name=user_name, assistant_name=assistant_name,
+        date_from=_parse_day(date_from, "date_from"), date_to=_parse_day(date_to, "date_to"),
+    )
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+
+    conn = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor(name=f"conversations_export_{uuid.uuid4().hex}")
+        cur.itersize = EXPORT_FETCH_SIZE
+        cur.execute(
+            f"""
+            SELECT id, user_name, assistant_name, date_conversation, conversation, conversation_zstd
+            FROM conversations
+            {where_sql}
+            ORDER BY date_conversation, id;
+            """,
+            tuple(params),
+        )
+    except Exception as e:
+        if conn:
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Export failed: {e}")
+
+    gzip_output = "gzip" in request.headers.get("accept-encoding", "")
+    filename = f"conversations.{format}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+    if gzip_output:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _export_chunks(conn, cur, format, gzip_output),
+        media_type="text/csv" if format == "csv" else "application/x-ndjson",
+        headers=headers,
+    )
+# ---------------------------
+# Conversation usage per assistant (daily rollups, see rollups.py)
+# ---------------------------
+STATS_DEFAULT_DAYS = 30
+
+@router.get("/conversations/stats", response_model=ConversationStatsOut)
+def conversation_stats(
+    date_from: Optional[str] = Query(None, description="YYYY-MM-DD (UTC), default 30 days before date_to"),
+    date_to: Optional[str] = Query(None, description="YYYY-MM-DD (UTC), default today"),
+    assistant_name: Optional[str] = Query(None, description="Exact assistant name"),
+):
+    """Daily conversation counts, average transcript length and active users per assistant."""
+    day_to = _parse_day(date_to, "date_to") or datetime.now(timezone.utc).date()
+    day_from = _parse_day(date_from, "date_from") or day_to - timedelta(days=STATS_DEFAULT_DAYS - 1)
+    if day_from > day_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+
+    where = "day BETWEEN %s AND %s"
+    params = [day_from, day_to]
+    if assistant_name is not None:
+        where += " AND assistant_name = %s"
+        params.append(assistant_name)
+
+    conn = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT s.day, s.assistant_name, s.conversations, s.transcript_chars, u.active_users
+            FROM conversation_daily_stats s
+            JOIN (SELECT day, assistant_name, count(*) AS active_users
+                    FROM conversation_daily_users
+                   WHERE {where}
+                GROUP BY day, assistant_name) u USING (day, assistant_name)
+            WHERE {where}
+            ORDER BY s.day, s.assistant_name
+        """, params + params)
+        days = []
+        totals = {}
+        for day, name, conversations, chars, active_users in cur.fetchall():
+            days.append({
+                "day": day,
+                "assistant_name": name or None,
+                "conversations": conversations,
+                "avg_transcript_chars": round(chars / conversations, 1) if conversations else 0.0,
+                "active_users": active_users,
+            })
+            total = totals.setdefault(name, [0, 0])
+            total[0] += conversations
+            total[1] += chars
+
+        cur.execute(f"""
+            SELECT assistant_name, count(DISTINCT user_name)
+            FROM conversation_daily_users
+            WHERE {where}
+            GROUP BY assistant_name
+        """, params)
+        users = dict(cur.fetchall())
+        cur.close()
+        conn.close()
+        conn = None
+
+        assistants = [
+            {
+                "assistant_name": name or None,
+                "conversations": conversations,
+                "avg_transcript_chars": round(chars / conversations, 1) if conversations else 0.0,
+                "active_users": users.get(name, 0),
+            }
+            for name, (conversations, chars) in sorted(totals.items())
+        ]
+        return FastJSONResponse({"date_from": day_from, "date_to": day_to, "days": days, "assistants": assistants})
+
+    except Exception as e:
+        if conn:
+            conn.close()
+        raise HTTPException(status_code=500, detail=f"Failed to fetch conversation stats: {e}")
+
+# ---------------------------
 # Get conversation by id
 # ---------------------------
-@app.get("/conversations/{id}", response_model=ConversationDetail)
-def get_conversation_by_id(id: int):
+def _compress_conversation_row(conversation_id: int, text: str):
+    """Lazy migration of a plain-text transcript to conversation_zstd (runs after the response)."""
     conn = None
     try:
+        _, conv_zstd = encode_conversation(text)
         conn = get_connection()
         cur = conn.cursor()
         cur.execute(
             """
-            SELECT id, user_name, date_conversation, conversation, assistant_name
+            UPDATE conversations
+               SET conversation = NULL,
+                   conversation_zstd = %s
+             WHERE id = %s AND conversation IS NOT NULL AND conversation_zstd IS NULL;
+            """,
+            (conv_zstd, conversation_id),
+        )
+        conn.commit()
+        cur.close()
+        conn.close()
+        conn = None
+    except Exception:
+        if conn:
+            conn.rollback()
+            conn.close()
+
+@router.get("/conversations/{id}", response_model=ConversationDetail)
+def get_conversation_by_id(id: int, request: Request, background_tasks: BackgroundTasks):
+    conn = None
+    try:
+        conn = get_read_connection()
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT id, user_name, date_conversation, conversation, conversation_zstd, assistant_name
             FROM conversations WHERE id=%s;
             """,
             (id,),
@@ -1046,14 +2022,26 @@ def get_conversation_by_id(id: int):
         
         if not row:
             raise HTTPException(status_code=404, detail="Conversation not found")
-        
-        return ConversationDetail(
+
+        if row[4] is None and should_compress(row[3]):
+            background_tasks.add_task(_compress_conversation_row, row[0], row[3])
+
+        detail = ConversationDetail(
             id=row[0],
             user_name=row[1],
             date_conversation=row[2],
-            conversation=row[3],
-            assistant_name=row[4]
+            conversation=decode_conversation(row[3], row[4]),
+            assistant_name=row[5]
         )
+        # Large transcripts: send gzip directly instead of the raw JSON body
+        if "gzip" in request.headers.get("accept-encoding", "") and len(detail.conversation) >= 1024:
+            body = json_dumps(detail.model_dump())
+            return Response(
+                content=gzip.compress(body, compresslevel=6),
+                media_type="application/json",
+                headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"},
+            )
+        return detail
     except HTTPException:
         raise
     except Exception as e:
@@ -1063,7 +2051,7 @@ def get_conversation_by_id(id: int):
 # ---------------------------
 # Get all conversations by user_name (case-insensitive LIKE)
 # ---------------------------
-@app.get("/conversations/user/{user_name}")
+@router.get("/conversations/user/{user_name}")
 def get_conversations_by_user(
 
     user_name: str,
@@ -1072,7 +2060,7 @@ def get_conversations_by_user(
 ):
     conn = None
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
         
         cur.execute(
@@ -1083,6 +2071,7 @@ def get_conversations_by_user(
                 assistant_name,
                 date_conversation,
                 conversation,
+                conversation_zstd,
                 COUNT(*) OVER() AS total_count
             FROM conversations
             WHERE LOWER(user_name) LIKE %s
@@ -1093,10 +2082,11 @@ def get_conversations_by_user(
         )
         rows = cur.fetchall()
         
-        items = []
+        items: List[ConversationSummaryRow] = []
         total = 0
-        for (cid, uname, aname, dconv, conv, tot) in rows:
+        for (cid, uname, aname, dconv, conv, conv_zstd, tot) in rows:
             total = tot
+            conv = decode_conversation(conv, conv_zstd)
             preview = (conv[:160] + "…") if isinstance(conv, str) and len(conv) > 160 else conv
             items.append({
                 "id": cid,
@@ -1110,7 +2100,7 @@ def get_conversations_by_user(
         conn.close()
         conn = None
         
-        return {"items": items, "total": total if rows else 0}
+        return FastJSONResponse({"items": items, "total": total if rows else 0})
 
     except Exception as e:
         if conn:
@@ -1120,7 +2110,7 @@ def get_conversations_by_user(
     # ---------------------------
 # Get all conversations by user_name AND assistant_name
 # ---------------------------
-@app.get("/conversations/user/{user_name}/assistant/{assistant_name}")
+@router.get("/conversations/user/{user_name}/assistant/{assistant_name}")
 def get_conversations_by_user_and_assistant(
     user_name: str,
     assistant_name: str,
@@ -1129,7 +2119,7 @@ def get_conversations_by_user_and_assistant(
 ):
     conn = None
     try:
-        conn = get_connection()
+        conn = get_read_connection()
         cur = conn.cursor()
         
         cur.execute(
@@ -1140,6 +2130,7 @@ def get_conversations_by_user_and_assistant(
                 assistant_name,
                 date_conversation,
                 conversation,
+                conversation_zstd,
                 COUNT(*) OVER() AS total_count
             FROM conversations
             WHERE LOWER(user_name) LIKE %s
@@ -1151,10 +2142,11 @@ def get_conversations_by_user_and_assistant(
         )
         rows = cur.fetchall()
         
-        items = []
+        items: List[ConversationSummaryRow] = []
         total = 0
-        for (cid, uname, aname, dconv, conv, tot) in rows:
+        for (cid, uname, aname, dconv, conv, conv_zstd, tot) in rows:
             total = tot
+            conv = decode_conversation(conv, conv_zstd)
             preview = (conv[:160] + "…") if isinstance(conv, str) and len(conv) > 160 else conv
             items.append({
                 "id": cid,
@@ -1168,9 +2160,71 @@ def get_conversations_by_user_and_assistant(
         conn.close()
         conn = None
         
-        return {"items": items, "total": total if rows else 0}
+        return FastJSONResponse({"items": items, "total": total if rows else 0})
 
     except Exception as e:
         if conn:
             conn.close()
         raise HTTPException(status_code=500, detail=f"Query failed: {e}")
+
+
+# ----------------------
+# Metrics (see metrics.py)
+# ----------------------
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# ----------------------
+# Diagnostics (see diagnostics.py)
+# ----------------------
+def _require_debug_token(request: Request):
+    if not diagnostics.token_matches(request.headers.get("x-debug-token")):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@router.get("/debug/slow-queries", include_in_schema=False)
+def get_slow_queries(request: Request):
+    _require_debug_token(request)
+    return list(diagnostics.recent_slow_queries)
+
+
+@router.post("/debug/profile", include_in_schema=False)
+def profile_process(request: Request, seconds: float = Query(5.0, gt=0, le=diagnostics.MAX_PROFILE_SECONDS)):
+    _require_debug_token(request)
+    folded = diagnostics.profile_process(seconds)
+    profile_id = diagnostics.store_profile(folded)
+    return PlainTextResponse(folded, headers={"X-Profile-Id": profile_id})
+
+
+@router.get("/debug/profiles/{profile_id}", include_in_schema=False)
+def get_profile(profile_id: str, request: Request):
+    _require_debug_token(request)
+    folded = diagnostics.get_profile(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(folded)
+
+# ----------------------
+# App factory
+# ----------------------
+def create_app() -> FastAPI:
+    """
+    The API with its middleware; the lifespan warms the pools and caches
+    before the first request. `uvicorn main:app` serves the instance below,
+    `uvicorn --factory main:create_app` builds one per worker.
+    """
+    # The routes themselves, not include_router(): metrics and admission match
+    # requests against app.router.routes by path template
+    app = FastAPI(lifespan=lifespan, routes=list(router.routes))
+    app.state.warmup = {"ready": False, "error": None, "attempts": 0, "seconds": None, "connections": None}
+    if diagnostics.PROFILING_ENABLED:
+        app.add_middleware(diagnostics.ProfilingMiddleware)
+    if admission.ENABLED:
+        app.add_middleware(admission.AdmissionMiddleware)
+    if metrics.ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+    return app
+
+app = create_app()
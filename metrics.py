@@ -0,0 +1,292 @@
+"""
+Prometheus-style metrics, exposed on GET /metrics (text format 0.0.4).
+
+- MetricsMiddleware: per-route latency, plus the part of it spent in the
+  database (queries + connection opening); the remainder is Python work and
+  serialization.
+- InstrumentedConnection (used by db.py): times every cursor execute and counts
+  rows, labelled by handler (route template, or background thread name) and a
+  short statement label such as "SELECT conversations".
+
+Everything is in-process and lock-protected counters only, cheap enough to
+leave on. Each worker process has its own registry.
+
+Env:
+    METRICS_ENABLED   0 to disable the middleware and query instrumentation (default 1)
+"""
+import bisect
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+import psycopg2.extensions
+from starlette.routing import Match
+
+ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Route template (or background task name) the current code runs for
+current_handler = ContextVar("metrics_handler", default="-")
+# Per-request accumulator: [db seconds]; shared by reference with threadpool copies
+_request_db_time = ContextVar("metrics_request_db_time", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = {k: (list(v) if isinstance(v, list) else v) for k, v in self._series.items()}
+        lines.extend(self._render_series(series))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def _render_series(self, series):
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in series.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+    def _render_series(self, series):
+        return [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in series.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._series.get(labels)
+            if state is None:
+                # [per-bucket counts..., +Inf count, sum]
+                state = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[idx] += 1
+            state[-1] += value
+
+    def _render_series(self, series):
+        lines = []
+        for k, state in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {cumulative}")
+            cumulative += state[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, k)} {state[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, k)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency by route", ("method", "route", "status"))
+http_request_db_duration = Histogram(
+    "http_request_db_seconds", "Time a request spent in the database (queries + connects)", ("route",))
+db_query_duration = Histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("handler", "statement"))
+db_rows = Counter(
+    "db_rows_total", "Rows returned or affected by SQL statements", ("handler", "statement"))
+db_connect_duration = Histogram(
+    "db_connect_duration_seconds", "Time to open a database connection", ("database",))
+upload_bytes = Counter(
+    "upload_bytes_total", "Bytes received in file uploads", ("route",))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def add_db_time(seconds):
+    acc = _request_db_time.get()
+    if acc is not None:
+        acc[0] += seconds
+
+
+# ----------------------
+# SQL instrumentation
+# ----------------------
+_VERB_RE = re.compile(r"\b(INSERT|UPDATE|DELETE|SELECT|EXPLAIN|PREPARE|EXECUTE|LISTEN|NOTIFY|SET)\b", re.I)
+_TABLE_RE = {
+    "INSERT": re.compile(r"\bINTO\s+([\w.\"]+)", re.I),
+    "UPDATE": re.compile(r"\bUPDATE\s+([\w.\"]+)", re.I),
+    "DELETE": re.compile(r"\bFROM\s+([\w.\"]+)", re.I),
+    "SELECT": re.compile(r"\bFROM\s+([\w.\"]+)", re.I),
+    "EXECUTE": re.compile(r"\bEXECUTE\s+([\w\"]+)", re.I),
+    "PREPARE": re.compile(r"\bPREPARE\s+([\w\"]+)", re.I),
+}
+
+
+@lru_cache(maxsize=2048)
+def _statement_label(head):
+    # Data-modifying CTEs are labelled by their write
+    writes = re.search(r"\b(INSERT|UPDATE|DELETE)\b", head, re.I) if head.lstrip()[:4].upper() == "WITH" else None
+    m = writes or _VERB_RE.search(head)
+    if not m:
+        return "OTHER"
+    verb = m.group(1).upper()
+    table_re = _TABLE_RE.get(verb)
+    t = table_re.search(head, m.start()) if table_re else None
+    return f"{verb} {t.group(1).strip(chr(34))}" if t else verb
+
+
+def statement_label(query):
+    head = query[:400]
+    if isinstance(head, bytes):
+        head = head.decode("utf-8", "ignore")
+    return _statement_label(head)
+
+
+def record_query(query, seconds, rowcount):
+    handler = current_handler.get()
+    label = statement_label(query)
+    db_query_duration.observe(seconds, handler, label)
+    if rowcount and rowcount > 0:
+        db_rows.inc(rowcount, handler, label)
+    add_db_time(seconds)
+
+
+# Extra per-statement callbacks: hook(cursor, query, vars, seconds)
+query_hooks = []
+
+
+class _InstrumentedCursorMixin:
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._record(query, vars, time.perf_counter() - start)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._record(query, None, time.perf_counter() - start)
+
+    def _record(self, query, vars, seconds):
+        if ENABLED:
+            record_query(query, seconds, self.rowcount)
+        for hook in query_hooks:
+            hook(self, query, vars, seconds)
+
+
+_instrumented_classes = {}
+
+
+def _instrumented(cursor_class):
+    cls = _instrumented_classes.get(cursor_class)
+    if cls is None:
+        cls = type(f"Instrumented{cursor_class.__name__}", (_InstrumentedCursorMixin, cursor_class), {})
+        _instrumented_classes[cursor_class] = cls
+    return cls
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """Connection whose cursors (whatever their cursor_factory) time their statements."""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get("cursor_factory") or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs["cursor_factory"] = _instrumented(factory)
+        return super().cursor(*args, **kwargs)
+
+
+# ----------------------
+# HTTP middleware
+# ----------------------
+_route_cache = {}
+_ROUTE_CACHE_SIZE = 4096
+
+
+def route_template(scope):
+    """Path template of the route that will handle this request ("unmatched" if none)."""
+    key = (scope["method"], scope["path"])
+    template = _route_cache.get(key)
+    if template is None:
+        template = "unmatched"
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                template = route.path
+                break
+        if len(_route_cache) >= _ROUTE_CACHE_SIZE:
+            _route_cache.clear()
+        _route_cache[key] = template
+    return template
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        route = route_template(scope)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        handler_token = current_handler.set(route)
+        db_token = _request_db_time.set([0.0])
+        acc = _request_db_time.get()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_request_duration.observe(elapsed, scope["method"], route, str(status[0]))
+            http_request_db_duration.observe(acc[0], route)
+            _request_db_time.reset(db_token)
+            current_handler.reset(handler_token)
@@ -0,0 +1,27 @@
+-- ---------------------------------------------------------------
+-- 001 - Full-text search over conversations.conversation
+-- Apply with: psql "$DATABASE_URL" -f migrations/001_conversations_search.sql
+-- ---------------------------------------------------------------
+-- 'simple' config: transcripts mix French and English, so no stemming/stop words.
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+CREATE OR REPLACE FUNCTION conversations_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := to_tsvector('simple', coalesce(NEW.conversation, ''));
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS conversations_search_vector_trg ON conversations;
+CREATE TRIGGER conversations_search_vector_trg
+    BEFORE INSERT OR UPDATE OF conversation ON conversations
+    FOR EACH ROW EXECUTE FUNCTION conversations_search_vector_update();
+
+-- Backfill existing rows
+UPDATE conversations
+   SET search_vector = to_tsvector('simple', coalesce(conversation, ''))
+ WHERE search_vector IS NULL;
+
+CREATE INDEX IF NOT EXISTS conversations_search_vector_idx
+    ON conversations USING GIN (search_vector);
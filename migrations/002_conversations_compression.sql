@@ -0,0 +1,25 @@
+-- ---------------------------------------------------------------
+-- 002 - zstd-compressed transcripts (see compression.py)
+-- Large transcripts are written to conversation_zstd with conversation = NULL.
+-- Existing rows are compressed lazily when read through GET /conversations/{id}.
+-- ---------------------------------------------------------------
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS conversation_zstd bytea;
+-- Already compressed: skip TOAST's own pglz pass
+ALTER TABLE conversations ALTER COLUMN conversation_zstd SET STORAGE EXTERNAL;
+ALTER TABLE conversations ALTER COLUMN conversation DROP NOT NULL;
+
+ALTER TABLE conversations DROP CONSTRAINT IF EXISTS conversations_body_present;
+ALTER TABLE conversations ADD CONSTRAINT conversations_body_present
+    CHECK (conversation IS NOT NULL OR conversation_zstd IS NOT NULL);
+
+-- Compressed rows get their search_vector from the application (plain text is
+-- not available in SQL), so only recompute it when plain text is present.
+CREATE OR REPLACE FUNCTION conversations_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    IF NEW.conversation IS NOT NULL THEN
+        NEW.search_vector := to_tsvector('simple', NEW.conversation);
+    END IF;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,10 @@
+-- ---------------------------------------------------------------
+-- 003 - Ticket of buffered /save-conversation inserts (see ingest.py)
+-- Unique so that replaying the local journal after a crash is idempotent
+-- (INSERT ... ON CONFLICT (ingest_ticket) DO NOTHING).
+-- ---------------------------------------------------------------
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS ingest_ticket uuid;
+
+CREATE UNIQUE INDEX IF NOT EXISTS conversations_ingest_ticket_key
+    ON conversations (ingest_ticket);
@@ -0,0 +1,83 @@
+-- ---------------------------------------------------------------
+-- 004 - Partition conversations by month on date_conversation
+-- Rebuilds the table (run in a maintenance window): the old table is kept as
+-- conversations_unpartitioned until it is dropped by hand.
+-- Monthly partitions are created ahead / archived with partitions.py.
+-- ---------------------------------------------------------------
+BEGIN;
+
+LOCK TABLE conversations IN EXCLUSIVE MODE;
+
+-- Free the canonical names for the new table
+ALTER TABLE conversations RENAME TO conversations_unpartitioned;
+ALTER INDEX IF EXISTS conversations_pkey RENAME TO conversations_unpartitioned_pkey;
+ALTER INDEX IF EXISTS conversations_search_vector_idx RENAME TO conversations_unpartitioned_search_vector_idx;
+ALTER INDEX IF EXISTS conversations_ingest_ticket_key RENAME TO conversations_unpartitioned_ingest_ticket_key;
+DROP TRIGGER IF EXISTS conversations_search_vector_trg ON conversations_unpartitioned;
+
+-- Same columns, defaults (id sequence) and CHECK constraints
+CREATE TABLE conversations (
+    LIKE conversations_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (date_conversation);
+
+ALTER TABLE conversations ALTER COLUMN date_conversation SET NOT NULL;
+ALTER TABLE conversations ALTER COLUMN date_conversation SET DEFAULT now();
+
+-- Unique keys must include the partition key
+ALTER TABLE conversations ADD CONSTRAINT conversations_pkey PRIMARY KEY (id, date_conversation);
+CREATE UNIQUE INDEX conversations_ingest_ticket_key ON conversations (ingest_ticket, date_conversation);
+CREATE INDEX conversations_search_vector_idx ON conversations USING GIN (search_vector);
+CREATE INDEX conversations_date_idx ON conversations (date_conversation DESC, id DESC);
+
+CREATE TRIGGER conversations_search_vector_trg
+    BEFORE INSERT OR UPDATE OF conversation ON conversations
+    FOR EACH ROW EXECUTE FUNCTION conversations_search_vector_update();
+
+-- Catches rows outside the created months; kept empty by partitions.py
+CREATE TABLE conversations_default PARTITION OF conversations DEFAULT;
+
+-- Create (or carve out of the default partition) the partition for one UTC month
+CREATE OR REPLACE FUNCTION conversations_ensure_partition(p_month date) RETURNS text AS $$
+DECLARE
+    lo timestamptz := (date_trunc('month', p_month)::date)::timestamp AT TIME ZONE 'UTC';
+    hi timestamptz := ((date_trunc('month', p_month) + interval '1 month')::date)::timestamp AT TIME ZONE 'UTC';
+    part text := 'conversations_' || to_char(p_month, 'YYYY_MM');
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN part;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE conversations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part);
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM conversations_default
+                         WHERE date_conversation >= %L AND date_conversation < %L
+                     RETURNING *)
+         INSERT INTO %I SELECT * FROM moved', lo, hi, part);
+    EXECUTE format('ALTER TABLE conversations ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, lo, hi);
+    RETURN part;
+END
+$$ LANGUAGE plpgsql;
+
+-- Partitions for existing data + the next 3 months
+SELECT conversations_ensure_partition(m::date)
+FROM generate_series(
+    date_trunc('month', COALESCE((SELECT min(date_conversation) FROM conversations_unpartitioned), now()) AT TIME ZONE 'UTC'),
+    date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months',
+    interval '1 month'
+) AS m;
+
+INSERT INTO conversations SELECT * FROM conversations_unpartitioned;
+
+-- Keep the id sequence alive when conversations_unpartitioned is dropped
+DO $$
+DECLARE
+    seq text := pg_get_serial_sequence('conversations_unpartitioned', 'id');
+BEGIN
+    IF seq IS NOT NULL THEN
+        EXECUTE format('ALTER SEQUENCE %s OWNED BY conversations.id', seq);
+    END IF;
+END
+$$;
+
+COMMIT;
+
+ANALYZE conversations;
@@ -0,0 +1,13 @@
+-- ---------------------------------------------------------------
+-- 005 - One auditee per email (case-insensitive)
+-- Backs INSERT ... ON CONFLICT ((lower(email))) in POST /auditees and
+-- POST /auditees/bulk, and the lower(email) lookups of the auth endpoints.
+-- Run outside a transaction (CONCURRENTLY). If it fails, merge the duplicates
+-- listed by:
+--   SELECT lower(email), array_agg(id ORDER BY id) FROM auditees
+--   GROUP BY 1 HAVING count(*) > 1;
+-- then DROP INDEX auditees_email_lower_key (left INVALID) and re-run.
+-- ---------------------------------------------------------------
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS auditees_email_lower_key
+    ON auditees (lower(email));
@@ -0,0 +1,12 @@
+-- ---------------------------------------------------------------
+-- 006 - Idempotency key of POST /audits/start
+-- INSERT ... ON CONFLICT (external_id) WHERE external_id IS NOT NULL DO NOTHING
+-- Run outside a transaction (CONCURRENTLY).
+-- ---------------------------------------------------------------
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS audits_external_id_key
+    ON audits (external_id)
+    WHERE external_id IS NOT NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS questions_version_tag_idx
+    ON questions (version_tag, question_id);
@@ -0,0 +1,34 @@
+-- ---------------------------------------------------------------
+-- 007 - Action plans (POST /action-plan, see openapi.yaml)
+-- ---------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS action_plans (
+    id          serial PRIMARY KEY,
+    title       text NOT NULL,
+    owner       text NOT NULL,
+    deadline    date NOT NULL,
+    nc_id       integer REFERENCES non_conformities (nc_id) ON DELETE SET NULL,
+    created_at  timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS action_plans_nc_id_idx ON action_plans (nc_id);
+
+CREATE TABLE IF NOT EXISTS action_plan_steps (
+    id              serial PRIMARY KEY,
+    action_plan_id  integer NOT NULL REFERENCES action_plans (id) ON DELETE CASCADE,
+    position        integer NOT NULL,
+    description     text NOT NULL,
+    due_date        date NOT NULL,
+    UNIQUE (action_plan_id, position)
+);
+
+-- Attachments (POST /action-plan/files); the bytes live in uploads/action_plans/
+CREATE TABLE IF NOT EXISTS action_plan_files (
+    id              serial PRIMARY KEY,
+    action_plan_id  integer NOT NULL REFERENCES action_plans (id) ON DELETE CASCADE,
+    filename        text NOT NULL,
+    filetype        text NOT NULL,
+    stored_name     text NOT NULL,
+    size_bytes      bigint NOT NULL,
+    created_at      timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS action_plan_files_plan_idx ON action_plan_files (action_plan_id);
@@ -0,0 +1,39 @@
+-- ---------------------------------------------------------------
+-- 008 - Change tracking for GET /sync/changes
+-- Every insert/update of audits, answers and non_conformities stamps the
+-- row with the id of the writing transaction (xid8, PostgreSQL 13+).
+-- Transaction ids below pg_snapshot_xmin(pg_current_snapshot()) belong to
+-- finished transactions, so the feed only returns rows under that bound and
+-- a row committed late by a long transaction is picked up by a later sync
+-- instead of being skipped (which a timestamp or sequence cursor allows).
+-- Existing rows get change_xid 1: a sync from the start returns them all.
+-- Deletes are not tracked (the API never deletes these rows).
+-- Run outside a transaction (CONCURRENTLY).
+-- ---------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION set_change_xid() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Constant default: no table rewrite
+ALTER TABLE audits ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '1';
+ALTER TABLE answers ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '1';
+ALTER TABLE non_conformities ADD COLUMN IF NOT EXISTS change_xid xid8 NOT NULL DEFAULT '1';
+
+DROP TRIGGER IF EXISTS audits_change_xid ON audits;
+CREATE TRIGGER audits_change_xid BEFORE INSERT OR UPDATE ON audits
+    FOR EACH ROW EXECUTE FUNCTION set_change_xid();
+DROP TRIGGER IF EXISTS answers_change_xid ON answers;
+CREATE TRIGGER answers_change_xid BEFORE INSERT OR UPDATE ON answers
+    FOR EACH ROW EXECUTE FUNCTION set_change_xid();
+DROP TRIGGER IF EXISTS non_conformities_change_xid ON non_conformities;
+CREATE TRIGGER non_conformities_change_xid BEFORE INSERT OR UPDATE ON non_conformities
+    FOR EACH ROW EXECUTE FUNCTION set_change_xid();
+
+-- Keyset order of the feed: (change_xid, primary key)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS audits_change_xid_idx ON audits (change_xid, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS answers_change_xid_idx ON answers (change_xid, answer_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS non_conformities_change_xid_idx ON non_conformities (change_xid, nc_id);
@@ -0,0 +1,28 @@
+-- ---------------------------------------------------------------
+-- 009 - Cache invalidation for access_codes (see invalidation.py)
+-- The API caches access codes per worker but never writes them: they are
+-- managed by hand or by admin tools. This trigger sends the same NOTIFY the
+-- API writers send, so every worker evicts a changed or removed code at
+-- commit instead of when its TTL runs out.
+-- ---------------------------------------------------------------
+
+CREATE OR REPLACE FUNCTION notify_access_code_change() RETURNS trigger AS $$
+DECLARE
+    names text[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        names := ARRAY[NEW.name];
+    ELSIF TG_OP = 'DELETE' THEN
+        names := ARRAY[OLD.name];
+    ELSE
+        names := ARRAY[OLD.name, NEW.name];
+    END IF;
+    PERFORM pg_notify('cache_invalidation',
+                      json_build_object('cache', 'access_codes', 'keys', to_json(names))::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS access_codes_cache_invalidation ON access_codes;
+CREATE TRIGGER access_codes_cache_invalidation AFTER INSERT OR UPDATE OR DELETE ON access_codes
+    FOR EACH ROW EXECUTE FUNCTION notify_access_code_change();
@@ -0,0 +1,34 @@
+-- ---------------------------------------------------------------
+-- 010 - Background jobs (see jobs.py)
+-- Workers claim the runnable job with the lowest priority number, oldest
+-- first, with FOR UPDATE SKIP LOCKED: concurrent workers never wait on or
+-- take the same row. status: queued -> running -> done | failed; a failed
+-- attempt goes back to queued with run_after pushed back (backoff).
+-- ---------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id            bigserial PRIMARY KEY,
+    type          text NOT NULL,
+    payload       jsonb NOT NULL DEFAULT '{}',
+    priority      smallint NOT NULL DEFAULT 100,         -- lower runs first
+    status        text NOT NULL DEFAULT 'queued'
+                  CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts      integer NOT NULL DEFAULT 0,
+    max_attempts  integer NOT NULL DEFAULT 5,
+    run_after     timestamptz NOT NULL DEFAULT now(),
+    dedupe_key    text,                                  -- at most one queued job per key
+    locked_by     text,
+    locked_until  timestamptz,                           -- lease of a running job
+    last_error    text,
+    created_at    timestamptz NOT NULL DEFAULT now(),
+    started_at    timestamptz,
+    finished_at   timestamptz
+);
+
+-- Claim order, over queued rows only
+CREATE INDEX IF NOT EXISTS jobs_claim_idx ON jobs (priority, run_after, id) WHERE status = 'queued';
+-- Expired leases (worker died mid-job)
+CREATE INDEX IF NOT EXISTS jobs_lease_idx ON jobs (locked_until) WHERE status = 'running';
+-- Retention cleanup and /jobs/stats throughput
+CREATE INDEX IF NOT EXISTS jobs_finished_idx ON jobs (finished_at) WHERE status IN ('done', 'failed');
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedupe_idx ON jobs (dedupe_key) WHERE status = 'queued';
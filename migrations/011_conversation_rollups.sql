@@ -0,0 +1,25 @@
+-- ---------------------------------------------------------------
+-- 011 - Daily conversation rollups (see rollups.py, GET /conversations/stats)
+-- Maintained in the transaction that inserts the conversations, so they are
+-- exact without scanning conversations. Days are UTC; assistant_name '' stands
+-- for conversations saved without one. Fill history with:
+--     python rollups.py backfill
+-- ---------------------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS conversation_daily_stats (
+    day               date NOT NULL,
+    assistant_name    text NOT NULL DEFAULT '',
+    conversations     bigint NOT NULL DEFAULT 0,
+    transcript_chars  bigint NOT NULL DEFAULT 0,   -- characters of the plain-text transcripts
+    PRIMARY KEY (day, assistant_name)
+);
+
+-- One row per (day, assistant, user): active users over any range are a
+-- count(DISTINCT user_name) over these rows
+CREATE TABLE IF NOT EXISTS conversation_daily_users (
+    day             date NOT NULL,
+    assistant_name  text NOT NULL DEFAULT '',
+    user_name       text NOT NULL,
+    conversations   bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, assistant_name, user_name)
+);
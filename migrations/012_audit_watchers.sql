@@ -0,0 +1,15 @@
+-- ---------------------------------------------------------------
+-- 012 - Audits with live event subscribers, per API worker (see events.py)
+-- Writers on any worker check it before sending audit events and queueing
+-- the running score. Each worker refreshes the rows of its open streams every
+-- SSE_WATCH_TTL / 3 seconds; rows of closed streams and dead workers expire.
+-- UNLOGGED: after a server crash the table is empty until the next refresh,
+-- so events can be skipped for that long.
+-- ---------------------------------------------------------------
+
+CREATE UNLOGGED TABLE IF NOT EXISTS audit_watchers (
+    audit_id    int NOT NULL,
+    worker      text NOT NULL,          -- host:pid
+    expires_at  timestamptz NOT NULL,
+    PRIMARY KEY (audit_id, worker)
+);
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional, Literal, Any, Dict
+from typing import List, Optional, Literal, Any, Dict, TypedDict
 from datetime import datetime, timezone, date 
 # ----------------------
 # Helper function
@@ -50,12 +50,42 @@ class AuditeeCreateOut(BaseModel):
     today: str
     auditee: AuditeeOut
 
+class AuditeesBulkIn(BaseModel):
+    auditees: List[AuditeeCreateIn] = Field(..., min_length=1, max_length=5000)
+
+class AuditeesBulkOut(BaseModel):
+    ok: bool
+    today: str
+    count: int
+    auditees: List[AuditeeOut]
+
 class AuditStartIn(BaseModel):
     auditee_id: int
     type: str
     questionnaire_version: Optional[str] = None
     external_id: Optional[str] = None  # uuid from client for idempotency
 
+class AuditOut(BaseModel):
+    id: int
+    auditee_id: int
+    type: str
+    status: str
+    started_at: Optional[datetime] = None
+    questionnaire_version: Optional[str] = None
+    external_id: Optional[str] = None
+
+class QuestionOut(BaseModel):
+    question_id: int
+    text: str
+    category: Optional[str] = None
+    mandatory: Optional[bool] = None
+
+class AuditStartOut(BaseModel):
+    ok: bool
+    created: bool  # false when external_id matched an existing audit (retry)
+    audit: AuditOut
+    questions: List[QuestionOut]
+
 class QuestionIn(BaseModel):
     text: str
     category: Optional[str] = None
@@ -87,11 +117,46 @@ class NonConformityIn(BaseModel):
 class CompleteAuditIn(BaseModel):
     score_global: Optional[float] = None
 
+class ActionStep(BaseModel):
+    description: str = Field(..., min_length=1)
+    due_date: date
+
+class ActionPlan(BaseModel):
+    title: str = Field(..., min_length=1)
+    owner: str = Field(..., min_length=1)
+    deadline: date
+    steps: List[ActionStep]
+    nc_id: Optional[int] = None  # non_conformities.nc_id this plan addresses
+
+class ActionPlanOut(BaseModel):
+    ok: bool
+    action_plan_id: int
+    step_count: int
+    nc_id: Optional[int] = None
+
+class ActionPlanLinkIn(BaseModel):
+    nc_id: Optional[int] = None  # null unlinks
+
 class FileUploadPayload(BaseModel):
     action_plan_id: int
     filename: str
     filetype: str
-    content: str
+    content: str  # base64 (a "data:...;base64," prefix is accepted)
+
+class FileUploadOut(BaseModel):
+    ok: bool
+    file_id: int
+    action_plan_id: int
+    filename: str
+    size_bytes: int
+
+class ReportStatusOut(BaseModel):
+    audit_id: int
+    report_id: str
+    status: Literal["pending", "ready", "failed"]
+    status_url: str
+    download_url: Optional[str] = None
+    error: Optional[str] = None
 
 class AuthCheckIn(BaseModel):
     name: str
@@ -122,6 +187,61 @@ class AuditeeAuditsOut(BaseModel):
     total_audits: int
     audits: List[AuditWithAnswersOut]
 
+class SyncAuditOut(BaseModel):
+    id: int
+    auditee_id: Optional[int] = None
+    type: str
+    status: str
+    started_at: Optional[datetime] = None
+    ended_at: Optional[datetime] = None
+    score_global: Optional[float] = None
+    questionnaire_version: Optional[str] = None
+    external_id: Optional[str] = None
+
+class SyncAnswerOut(BaseModel):
+    answer_id: int
+    audit_id: int
+    question_id: int
+    response_text: Optional[str] = None
+    is_compliant: Optional[bool] = None
+    attempt_number: int
+    evidence_filename: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class SyncNonConformityOut(BaseModel):
+    nc_id: int
+    audit_id: int
+    question_id: Optional[int] = None
+    description: Optional[str] = None
+    severity: Optional[str] = None
+    status: Optional[str] = None
+    responsible_id: Optional[int] = None
+    due_date: Optional[date] = None
+    evidence_url: Optional[str] = None
+    closed_at: Optional[datetime] = None
+    closure_comment: Optional[str] = None
+    detected_at: Optional[datetime] = None
+
+class SyncChangesOut(BaseModel):
+    cursor: str  # pass back as ?since= on the next call
+    has_more: bool
+    audits: List[SyncAuditOut]
+    answers: List[SyncAnswerOut]
+    non_conformities: List[SyncNonConformityOut]
+
+class JobTypeStatsOut(BaseModel):
+    type: str
+    queued: int           # runnable now
+    delayed: int          # waiting for a retry backoff
+    running: int
+    failed: int
+    done_last_5m: int
+    failed_last_5m: int
+    oldest_queued_seconds: Optional[float] = None
+
+class JobStatsOut(BaseModel):
+    types: List[JobTypeStatsOut]
+
 # ----------------------
 # Models (conversations)
 # ----------------------
@@ -132,8 +252,10 @@ class ConversationIn(BaseModel):
     assistant_name: Optional[str] = None
 
 class ConversationOut(BaseModel):
-    id: int
-    status: str = "ok"
+    id: Optional[int] = None
+    status: str = "ok"  # "ok" (saved, id set), "queued" (poll /save-conversation/{ticket}) or "failed" (see error)
+    ticket: Optional[str] = None
+    error: Optional[str] = None
 
 class ConversationSummary(BaseModel):
     id: int
@@ -149,6 +271,37 @@ class ConversationDetail(BaseModel):
     conversation: str
     assistant_name: Optional[str] = None
 
+class ConversationSearchHit(BaseModel):
+    id: int
+    user_name: str
+    date_conversation: datetime
+    assistant_name: Optional[str] = None
+    rank: float
+    snippet: str
+
+class ConversationSearchOut(BaseModel):
+    items: List[ConversationSearchHit]
+    total: int
+
+class ConversationDayStats(BaseModel):
+    day: date
+    assistant_name: Optional[str] = None
+    conversations: int
+    avg_transcript_chars: float
+    active_users: int
+
+class ConversationAssistantStats(BaseModel):
+    assistant_name: Optional[str] = None
+    conversations: int
+    avg_transcript_chars: float
+    active_users: int  # distinct users over the whole range
+
+class ConversationStatsOut(BaseModel):
+    date_from: date
+    date_to: date
+    days: List[ConversationDayStats]
+    assistants: List[ConversationAssistantStats]
+
 # -------------------------------------------------
 # Models & helpers for Sales
 # -------------------------------------------------
@@ -171,3 +324,70 @@ class MatrixOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+# ----------------------
+# Row types for FastJSONResponse handlers (trusted DB rows, not validated)
+# ----------------------
+class _AnswerRowBase(TypedDict):
+    answer_id: int
+    audit_id: int
+    question_text: str
+    response_text: Optional[str]
+    is_compliant: Optional[bool]
+    attempt_number: int
+    evidence_filename: Optional[str]
+    created_at: Optional[datetime]
+    auditee_id: Optional[int]
+    auditee_name: str
+
+class AnswerRow(_AnswerRowBase, total=False):
+    evidence_url: str
+
+class _AuditAnswerRowBase(TypedDict):
+    answer_id: int
+    audit_id: int
+    question_id: int
+    question_text: str
+    question_category: Optional[str]
+    question_mandatory: Optional[bool]
+    response_text: Optional[str]
+    is_compliant: Optional[bool]
+    attempt_number: int
+    evidence_filename: Optional[str]
+    created_at: Optional[datetime]
+
+class AuditAnswerRow(_AuditAnswerRowBase, total=False):
+    evidence_url: str
+
+class AuditWithAnswersRow(TypedDict):
+    audit_id: int
+    audit_type: str
+    status: str
+    started_at: Optional[datetime]
+    ended_at: Optional[datetime]
+    score_global: Optional[float]
+    questionnaire_version: Optional[str]
+    external_id: Optional[str]
+    auditee_id: int
+    auditee_name: str
+    auditee_email: str
+    auditee_function: Optional[str]
+    auditee_plant: Optional[str]
+    auditee_dept: Optional[str]
+    answer_count: int
+    answers: List[AuditAnswerRow]
+
+class ConversationSummaryRow(TypedDict):
+    id: int
+    user_name: str
+    date_conversation: datetime
+    preview: str
+    assistant_name: Optional[str]
+
+class ConversationSearchHitRow(TypedDict):
+    id: int
+    user_name: str
+    date_conversation: datetime
+    assistant_name: Optional[str]
+    rank: float
+    snippet: str
@@ -0,0 +1,99 @@
+"""
+Coalescing background writer for auditee display-name syncs.
+
+/auditees/precheck and /auditees/check used to UPDATE auditees.first_name
+inline whenever the incoming capitalization/spacing differed. They now only
+submit (auditee_id, first_name) here; a background thread writes all pending
+names every NAME_SYNC_INTERVAL seconds in one UPDATE ... FROM (VALUES ...).
+Several submits for the same auditee between flushes collapse to the last one.
+
+Env:
+    NAME_SYNC_INTERVAL   seconds between flushes (default 5)
+"""
+import os
+import threading
+
+import psycopg2.extras
+
+import invalidation
+import metrics
+from db import get_connection
+
+INTERVAL = float(os.getenv("NAME_SYNC_INTERVAL", "5"))
+
+UPDATE_SQL = """
+    UPDATE auditees AS a
+       SET first_name = v.first_name
+      FROM (VALUES %s) AS v(id, first_name)
+     WHERE a.id = v.id
+       AND a.first_name IS DISTINCT FROM v.first_name
+ RETURNING lower(a.email)
+"""
+
+
+class DisplayNameSyncer:
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="name-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        self._stopping = True
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def submit(self, auditee_id, first_name):
+        with self._lock:
+            self._pending[auditee_id] = first_name
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+        conn = None
+        try:
+            conn = get_connection()
+            cur = conn.cursor()
+            rows = psycopg2.extras.execute_values(cur, UPDATE_SQL, list(batch.items()), page_size=1000, fetch=True)
+            if rows:
+                # Other workers still cache the previous first_name
+                invalidation.notify(cur, "auditees", [r[0] for r in rows])
+            conn.commit()
+            cur.close()
+            conn.close()
+            conn = None
+            return len(batch)
+        except Exception:
+            if conn:
+                conn.rollback()
+                conn.close()
+            # Put the batch back unless a newer name was submitted meanwhile
+            with self._lock:
+                for aid, name in batch.items():
+                    self._pending.setdefault(aid, name)
+            raise
+
+    def _run(self):
+        metrics.current_handler.set("bg:name-sync")
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                pass  # retried on the next tick
+        try:
+            self.flush()
+        except Exception:
+            pass
+
+
+syncer = DisplayNameSyncer()
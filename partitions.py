@@ -0,0 +1,104 @@
+"""
+Monthly partition maintenance for conversations (see migrations/004).
+
+    python partitions.py ensure [--ahead 3]
+        create the partitions for the current month and the next N months
+    python partitions.py archive --keep-months 24 [--drop]
+        detach partitions older than N months and move them to the archive
+        schema (or drop them with --drop)
+
+Run both from a daily cron/WebJob. Detaching is a catalog-only change: it only
+needs a brief lock on conversations, taken with a short lock_timeout so it never
+queues behind long-running exports; on timeout it is retried.
+"""
+import argparse
+import time
+from datetime import date
+
+from db import get_connection
+
+ARCHIVE_SCHEMA = "archive"
+
+
+def _add_months(d, months):
+    m = d.month - 1 + months
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def ensure_partitions(ahead=3):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        this_month = date.today().replace(day=1)
+        created = []
+        for i in range(ahead + 1):
+            cur.execute("SELECT conversations_ensure_partition(%s)", (_add_months(this_month, i),))
+            created.append(cur.fetchone()[0])
+        conn.commit()
+        cur.close()
+        return created
+    finally:
+        conn.close()
+
+
+def list_partitions(cur):
+    """[(name, upper_bound)] of the monthly partitions, oldest first (default partition excluded)."""
+    cur.execute("""
+        SELECT c.relname,
+               (regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamptz
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'conversations'::regclass
+          AND pg_get_expr(c.relpartbound, c.oid) <> 'DEFAULT'
+        ORDER BY 2
+    """)
+    return cur.fetchall()
+
+
+def archive_partitions(keep_months, drop=False, retries=5):
+    cutoff = _add_months(date.today().replace(day=1), -keep_months)
+    conn = get_connection()
+    conn.autocommit = True
+    done = []
+    try:
+        cur = conn.cursor()
+        cur.execute("SET lock_timeout = '2s'")
+        if not drop:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}")
+        for name, upper in list_partitions(cur):
+            if upper.date() > cutoff:
+                break
+            for attempt in range(retries):
+                try:
+                    cur.execute(f'ALTER TABLE conversations DETACH PARTITION "{name}"')
+                    break
+                except Exception:
+                    if attempt == retries - 1:
+                        raise
+                    time.sleep(2 ** attempt)
+            if drop:
+                cur.execute(f'DROP TABLE "{name}"')
+            else:
+                cur.execute(f'ALTER TABLE "{name}" SET SCHEMA {ARCHIVE_SCHEMA}')
+            done.append(name)
+        cur.close()
+        return done
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_ensure = sub.add_parser("ensure")
+    p_ensure.add_argument("--ahead", type=int, default=3)
+    p_archive = sub.add_parser("archive")
+    p_archive.add_argument("--keep-months", type=int, required=True)
+    p_archive.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "ensure":
+        print("\n".join(ensure_partitions(args.ahead)))
+    else:
+        for name in archive_partitions(args.keep_months, args.drop):
+            print(("dropped " if args.drop else f"moved to {ARCHIVE_SCHEMA}: ") + name)
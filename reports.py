@@ -0,0 +1,279 @@
+"""
+PDF audit reports.
+
+Rendering (fpdf) runs in a process pool, off the request threads. Reports are
+cached on disk as REPORT_DIR/audit-<id>-<version>.pdf, where <version> is a
+digest of everything the report shows (audit status/score, answers, NCs):
+answers are updated in place without a timestamp, so the digest is what tells
+us the audit changed since the last render. A re-download of an unchanged
+audit is a plain file response.
+
+Env:
+    REPORT_DIR       cache directory (default ./reports)
+    REPORT_WORKERS   render processes (default 2)
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+REPORT_DIR = Path(os.getenv("REPORT_DIR", "reports"))
+WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+MAX_JOBS = 500
+
+THUMBNAIL_TYPES = {".jpg", ".jpeg", ".png"}
+THUMBNAIL_WIDTH = 45  # mm
+
+_executor = None
+_jobs = {}  # job_id -> Future
+_lock = threading.Lock()
+
+
+# ----------------------
+# Data access (request thread)
+# ----------------------
+def report_version(cur, audit_id):
+    """Digest of the report content, or None if the audit does not exist."""
+    cur.execute("""
+        SELECT left(md5(concat_ws('|',
+                   row(a.status, a.ended_at, a.score_global, a.questionnaire_version)::text,
+                   (SELECT string_agg(row(x.answer_id, x.response_text, x.is_compliant,
+                                          x.attempt_number, x.evidence_filename)::text,
+                                      ',' ORDER BY x.answer_id)
+                      FROM answers x WHERE x.audit_id = a.id),
+                   (SELECT string_agg(row(n.nc_id, n.description, n.severity, n.status,
+                                          n.due_date, n.closed_at)::text,
+                                      ',' ORDER BY n.nc_id)
+                      FROM non_conformities n WHERE n.audit_id = a.id)
+               )), 16)
+        FROM audits a
+        WHERE a.id = %s
+    """, (audit_id,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def fetch_report_data(cur, audit_id):
+    cur.execute("""
+        SELECT au.id, au.type, au.status, au.started_at, au.ended_at, au.score_global,
+               au.questionnaire_version, aue.first_name, aue.email, aue.plant_name, aue.dept_name
+        FROM audits au
+        LEFT JOIN auditees aue ON au.auditee_id = aue.id
+        WHERE au.id = %s
+    """, (audit_id,))
+    (aid, audit_type, status, started_at, ended_at, score_global,
+     version, first_name, email, plant_name, dept_name) = cur.fetchone()
+
+    cur.execute("""
+        SELECT q.question_id, q.text, q.category, a.response_text, a.is_compliant,
+               a.attempt_number, a.evidence_filename
+        FROM answers a
+        JOIN questions q ON a.question_id = q.question_id
+        WHERE a.audit_id = %s
+        ORDER BY q.question_id, a.attempt_number
+    """, (audit_id,))
+    answers = []
+    for (qid, text, category, response_text, is_compliant, attempt, evidence) in cur.fetchall():
+        evidence_key = None
+        if evidence and os.path.splitext(evidence)[1].lower() in THUMBNAIL_TYPES:
+            evidence_key = evidence
+        answers.append({
+            "question_id": qid,
+            "question_text": text,
+            "category": category,
+            "response_text": response_text,
+            "is_compliant": is_compliant,
+            "attempt_number": attempt,
+            "evidence_key": evidence_key,
+        })
+
+    cur.execute("""
+        SELECT nc_id, question_id, description, severity, status, due_date
+        FROM non_conformities
+        WHERE audit_id = %s
+        ORDER BY nc_id
+    """, (audit_id,))
+    ncs = [
+        {"nc_id": r[0], "question_id": r[1], "description": r[2],
+         "severity": r[3], "status": r[4], "due_date": r[5]}
+        for r in cur.fetchall()
+    ]
+
+    return {
+        "audit_id": aid,
+        "audit_type": audit_type,
+        "status": status,
+        "started_at": started_at,
+        "ended_at": ended_at,
+        "score_global": float(score_global) if score_global is not None else None,
+        "questionnaire_version": version,
+        "auditee": " ".join(p for p in (first_name, email and f"<{email}>") if p),
+        "plant": " / ".join(p for p in (plant_name, dept_name) if p),
+        "answers": answers,
+        "non_conformities": ncs,
+    }
+
+
+# ----------------------
+# Rendering (worker process)
+# ----------------------
+def _latin1(value):
+    # fpdf 1.7 core fonts are latin-1 only
+    text = "" if value is None else str(value)
+    return text.encode("latin-1", "replace").decode("latin-1")
+
+
+def _fmt_dt(value):
+    return value.strftime("%Y-%m-%d %H:%M UTC") if value else "-"
+
+
+def render_pdf(data, out_path):
+    import storage
+
+    # fpdf 1.7 reads images from paths; with an object store they are fetched (in parallel) to a temp dir
+    keys = [ans["evidence_key"] for ans in data["answers"] if ans["evidence_key"]]
+    with storage.backend.local_files(keys) as evidence_paths:
+        return _render_pdf(data, out_path, evidence_paths)
+
+
+def _render_pdf(data, out_path, evidence_paths):
+    from fpdf import FPDF
+
+    pdf = FPDF(format="A4")
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    width = pdf.w - pdf.l_margin - pdf.r_margin
+
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, _latin1(f"Audit report #{data['audit_id']} - {data['audit_type']}"), ln=1)
+    pdf.set_font("Arial", "", 10)
+    for label, value in (
+        ("Auditee", data["auditee"]),
+        ("Plant / department", data["plant"] or "-"),
+        ("Questionnaire", data["questionnaire_version"] or "-"),
+        ("Status", data["status"]),
+        ("Started", _fmt_dt(data["started_at"])),
+        ("Ended", _fmt_dt(data["ended_at"])),
+        ("Score", "-" if data["score_global"] is None else f"{data['score_global']:.2f} %"),
+    ):
+        pdf.cell(40, 6, _latin1(label), ln=0)
+        pdf.cell(0, 6, _latin1(value), ln=1)
+
+    pdf.ln(4)
+    pdf.set_font("Arial", "B", 13)
+    pdf.cell(0, 8, _latin1(f"Answers ({len(data['answers'])})"), ln=1)
+    for ans in data["answers"]:
+        compliant = {True: "Compliant", False: "Not compliant", None: "n/a"}[ans["is_compliant"]]
+        pdf.set_font("Arial", "B", 10)
+        pdf.multi_cell(width, 5, _latin1(
+            f"Q{ans['question_id']} (attempt {ans['attempt_number']}) - {ans['question_text']}"))
+        pdf.set_font("Arial", "", 10)
+        pdf.multi_cell(width, 5, _latin1(f"{compliant}. {ans['response_text'] or ''}"))
+        evidence_path = evidence_paths.get(ans["evidence_key"])
+        if evidence_path:
+            if pdf.get_y() + THUMBNAIL_WIDTH > pdf.h - pdf.b_margin:
+                pdf.add_page()
+            try:
+                pdf.image(evidence_path, x=pdf.l_margin, y=pdf.get_y() + 1, w=THUMBNAIL_WIDTH)
+                pdf.set_y(pdf.get_y() + THUMBNAIL_WIDTH * 0.75 + 2)
+            except Exception:
+                pdf.cell(0, 5, "[evidence image unreadable]", ln=1)
+        pdf.ln(2)
+
+    pdf.ln(2)
+    pdf.set_font("Arial", "B", 13)
+    pdf.cell(0, 8, _latin1(f"Non-conformities ({len(data['non_conformities'])})"), ln=1)
+    pdf.set_font("Arial", "", 10)
+    for nc in data["non_conformities"]:
+        due = nc["due_date"].isoformat() if nc["due_date"] else "-"
+        pdf.multi_cell(width, 5, _latin1(
+            f"NC{nc['nc_id']} [{nc['severity']}, {nc['status']}, due {due}] "
+            f"Q{nc['question_id']}: {nc['description']}"))
+        pdf.ln(1)
+
+    pdf.set_font("Arial", "I", 8)
+    pdf.cell(0, 6, _latin1(f"Generated {_fmt_dt(datetime.now(timezone.utc))}"), ln=1)
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    pdf.output(tmp_path, "F")
+    os.replace(tmp_path, out_path)
+
+    # Older versions of this audit's report are stale now
+    prefix = f"audit-{data['audit_id']}-"
+    for old in Path(out_path).parent.glob(f"{prefix}*.pdf"):
+        if str(old) != str(out_path):
+            old.unlink(missing_ok=True)
+    return out_path
+
+
+# ----------------------
+# Job management
+# ----------------------
+def report_path(audit_id, version):
+    return REPORT_DIR / f"audit-{audit_id}-{version}.pdf"
+
+
+def job_id(audit_id, version):
+    return f"{audit_id}-{version}"
+
+
+def parse_job_id(value):
+    audit_id, _, version = value.partition("-")
+    if not audit_id.isdigit() or not version.isalnum():
+        raise ValueError("invalid report id")
+    return int(audit_id), version
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def submit(audit_id, version, data):
+    """Start rendering unless the same version is already rendering; returns the job id."""
+    jid = job_id(audit_id, version)
+    with _lock:
+        fut = _jobs.get(jid)
+        if fut is None or (fut.done() and fut.exception() is not None):
+            REPORT_DIR.mkdir(parents=True, exist_ok=True)
+            _jobs[jid] = _get_executor().submit(render_pdf, data, str(report_path(audit_id, version)))
+            while len(_jobs) > MAX_JOBS:
+                oldest = next(iter(_jobs))
+                if not _jobs[oldest].done():
+                    break
+                del _jobs[oldest]
+    return jid
+
+
+def status(jid):
+    """'ready' | 'pending' | 'failed' | None (unknown), plus an error message."""
+    audit_id, version = parse_job_id(jid)
+    if report_path(audit_id, version).exists():
+        return "ready", None
+    with _lock:
+        fut = _jobs.get(jid)
+    if fut is None:
+        return None, None
+    if not fut.done():
+        return "pending", None
+    err = fut.exception()
+    if err:
+        return "failed", str(err)
+    # Rendered, but the file is gone (wiped disk, deleted by hand): forget the
+    # job so the next request renders it again
+    with _lock:
+        if _jobs.get(jid) is fut:
+            del _jobs[jid]
+    return None, None
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        # Wait for running renders so no worker process outlives the server
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
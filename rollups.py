@@ -0,0 +1,142 @@
+"""
+Daily conversation rollups for capacity planning (see migrations/011).
+
+    conversation_daily_stats   (day, assistant_name) -> conversations, transcript_chars
+    conversation_daily_users   (day, assistant_name, user_name) -> conversations
+
+record() adds a batch of new conversations in the inserting transaction:
+POST /save-conversation for a direct insert, ingest.py for a buffered batch
+(rows a journal replay had already inserted are not counted twice). The
+rollups are therefore exact and current, and GET /conversations/stats reads
+them instead of scanning conversations. Rows are upserted in key order, so
+concurrent savers never deadlock; a save waits at most for the commit of
+another save of the same assistant and day (buffered mode: one upsert per
+batch).
+
+    python rollups.py backfill [--from 2024-01-01] [--to 2024-12-31]
+        recompute the given UTC days (default: every day with conversations)
+
+A backfilled day is locked against concurrent record() calls while it is
+recomputed, so saves arriving meanwhile wait and are then added on top.
+Compressed transcripts are decompressed to measure them.
+"""
+import argparse
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+import psycopg2.extras
+
+from compression import decode_conversation
+from db import get_connection
+
+# rows: (date_conversation, assistant_name, user_name, chars)
+STATS_SQL = """
+    INSERT INTO conversation_daily_stats AS s (day, assistant_name, conversations, transcript_chars)
+    SELECT (v.ts AT TIME ZONE 'UTC')::date, coalesce(v.assistant_name, ''), count(*), sum(v.chars)
+      FROM (VALUES %s) AS v(ts, assistant_name, user_name, chars)
+     GROUP BY 1, 2
+     ORDER BY 1, 2
+    ON CONFLICT (day, assistant_name) DO UPDATE
+       SET conversations = s.conversations + EXCLUDED.conversations,
+           transcript_chars = s.transcript_chars + EXCLUDED.transcript_chars
+"""
+USERS_SQL = """
+    INSERT INTO conversation_daily_users AS u (day, assistant_name, user_name, conversations)
+    SELECT (v.ts AT TIME ZONE 'UTC')::date, coalesce(v.assistant_name, ''), v.user_name, count(*)
+      FROM (VALUES %s) AS v(ts, assistant_name, user_name, chars)
+     GROUP BY 1, 2, 3
+     ORDER BY 1, 2, 3
+    ON CONFLICT (day, assistant_name, user_name) DO UPDATE
+       SET conversations = u.conversations + EXCLUDED.conversations
+"""
+TEMPLATE = "(%s::timestamptz, %s::text, %s::text, %s::bigint)"
+
+
+def record(cur, rows):
+    """Add (date_conversation, assistant_name, user_name, chars) rows to the rollups, in cur's transaction."""
+    if not rows:
+        return
+    psycopg2.extras.execute_values(cur, STATS_SQL, rows, template=TEMPLATE, page_size=len(rows))
+    psycopg2.extras.execute_values(cur, USERS_SQL, rows, template=TEMPLATE, page_size=len(rows))
+
+
+# ----------------------
+# Backfill
+# ----------------------
+def _day_bounds(day):
+    start = datetime.combine(day, dtime.min, timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def _days_with_conversations(cur, date_from, date_to):
+    cur.execute("""
+        SELECT (min(date_conversation) AT TIME ZONE 'UTC')::date,
+               (max(date_conversation) AT TIME ZONE 'UTC')::date
+        FROM conversations
+    """)
+    first, last = cur.fetchone()
+    if first is None:
+        return []
+    first, last = max(first, date_from or first), min(last, date_to or last)
+    return [first + timedelta(days=i) for i in range((last - first).days + 1)]
+
+
+def backfill_day(conn, day):
+    """Recompute one UTC day from conversations; returns its conversation count."""
+    start, end = _day_bounds(day)
+    cur = conn.cursor()
+    # Blocks record() until commit; its conversations are not visible to this
+    # transaction yet and are added once it is done
+    cur.execute("LOCK TABLE conversation_daily_stats, conversation_daily_users IN SHARE ROW EXCLUSIVE MODE")
+    cur.execute("DELETE FROM conversation_daily_stats WHERE day = %s", (day,))
+    cur.execute("DELETE FROM conversation_daily_users WHERE day = %s", (day,))
+
+    # Plain-text transcripts are measured in SQL, compressed ones here
+    cur.execute("""
+        SELECT date_conversation, assistant_name, user_name, length(conversation)
+        FROM conversations
+        WHERE date_conversation >= %s AND date_conversation < %s AND conversation IS NOT NULL
+    """, (start, end))
+    rows = cur.fetchall()
+    named = conn.cursor(name="rollup_backfill")
+    named.itersize = 500
+    named.execute("""
+        SELECT date_conversation, assistant_name, user_name, conversation_zstd
+        FROM conversations
+        WHERE date_conversation >= %s AND date_conversation < %s AND conversation IS NULL
+    """, (start, end))
+    for ts, assistant_name, user_name, blob in named:
+        rows.append((ts, assistant_name, user_name, len(decode_conversation(None, blob))))
+    named.close()
+
+    record(cur, rows)
+    conn.commit()
+    cur.close()
+    return len(rows)
+
+
+def backfill(date_from=None, date_to=None):
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        days = _days_with_conversations(cur, date_from, date_to)
+        conn.commit()
+        cur.close()
+        for day in days:
+            yield day, backfill_day(conn, day)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_backfill = sub.add_parser("backfill")
+    p_backfill.add_argument("--from", dest="date_from", type=date.fromisoformat)
+    p_backfill.add_argument("--to", dest="date_to", type=date.fromisoformat)
+    args = parser.parse_args()
+
+    for day, count in backfill(args.date_from, args.date_to):
+        print(f"{day}: {count} conversations")
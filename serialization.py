@@ -0,0 +1,33 @@
+"""
+Fast JSON path for large list responses.
+
+Handlers that return many DB rows build plain dicts (shapes in models.py's
+*Row TypedDicts) and wrap them in FastJSONResponse. Returning a Response makes
+FastAPI skip the response_model validation and jsonable_encoder walk, which
+for trusted rows is pure overhead; the response_model stays on the route for
+the OpenAPI schema. orjson encodes datetime/date/UUID natively; Decimal goes
+out as a float, like the handlers' float(score) conversions.
+"""
+from decimal import Decimal
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).decode("utf-8", "replace")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(content):
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,136 @@
+"""
+Server-side prepared statements for the hot write/lookup queries.
+
+Each statement is PREPAREd the first time it runs on a pooled connection
+(db.PooledConnection remembers which names it has) and EXECUTEd by name from
+then on, so neither psycopg2 nor the server re-parses and re-plans the SQL on
+every request. Prepared statements outlive the transaction that created them
+(even a rolled-back one) and die with the session, which is exactly the pooled
+connection's lifetime.
+
+Parameter types are given explicitly: psycopg2 interpolates EXECUTE arguments
+as literals, and lower($1) and friends would otherwise be ambiguous.
+
+Plan-cache statistics go to /metrics as db_prepared_statements_total
+{statement, event}: "prepare" is a miss (first use on a connection),
+"execute" a run of the cached plan, "plain" a run without preparing
+(disabled, or a connection from outside the pool).
+
+Env:
+    DB_PREPARED_STATEMENTS   0 to run the registered SQL as plain statements (default 1);
+                             needed behind a transaction-mode pgbouncer
+"""
+import os
+import re
+
+import metrics
+
+ENABLED = os.getenv("DB_PREPARED_STATEMENTS", "1") == "1"
+
+prepared_statements = metrics.Counter(
+    "db_prepared_statements_total",
+    "Registered statements by outcome: prepare (plan cache miss), execute (hit), plain (not prepared)",
+    ("statement", "event"))
+
+
+class Statement:
+    def __init__(self, name, sql, types):
+        self.name = name
+        self.sql = sql
+        placeholders = sql.count("%s")
+        if placeholders != len(types):
+            raise ValueError(f"{name}: {placeholders} placeholders but {len(types)} types")
+        n = iter(range(1, placeholders + 1))
+        body = re.sub(r"%s", lambda m: f"${next(n)}", sql)
+        self.prepare_sql = f"PREPARE {name} ({', '.join(types)}) AS {body}" if types else f"PREPARE {name} AS {body}"
+        args = ", ".join(["%s"] * placeholders)
+        self.execute_sql = f"EXECUTE {name} ({args})" if placeholders else f"EXECUTE {name}"
+
+
+REGISTRY = {}
+
+
+def register(name, sql, types=()):
+    REGISTRY[name] = Statement(name, sql, tuple(types))
+    return REGISTRY[name]
+
+
+def execute(cur, name, params=()):
+    """cur.execute() for a registered statement; fetch results from cur as usual."""
+    stmt = REGISTRY[name]
+    prepared = getattr(cur.connection, "prepared", None)
+    if not ENABLED or prepared is None:
+        prepared_statements.inc(1, name, "plain")
+        return cur.execute(stmt.sql, params)
+    if name not in prepared:
+        cur.execute(stmt.prepare_sql)
+        prepared.add(name)
+        prepared_statements.inc(1, name, "prepare")
+    prepared_statements.inc(1, name, "execute")
+    return cur.execute(stmt.execute_sql, params)
+
+
+def prepare_all(conn):
+    """PREPARE every registered statement on a pooled connection (startup warm-up)."""
+    prepared = getattr(conn, "prepared", None)
+    if not ENABLED or prepared is None:
+        return
+    cur = conn.cursor()
+    for name, stmt in REGISTRY.items():
+        if name not in prepared:
+            cur.execute(stmt.prepare_sql)
+            prepared.add(name)
+            prepared_statements.inc(1, name, "prepare")
+    cur.close()
+
+
+# ----------------------
+# Hot statements
+# ----------------------
+register("auditee_by_email", """
+    SELECT id, first_name, email, "function",
+           plant_name, dept_name, manager_email, code
+    FROM auditees
+    WHERE lower(email) = lower(%s)
+    LIMIT 1
+""", ("text",))
+
+register("access_code_by_name", """
+    SELECT code, is_active, expires_at
+    FROM access_codes
+    WHERE name = %s
+    LIMIT 1
+""", ("text",))
+
+# save_answer: update first (unique key: audit_id, question_id, attempt_number), insert if missing
+register("answer_update", """
+    UPDATE answers
+       SET response_text = %s,
+           is_compliant = %s,
+           evidence_filename = %s
+     WHERE audit_id = %s AND question_id = %s AND attempt_number = %s
+ RETURNING answer_id
+""", ("text", "boolean", "text", "int", "int", "int"))
+
+register("answer_insert", """
+    INSERT INTO answers (
+        audit_id, question_id, response_text,
+        is_compliant, attempt_number, evidence_filename, created_at
+    )
+    VALUES (%s, %s, %s, %s, %s, %s, now())
+    RETURNING answer_id
+""", ("int", "int", "text", "boolean", "int", "text"))
+
+# save_answer / save_nc / complete_audit: any worker streaming this audit's events? (events.watched)
+register("audit_watched", """
+    SELECT EXISTS (SELECT 1 FROM audit_watchers WHERE audit_id = %s AND expires_at > now())
+""", ("int",))
+
+register("conversation_insert", """
+    INSERT INTO conversations (
+        user_name, conversation, conversation_zstd, search_vector,
+        date_conversation, assistant_name
+    )
+    VALUES (%s, %s, %s, to_tsvector('simple', %s), %s, %s)
+    RETURNING id
+""", ("text", "text", "bytea", "text", "timestamptz", "text"))
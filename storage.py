@@ -0,0 +1,267 @@
+"""
+Where uploaded files live: evidence images and action-plan attachments.
+
+    STORAGE_BACKEND=local   files under STORAGE_DIR (default ./uploads, as before)
+    STORAGE_BACKEND=s3      an S3-compatible bucket (AWS S3, MinIO, ...), shared by
+                            every app instance
+
+Keys are the names the tables already store (answers.evidence_filename;
+action-plan files under "action_plans/"), so moving to S3 is a copy of the
+uploads directory into the bucket under the same keys.
+
+The S3 backend sends objects larger than S3_PART_SIZE as multipart uploads
+with the parts uploaded in parallel, streams downloads in chunks, and by
+default answers downloads with a redirect to a short-lived presigned URL, so
+large images never pass through the app workers. boto3 is only imported for
+this backend.
+
+Local stand-in for development:
+    docker run -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 \\
+        minio/minio server /data
+    STORAGE_BACKEND=s3 S3_ENDPOINT_URL=http://127.0.0.1:9000 S3_BUCKET=evidence \\
+        AWS_ACCESS_KEY_ID=minio AWS_SECRET_ACCESS_KEY=minio123
+
+Env:
+    STORAGE_BACKEND      local | s3 (default local)
+    STORAGE_DIR          root of the local backend (default ./uploads)
+    S3_BUCKET            bucket (must exist)
+    S3_ENDPOINT_URL      endpoint for non-AWS stores such as MinIO (default AWS)
+    S3_REGION            (default us-east-1)
+    S3_PREFIX            key prefix inside the bucket (default none)
+    S3_PART_SIZE         multipart threshold and part size in bytes (default 8 MiB, min 5 MiB)
+    S3_MAX_CONCURRENCY   parallel part uploads / downloads (default 8)
+    S3_PRESIGN           0 to stream downloads through the app instead of redirecting (default 1)
+    S3_PRESIGN_TTL       presigned URL lifetime in seconds (default 300)
+    Credentials come from boto3's usual chain (AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY, ...).
+"""
+import itertools
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_DIR = Path(os.getenv("STORAGE_DIR", "uploads"))
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_PART_SIZE = max(5 * 1024 * 1024, int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024))))
+S3_MAX_CONCURRENCY = int(os.getenv("S3_MAX_CONCURRENCY", "8"))
+S3_PRESIGN = os.getenv("S3_PRESIGN", "1") == "1"
+S3_PRESIGN_TTL = int(os.getenv("S3_PRESIGN_TTL", "300"))
+
+CHUNK_SIZE = 256 * 1024
+
+
+def _iter_data(data):
+    """put() takes bytes or an iterable of byte chunks."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        yield bytes(data)
+    else:
+        yield from data
+
+
+def _split_parts(data, part_size):
+    buf = bytearray()
+    for chunk in _iter_data(data):
+        buf += chunk
+        while len(buf) >= part_size:
+            yield bytes(buf[:part_size])
+            del buf[:part_size]
+    if buf:
+        yield bytes(buf)
+
+
+def _read_file(f, chunk_size=CHUNK_SIZE):
+    with f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+# ----------------------
+# Local filesystem
+# ----------------------
+class LocalStorage:
+    def __init__(self, root=STORAGE_DIR):
+        self.root = Path(root)   # created by the first put()
+
+    def _path(self, key):
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def put(self, key, data, content_type=None):
+        """Store data under key; returns the size. Nothing is left behind if data raises."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".part")
+        size = 0
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in _iter_data(data):
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return size
+
+    def open(self, key):
+        """Iterator over the content; raises FileNotFoundError right away if key is missing."""
+        return _read_file(open(self._path(key), "rb"))
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+    def presigned_url(self, key, filename, content_type):
+        return None
+
+    def local_path(self, key):
+        path = self._path(key)
+        return path if path.exists() else None
+
+    @contextmanager
+    def local_files(self, keys):
+        """{key: filesystem path} for the keys that exist (for fpdf, which wants paths)."""
+        paths = {key: self.local_path(key) for key in keys}
+        yield {key: str(path) for key, path in paths.items() if path}
+
+
+# ----------------------
+# S3-compatible object store
+# ----------------------
+class S3Storage:
+    def __init__(self, bucket=S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, region=S3_REGION, prefix=S3_PREFIX,
+                 part_size=S3_PART_SIZE, max_concurrency=S3_MAX_CONCURRENCY, presign=S3_PRESIGN):
+        import boto3
+        from botocore.config import Config
+
+        if not bucket:
+            raise ValueError("S3_BUCKET is required for STORAGE_BACKEND=s3")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.presign = presign
+        self.client = boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name=region,
+            config=Config(signature_version="s3v4", max_pool_connections=max(10, max_concurrency * 2)),
+        )
+        self._executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix="s3")
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def put(self, key, data, content_type=None):
+        """Store data under key; returns the size. Large objects go up as parallel multipart parts."""
+        extra = {"ContentType": content_type} if content_type else {}
+        parts = _split_parts(data, self.part_size)
+        first = next(parts, b"")
+        second = next(parts, None)
+        if second is None:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=first, **extra)
+            return len(first)
+
+        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(key), **extra)["UploadId"]
+        futures = []
+        size = 0
+        try:
+            for number, part in enumerate(itertools.chain([first, second], parts), 1):
+                # At most max_concurrency parts in memory / in flight
+                if len(futures) >= self.max_concurrency:
+                    futures[-self.max_concurrency].result()
+                size += len(part)
+                futures.append(self._executor.submit(self._upload_part, key, upload_id, number, part))
+            done = [{"PartNumber": n, "ETag": f.result()} for n, f in enumerate(futures, 1)]
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self._key(key), UploadId=upload_id, MultipartUpload={"Parts": done})
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+            raise
+        return size
+
+    def _upload_part(self, key, upload_id, number, body):
+        return self.client.upload_part(
+            Bucket=self.bucket, Key=self._key(key), UploadId=upload_id, PartNumber=number, Body=body)["ETag"]
+
+    def open(self, key):
+        """Iterator over the content; raises FileNotFoundError right away if key is missing."""
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except self.client.exceptions.NoSuchKey:
+            raise FileNotFoundError(key)
+        return self._iter_body(body)
+
+    @staticmethod
+    def _iter_body(body):
+        try:
+            yield from body.iter_chunks(CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def presigned_url(self, key, filename, content_type):
+        """Short-lived GET URL for the client to fetch key directly, None if presigning is off."""
+        if not self.presign:
+            return None
+        return self.client.generate_presigned_url("get_object", ExpiresIn=S3_PRESIGN_TTL, Params={
+            "Bucket": self.bucket,
+            "Key": self._key(key),
+            "ResponseContentType": content_type,
+            "ResponseContentDisposition": f'attachment; filename="{filename}"',
+        })
+
+    def local_path(self, key):
+        return None
+
+    @contextmanager
+    def local_files(self, keys):
+        """Download keys in parallel into a temporary directory; {key: path} for the ones found."""
+        from botocore.exceptions import ClientError
+
+        with tempfile.TemporaryDirectory(prefix="storage-") as tmp:
+            def fetch(item):
+                i, key = item
+                path = os.path.join(tmp, f"{i}-{os.path.basename(key)}")
+                try:
+                    self.client.download_file(self.bucket, self._key(key), path)
+                except ClientError:
+                    return key, None
+                return key, path
+
+            found = self._executor.map(fetch, enumerate(set(keys)))
+            yield {key: path for key, path in found if path}
+
+
+def _from_env():
+    if BACKEND == "local":
+        return LocalStorage()
+    if BACKEND == "s3":
+        return S3Storage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {BACKEND}")
+
+
+backend = _from_env()
+
+
+def discard(key):
+    """
+    Delete an upload whose database write failed. Best effort: a storage error
+    here must not replace the database error the caller reports (the object is
+    then orphaned, like an upload interrupted by a crash).
+    """
+    try:
+        backend.delete(key)
+    except Exception:
+        pass
@@ -0,0 +1,58 @@
+"""
+Job handlers (see jobs.py). Imported by the API and by `python -m jobs`
+worker processes, so handlers only use the database and publish audit events
+with events.notify(), which reaches the subscribers of every API worker.
+"""
+import events
+import jobs
+
+
+def audit_score(cur, audit_id):
+    """% of answered questions with a compliant attempt, and the number of answered questions."""
+    # any attempt true per question
+    cur.execute("""
+        WITH per_q AS (
+          SELECT question_id, bool_or(is_compliant) AS compliant
+            FROM answers
+           WHERE audit_id = %s
+        GROUP BY question_id
+        )
+        SELECT
+          COALESCE(SUM(CASE WHEN compliant THEN 1 ELSE 0 END),0)::float,
+          COALESCE(COUNT(*),0)::float
+        FROM per_q
+    """, (audit_id,))
+    srow = cur.fetchone()
+    numer, denom = (srow or (0.0, 0.0))
+    return (round((numer / denom) * 100.0, 2) if denom > 0 else 0.0), int(denom)
+
+
+# ----------------------
+# audit.score: {"audit_id", "complete": bool}
+# ----------------------
+@jobs.handler("audit.score")
+def score_audit(cur, payload):
+    """
+    Live score for event subscribers (save_answer) or, with "complete", the
+    final score of an audit completed without one (complete_audit).
+    """
+    audit_id = payload["audit_id"]
+    score, answered = audit_score(cur, audit_id)
+    events.notify(cur, audit_id, "score", {"audit_id": audit_id, "score": score, "answered_questions": answered})
+    if not payload.get("complete"):
+        return
+    cur.execute("""
+        UPDATE audits
+           SET score_global = %s
+         WHERE id = %s AND status = 'completed' AND score_global IS NULL
+     RETURNING id, status, ended_at, score_global
+    """, (score, audit_id))
+    row = cur.fetchone()
+    if row:
+        (aid, status, ended_at, score_global) = row
+        events.notify(cur, audit_id, "completed", {
+            "id": aid,
+            "status": status,
+            "ended_at": ended_at,
+            "score_global": float(score_global),
+        })